@@ -5,4 +5,6 @@ admin.site.register(models.CategorieObjet)
 admin.site.register(models.DemandeDon)
 admin.site.register(models.PropositionDon)
 admin.site.register(models.Don)
-
+admin.site.register(models.Compteur)
+admin.site.register(models.Sequence)
+admin.site.register(models.Blob)
@@ -0,0 +1,132 @@
+"""
+donations/allocation.py - Batch attribution of the stock to validated demandes
+
+``plan()`` loads every validated demande that has no don yet, in priority
+order: urgence first, then oldest first. It also loads the ``en_stock``
+dons that are not attributed, into a ``matching.StockIndex``. Each demande
+then takes the best don still free in its categorie subtree, among those
+with at least ``quantite_desiree`` items. The best don is the one with the
+highest matching score; on a tie, the smallest surplus wins, which keeps
+big lots for big demandes. ``apply()`` writes the plan in one transaction
+with two ``bulk_update`` calls. It locks the rows first and skips the
+pairs that changed since the plan was made.
+
+The ``allouer_stock`` view posts back the pairs the member reviewed, as
+``<demande id>-<don id>`` values. ``from_pairs()`` rebuilds the plan from
+them, so what is applied is what was shown, never a fresh ``plan()``.
+"""
+
+import time
+
+from django.db import transaction
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
+from django.utils import timezone
+
+from . import matching
+from .models import DemandeDon, Don
+
+URGENCE_ORDER = ('urgente', 'haute', 'moyenne', 'faible')
+
+
+class Allocation:
+    """Proposed (or applied) attribution, with the time spent in each phase in ms."""
+
+    def __init__(self):
+        self.pairs = []          # (demande, don_id, score)
+        self.unallocated = []    # (demande, reason)
+        self.timings = {}
+        self.applied = 0
+
+    def __len__(self):
+        return len(self.pairs)
+
+
+def pending_demandes():
+    """Validated demandes without a don, most urgent and oldest first."""
+    urgence_rank = Case(*[When(urgence=u, then=Value(i)) for i, u in enumerate(URGENCE_ORDER)],
+                        default=Value(len(URGENCE_ORDER)), output_field=IntegerField())
+    return (DemandeDon.objects.filter(statut='validee', don_attribue__isnull=True)
+            .select_related('categorie_recherchee', 'participant_requerant')
+            .annotate(urgence_rang=urgence_rank)
+            .order_by('urgence_rang', 'date_demande', 'id'))
+
+
+def plan():
+    allocation = Allocation()
+    start = time.perf_counter()
+    demandes = list(pending_demandes())
+    index = matching.StockIndex(statuts=('en_stock',))
+    loaded = time.perf_counter()
+
+    taken = set()
+    for demande in demandes:
+        if demande.categorie_recherchee_id is None:
+            allocation.unallocated.append((demande, "Aucune catégorie recherchée"))
+            continue
+        scorer = matching.Scorer(demande)
+        wanted = max(1, demande.quantite_desiree)
+        best, best_key = None, None
+        for candidate, depth in index.candidates(demande, scorer.tokens):
+            if candidate.id in taken or candidate.quantite < wanted:
+                continue
+            key = (scorer.score(candidate, depth), wanted - candidate.quantite, -candidate.id)
+            if best_key is None or key > best_key:
+                best, best_key = candidate, key
+        if best is None:
+            allocation.unallocated.append((demande, "Aucun don disponible"))
+            continue
+        taken.add(best.id)
+        allocation.pairs.append((demande, best.id, round(best_key[0])))
+    solved = time.perf_counter()
+
+    allocation.timings = {
+        'chargement': round((loaded - start) * 1000, 2),
+        'calcul': round((solved - loaded) * 1000, 2),
+    }
+    return allocation
+
+
+def from_pairs(values):
+    """The allocation made of the ``<demande id>-<don id>`` ``values``; malformed ones are ignored."""
+    wanted = {}
+    for value in values:
+        demande_id, _, don_id = value.partition('-')
+        if demande_id.isdigit() and don_id.isdigit():
+            wanted.setdefault(int(demande_id), int(don_id))
+    allocation = Allocation()
+    demandes = DemandeDon.objects.in_bulk(list(wanted))
+    allocation.pairs = [(demandes[demande_id], don_id, None)
+                        for demande_id, don_id in wanted.items() if demande_id in demandes]
+    return allocation
+
+
+def apply(allocation):
+    """Write ``allocation``; returns the number of demandes attributed."""
+    start = time.perf_counter()
+    pairs = {demande.id: (demande, don_id) for demande, don_id, _ in allocation.pairs}
+    with transaction.atomic():
+        # Recheck under lock: a member may have attributed or moved rows since plan()
+        free_demandes = set(DemandeDon.objects.select_for_update()
+                            .filter(id__in=pairs, statut='validee', don_attribue__isnull=True)
+                            .values_list('id', flat=True))
+        free_dons = set(Don.objects.select_for_update()
+                        .filter(id__in=[don_id for _, don_id in pairs.values()], statut='en_stock')
+                        .exclude(Exists(DemandeDon.objects.filter(don_attribue=OuterRef('pk'))))
+                        .values_list('id', flat=True))
+        now = timezone.now()
+        demandes, dons = [], []
+        for demande_id, (demande, don_id) in pairs.items():
+            if demande_id not in free_demandes or don_id not in free_dons:
+                continue
+            free_dons.discard(don_id)  # one demande per don, even from posted pairs
+            demande.don_attribue_id = don_id
+            demande.date_attribution = now
+            demandes.append(demande)
+            dons.append(Don(id=don_id, statut='reserve'))
+        DemandeDon.objects.bulk_update(demandes, ['don_attribue', 'date_attribution'])
+        Don.objects.bulk_update(dons, ['statut'])
+        # bulk_update sends no signal
+        transaction.on_commit(matching.invalidate)
+    allocation.applied = len(demandes)
+    allocation.timings['ecriture'] = round((time.perf_counter() - start) * 1000, 2)
+    return allocation.applied
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DonationsConfig(AppConfig):
     name = 'donations'
+
+    def ready(self):
+        from . import signals
+        signals.connect()
@@ -0,0 +1,252 @@
+"""
+donations/benchmarks.py - Query-count, latency and memory benchmarks for the main views
+
+``seed()`` fills the database with a synthetic dataset whose size is
+``DATASET`` multiplied by ``scale``. ``run()`` then drives each view of
+``VIEWS`` through the test client as the user that would normally open it,
+and records the number of queries, the median wall time and the peak
+Python memory of a request. ``FUNCTIONS`` are measured the same way
+without a request, e.g. ``routes.plan_stops`` on 1000 stops. ``compare()`` checks a run against the
+committed baseline: query counts must not grow at all, time and memory
+within a tolerance. The ``benchmark_views`` management command ties it
+together on a throwaway test database.
+"""
+
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import date
+from itertools import cycle
+
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from messaging.models import Message
+from users.models import Membre, Participant, Transporteur
+from . import counters, routes, search
+from .models import CategorieObjet, DemandeDon, Don, PropositionDon
+
+# Row counts at scale 1.0
+DATASET = {
+    'categories': 50,
+    'participants': 1000,
+    'membres': 20,
+    'transporteurs': 200,
+    'propositions': 10000,
+    'demandes': 10000,
+    'dons': 5000,
+    'messages': 100000,
+}
+
+BATCH_SIZE = 1000
+
+# Timing differences below this are noise, whatever the relative tolerance
+TIME_SLACK_MS = 5
+
+
+class Dataset:
+    """Seeded rows the benchmarked views are opened with."""
+
+    def __init__(self, participant, other_participant, membre, transporteur, demande):
+        self.participant = participant
+        self.other_participant = other_participant
+        self.membre = membre
+        self.transporteur = transporteur
+        self.demande = demande
+
+
+def sizes(scale):
+    return {name: max(2, int(count * scale)) for name, count in DATASET.items()}
+
+
+def seed(scale=0.1):
+    """Create the synthetic dataset and return the users and rows the views are opened with."""
+    n = sizes(scale)
+    categories = CategorieObjet.objects.bulk_create(
+        [CategorieObjet(nom=f"Catégorie {i}") for i in range(n['categories'])])
+    # Multi-table inherited models cannot be bulk created
+    participants = [Participant.objects.create(username=f"participant{i}") for i in range(n['participants'])]
+    membres = [Membre.objects.create(username=f"membre{i}", user_type="membre") for i in range(n['membres'])]
+    transporteurs = [Transporteur.objects.create(username=f"transporteur{i}", user_type="transporteur",
+                                                 vehicule="Camion") for i in range(n['transporteurs'])]
+
+    statuts = cycle(['en_attente', 'validee', 'ramassee', 'terminee'])
+    donateurs, categories_cycle = cycle(participants), cycle(categories)
+    assignees, validateurs = cycle(transporteurs), cycle(membres)
+    propositions = PropositionDon.objects.bulk_create([
+        PropositionDon(
+            participant_donateur=next(donateurs), categorie=next(categories_cycle),
+            type_materiel="Chaise", description="Chaise en bois", adresse_ramassage="1 rue de la Paix",
+            ville="Paris", code_postal="75001", disponibilite_ramassage="Samedi",
+            statut=next(statuts), transporteur_statut='acceptee',
+            transporteur_assignee=next(assignees), membre_validateur=next(validateurs),
+        ) for _ in range(n['propositions'])
+    ], batch_size=BATCH_SIZE)
+
+    dons = Don.objects.bulk_create([
+        Don(proposition=proposition, categorie=proposition.categorie, reference=f"DON-BENCH-{i:06d}",
+            type_materiel=proposition.type_materiel, description=proposition.description)
+        for i, proposition in enumerate(propositions[:n['dons']])
+    ], batch_size=BATCH_SIZE)
+
+    statuts = cycle(['en_attente', 'validee', 'en_cours', 'terminee'])
+    requerants, dons_cycle = cycle(participants), cycle(dons)
+    demandes = DemandeDon.objects.bulk_create([
+        DemandeDon(
+            participant_requerant=next(requerants), categorie_recherchee=next(categories_cycle),
+            type_materiel="Chaise", description_besoin="Besoin d'une chaise",
+            adresse_livraison="2 rue de la Paix", ville="Paris", code_postal="75002",
+            statut=next(statuts), transporteur_livraison=next(assignees), membre_validateur=next(validateurs),
+            don_attribue=next(dons_cycle) if i % 4 == 0 else None,
+        ) for i in range(n['demandes'])
+    ], batch_size=BATCH_SIZE)
+
+    # A tenth of the messages go to the benchmarked conversation, the rest are spread out
+    participant, other = participants[0], participants[1]
+    senders, receivers = cycle(participants), cycle(reversed(participants))
+    Message.objects.bulk_create([
+        Message(sender=participant, receiver=other, text=f"Message {i}") if i % 10 == 0 else
+        Message(sender=next(senders), receiver=next(receivers), text=f"Message {i}")
+        for i in range(n['messages'])
+    ], batch_size=BATCH_SIZE)
+
+    counters.reconcile()
+    search.rebuild()
+    return Dataset(participant, other, membres[0], transporteurs[0], demandes[0])
+
+
+# ============ VIEWS ============
+VIEWS = {
+    'membre_dashboard': lambda d: (d.membre, reverse('membre_dashboard')),
+    'transporteur_dashboard': lambda d: (d.transporteur, reverse('transporteur_dashboard')),
+    'participant_dashboard': lambda d: (d.participant, reverse('participant_dashboard')),
+    'stock_list': lambda d: (d.membre, reverse('stock_list')),
+    'mes_propositions': lambda d: (d.participant, reverse('mes_propositions')),
+    'getDemandeRelatedItems': lambda d: (d.membre, reverse('related_items', args=[d.demande.id])),
+    'recherche': lambda d: (d.membre, reverse('recherche') + '?q=chaise+bois'),
+    'chat_room': lambda d: (d.participant, reverse('chat_room', args=[d.participant.id,
+                                                                      d.other_participant.id])),
+}
+
+
+def measure(client, url, repeat=3):
+    """Query count, median wall time (ms) and peak traced memory (KiB) of GET ``url``."""
+    client.get(url)  # warm up template and URL caches
+    timings = []
+    for _ in range(repeat):
+        # The request_started signal empties the query log, which would
+        # otherwise hide the queries from CaptureQueriesContext.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        # Read now: the captured queries are a view on the shared query log
+        query_count = len(queries)
+        if response.status_code != 200:
+            raise AssertionError(f"GET {url} returned {response.status_code}")
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': query_count,
+        'time_ms': round(statistics.median(timings), 2),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+# ============ FUNCTIONS ============
+ROUTE_STOPS = 1000
+
+
+def plan_stops(dataset):
+    """Plan ``ROUTE_STOPS`` deliveries spread over 40 villes and 9 départements, with the estimated distances."""
+    stops = [routes.Stop('livraison', i, '', f"Ville {i % 40}", f"{10 + i % 9}{i % 40:03d}")
+             for i in range(ROUTE_STOPS)]
+    start, table = routes.Stop('depart', 0, '', 'Paris', '75011'), routes.DistanceTable()
+    return lambda: routes.plan_stops(date(2026, 10, 17), stops, start, table)
+
+
+FUNCTIONS = {
+    'plan_stops_1000': plan_stops,
+}
+
+BENCHMARKS = [*VIEWS, *FUNCTIONS]
+
+
+def measure_call(function, repeat=3):
+    """Query count, median wall time (ms) and peak traced memory (KiB) of ``function()``."""
+    function()  # warm up
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        query_count = len(queries)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': query_count,
+        'time_ms': round(statistics.median(timings), 2),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(dataset, names=None, repeat=3):
+    results = {}
+    for name in names or BENCHMARKS:
+        if name in FUNCTIONS:
+            results[name] = measure_call(FUNCTIONS[name](dataset), repeat=repeat)
+            continue
+        user, url = VIEWS[name](dataset)
+        client = Client()
+        client.force_login(user)
+        results[name] = measure(client, url, repeat=repeat)
+    return results
+
+
+# ============ BASELINE ============
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, scale, results):
+    """Write ``results`` to the baseline, keeping the other views measured at the same scale."""
+    try:
+        baseline = load_baseline(path)
+    except FileNotFoundError:
+        baseline = {'scale': scale, 'views': {}}
+    views = baseline['views'] if baseline['scale'] == scale else {}
+    views.update(results)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'scale': scale, 'views': views}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, time_tolerance=0.5, memory_tolerance=0.25):
+    """Return a list of human readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for name, current in results.items():
+        expected = baseline['views'].get(name)
+        if expected is None:
+            continue
+        if current['queries'] > expected['queries']:
+            regressions.append(f"{name}: {current['queries']} queries (baseline {expected['queries']})")
+        if current['time_ms'] > max(expected['time_ms'] * (1 + time_tolerance),
+                                    expected['time_ms'] + TIME_SLACK_MS):
+            regressions.append(f"{name}: {current['time_ms']} ms (baseline {expected['time_ms']} ms)")
+        if current['peak_kb'] > expected['peak_kb'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: {current['peak_kb']} KiB peak (baseline {expected['peak_kb']} KiB)")
+    return regressions
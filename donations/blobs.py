@@ -0,0 +1,154 @@
+"""
+donations/blobs.py - Reference counts and garbage collection of the stored photo files
+
+``Blob.references`` counts the PropositionDon and Don rows whose photo is
+the file. Like the platform counters, it is adjusted with
+``F('references') + delta`` from model signals: a new or replaced photo
+adds one, the photo a row had before and a deleted row remove one.
+``bulk_create`` and ``QuerySet.update()`` send no signal; ``intake`` and
+the image pipeline call ``adjust()`` themselves, and ``reconcile()``
+recomputes every count from the photo columns.
+
+``collect()`` deletes the files no row points to, with their renditions.
+It only trusts a count of zero after checking the photo columns, and
+skips files younger than ``min_age``: an upload is stored before the row
+that will point to it is saved. It also sweeps files under ``blobs/``
+whose hash has no ``Blob`` row, left by a rolled back upload.
+"""
+
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Blob, Don, PropositionDon
+from .storage import PREFIX, photo_storage
+
+MODELS = (PropositionDon, Don)
+MIN_AGE = timedelta(hours=24)
+HASH_LENGTH = 64
+
+
+# ============ REFERENCES ============
+def adjust(names, delta=1):
+    """Add ``delta`` to the count of each file of ``names``, once per occurrence."""
+    for name, n in Counter(name for name in names if name).items():
+        Blob.objects.filter(nom=name).update(references=F('references') + n * delta)
+
+
+def reconcile():
+    """Recompute every count from the photo columns; returns {nom: (old, new)} for the counts that drifted."""
+    counts = Counter()
+    for model in MODELS:
+        rows = (model._default_manager.exclude(photos='').exclude(photos__isnull=True)
+                .values('photos').annotate(n=Count('pk')).values_list('photos', 'n'))
+        counts.update(dict(rows))
+    changes = {}
+    for pk, nom, references in Blob.objects.values_list('pk', 'nom', 'references'):
+        if references != counts[nom]:
+            Blob.objects.filter(pk=pk).update(references=counts[nom])
+            changes[nom] = (references, counts[nom])
+    return changes
+
+
+def photo_name(value):
+    return getattr(value, 'name', value) or ''
+
+
+def remember_photo(sender, instance, **kwargs):
+    state = instance.__dict__
+    instance._photo_loaded = photo_name(state['photos']) if 'photos' in state else None
+
+
+def update_references_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or 'photos' not in instance.__dict__ or (update_fields is not None and 'photos' not in update_fields):
+        return
+    before = '' if created else getattr(instance, '_photo_loaded', None)
+    now = photo_name(instance.__dict__['photos'])
+    if before is not None and before != now:
+        # before is None: the photo was deferred when loaded, leave it to reconcile()
+        adjust([now])
+        adjust([before], -1)
+    instance._photo_loaded = now
+
+
+def update_references_on_delete(sender, instance, **kwargs):
+    adjust([photo_name(instance.__dict__.get('photos'))], -1)
+
+
+def saved_bytes():
+    """Disk space deduplication saved: every upload after the first of a file."""
+    return Blob.objects.filter(envois__gt=1).aggregate(
+        saved=Sum((F('envois') - 1) * F('taille')))['saved'] or 0
+
+
+# ============ GARBAGE COLLECTION ============
+class Collection:
+    def __init__(self):
+        self.blobs = 0
+        self.files = 0
+        self.bytes = 0
+
+
+def blob_files(storage, nom):
+    """The file ``nom`` and its renditions (``<sha256>.w320.webp``...)."""
+    directory, filename = os.path.split(nom)
+    empreinte = filename[:HASH_LENGTH]
+    if not storage.exists(directory):
+        return []
+    return [f"{directory}/{f}" for f in storage.listdir(directory)[1] if f.startswith(empreinte)]
+
+
+def walk(storage, directory=PREFIX):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f"{directory}/{name}"
+    for name in directories:
+        yield from walk(storage, f"{directory}/{name}")
+
+
+def delete_files(storage, names, run):
+    for name in names:
+        run.files += 1
+        run.bytes += storage.size(name)
+        storage.delete(name)
+
+
+def collect(min_age=MIN_AGE, dry_run=False):
+    """Delete the unreferenced files older than ``min_age``; returns a Collection."""
+    storage, run = photo_storage(), Collection()
+    cutoff = timezone.now() - min_age
+    with transaction.atomic():
+        candidates = {blob.nom: blob for blob in Blob.objects.select_for_update()
+                      .filter(references__lte=0, date_creation__lt=cutoff)}
+        for model in MODELS:
+            # A count drifted by update() or raw SQL must not cost a file
+            for nom in model._default_manager.filter(photos__in=list(candidates)).values_list('photos', flat=True):
+                candidates.pop(nom, None)
+        for nom, blob in candidates.items():
+            run.blobs += 1
+            files = blob_files(storage, nom)
+            if dry_run:
+                run.files += len(files)
+                run.bytes += sum(storage.size(name) for name in files)
+            else:
+                delete_files(storage, files, run)
+        if not dry_run:
+            Blob.objects.filter(pk__in=[blob.pk for blob in candidates.values()]).delete()
+
+        # Files without a row: rolled back uploads, renditions of collected files
+        known = set(Blob.objects.values_list('empreinte', flat=True))
+        orphans = [name for name in walk(storage)
+                   if os.path.basename(name)[:HASH_LENGTH] not in known
+                   and storage.get_modified_time(name) < cutoff]
+        if dry_run:
+            run.files += len(orphans)
+            run.bytes += sum(storage.size(name) for name in orphans)
+        else:
+            delete_files(storage, orphans, run)
+    return run
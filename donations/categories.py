@@ -0,0 +1,144 @@
+"""
+donations/categories.py - Closure table and cached tree of CategorieObjet
+
+``CategorieClosure`` holds one row for every (ancestor, descendant) pair of
+the tree, so "this categorie and everything below it" is a single indexed
+join instead of a recursive walk. The signal receivers keep it in sync:
+- on creation, the new categorie copies its parent's ancestor rows
+- on a change of ``parent``, the subtree's links to its old ancestors are
+  replaced by links to the new ones
+- on deletion, the children become roots, which is what the ``SET_NULL``
+  on ``parent`` does to them
+
+``tree()`` is a per-process snapshot of the whole tree in display order
+for category pickers. It is rebuilt when the categories version in the
+cache changes.
+"""
+
+import threading
+
+from django.core.cache import cache
+
+from .models import CategorieClosure, CategorieObjet
+
+VERSION_KEY = 'donations:categories-version'
+
+
+# ============ CLOSURE MAINTENANCE ============
+def current_parent_id(categorie):
+    return (CategorieClosure.objects.filter(descendant=categorie, depth=1)
+            .values_list('ancestor_id', flat=True).first())
+
+
+def attach(categorie, parent_id):
+    """Link the subtree of ``categorie`` under ``parent_id`` (None: make it a root)."""
+    subtree = list(CategorieClosure.objects.filter(ancestor=categorie).values_list('descendant_id', 'depth'))
+    ids = [descendant_id for descendant_id, _ in subtree]
+    CategorieClosure.objects.filter(descendant_id__in=ids).exclude(ancestor_id__in=ids).delete()
+    if parent_id is None:
+        return
+    ancestors = CategorieClosure.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth')
+    CategorieClosure.objects.bulk_create([
+        CategorieClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+        for ancestor_id, up in ancestors
+        for descendant_id, down in subtree
+    ])
+
+
+def check_parent(sender, instance, raw=False, **kwargs):
+    """pre_save: refuse to move a categorie under its own subtree."""
+    if raw or not instance.pk or not instance.parent_id:
+        return
+    if CategorieClosure.objects.filter(ancestor_id=instance.pk, descendant_id=instance.parent_id).exists():
+        raise ValueError(f"{instance} cannot be moved under its own subtree")
+
+
+def sync_closure(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        CategorieClosure.objects.create(ancestor=instance, descendant=instance, depth=0)
+        parent_id = None
+    else:
+        parent_id = current_parent_id(instance)
+    if instance.parent_id != parent_id:
+        attach(instance, instance.parent_id)
+    invalidate()
+
+
+def detach_children(sender, instance, **kwargs):
+    """pre_delete: cut the subtree below ``instance`` from ``instance`` and its ancestors."""
+    below = CategorieClosure.objects.filter(ancestor=instance, depth__gt=0).values('descendant_id')
+    above = CategorieClosure.objects.filter(descendant=instance).values('ancestor_id')
+    CategorieClosure.objects.filter(descendant_id__in=below, ancestor_id__in=above).delete()
+    invalidate()
+
+
+def rebuild():
+    """Recompute the closure table from the ``parent`` links; returns the number of rows."""
+    parents = dict(CategorieObjet.objects.values_list('id', 'parent_id'))
+    rows = []
+    for categorie_id in parents:
+        node, depth, seen = categorie_id, 0, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            rows.append(CategorieClosure(ancestor_id=node, descendant_id=categorie_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    CategorieClosure.objects.all().delete()
+    CategorieClosure.objects.bulk_create(rows, batch_size=1000)
+    invalidate()
+    return len(rows)
+
+
+# ============ CACHED TREE ============
+class TreeNode:
+    __slots__ = ('id', 'nom', 'depth')
+
+    def __init__(self, id, nom, depth):
+        self.id = id
+        self.nom = nom
+        self.depth = depth
+
+    @property
+    def label(self):
+        return f"{'— ' * self.depth}{self.nom}"
+
+
+_tree = None
+_lock = threading.Lock()
+
+
+def version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate(**kwargs):
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def build_tree():
+    """Every categorie as a TreeNode, parents before children, siblings by name."""
+    children = {}
+    for categorie_id, nom, parent_id in CategorieObjet.objects.order_by('nom').values_list('id', 'nom', 'parent_id'):
+        children.setdefault(parent_id, []).append((categorie_id, nom))
+    nodes, stack = [], [(categorie_id, nom, 0) for categorie_id, nom in reversed(children.get(None, []))]
+    while stack:
+        categorie_id, nom, depth = stack.pop()
+        nodes.append(TreeNode(categorie_id, nom, depth))
+        stack.extend((child_id, child_nom, depth + 1) for child_id, child_nom in reversed(children.get(categorie_id, [])))
+    return nodes
+
+
+def tree():
+    global _tree
+    current = version()
+    cached = _tree
+    if cached is None or cached[0] != current:
+        with _lock:
+            if _tree is cached:
+                _tree = (current, build_tree())
+            cached = _tree
+    return cached[1]
@@ -1,11 +1,14 @@
 # donations/context_processors.py
-from .models import Don, DemandeDon, PropositionDon
-from users.models import Transporteur
+from functools import partial
+
+from django.utils.functional import SimpleLazyObject
+
+from .counters import COUNTERS, LazyCounters
+
 
 def home_stats(request):
-    return {
-        'total_donations': Don.objects.count(),
-        'active_requests': DemandeDon.objects.filter(statut='en_attente').count(),
-        'total_transporters': Transporteur.objects.filter(disponibilite=True).count(),
-        'completed_missions': PropositionDon.objects.filter(statut='terminee').count()
-    }
\ No newline at end of file
+    """Expose platform counters lazily: templates that never read them issue no query."""
+    stats = LazyCounters()
+    context = {nom: SimpleLazyObject(partial(stats.__getitem__, nom)) for nom in COUNTERS}
+    context['platform_stats'] = stats
+    return context
@@ -0,0 +1,104 @@
+"""
+donations/counters.py - Incrementally maintained platform counters
+
+Each counter is stored as one ``Compteur`` row and adjusted with
+``F('valeur') + delta`` from model signals, so reading the platform stats
+costs at most one query instead of one ``COUNT(*)`` per counter.
+``reconcile()`` recomputes every counter from the source tables and is run
+periodically by the ``reconcile_counters`` management command to repair
+drift caused by ``QuerySet.update()`` or raw SQL.
+"""
+
+from django.db.models import F
+
+from .models import Compteur, Don, DemandeDon, PropositionDon
+from users.models import Transporteur
+
+
+class Counter:
+    """A named count of the ``model`` rows matching ``filters``."""
+
+    def __init__(self, nom, model, **filters):
+        self.nom = nom
+        self.model = model
+        self.filters = filters
+
+    def queryset(self):
+        return self.model._default_manager.filter(**self.filters)
+
+    def tracked_fields(self):
+        return [self.model._meta.get_field(name).attname for name in self.filters]
+
+    def matches(self, instance):
+        """Whether ``instance`` is counted, or None if a tracked field is deferred."""
+        return self.matches_state(instance.__dict__)
+
+    def matches_state(self, state):
+        """Same as ``matches()``, from a {attname: value} mapping."""
+        if any(attname not in state for attname in self.tracked_fields()):
+            return None
+        return all(state[self.model._meta.get_field(name).attname] == value
+                   for name, value in self.filters.items())
+
+
+COUNTERS = {
+    counter.nom: counter for counter in (
+        Counter('total_donations', Don),
+        Counter('active_requests', DemandeDon, statut='en_attente'),
+        Counter('total_transporters', Transporteur, disponibilite=True),
+        Counter('completed_missions', PropositionDon, statut='terminee'),
+    )
+}
+
+
+def counters_for(model):
+    return [counter for counter in COUNTERS.values() if counter.model is model]
+
+
+# ============ WRITE PATH ============
+def adjust(nom, delta):
+    """Add ``delta`` to a counter; a missing row is rebuilt from the source table."""
+    if not delta:
+        return
+    updated = Compteur.objects.filter(nom=nom).update(valeur=F('valeur') + delta)
+    if not updated:
+        reconcile([nom])
+
+
+def reconcile(noms=None):
+    """Recompute counters from the source tables. Returns {nom: (old, new)}."""
+    noms = list(COUNTERS) if noms is None else noms
+    existing = dict(Compteur.objects.filter(nom__in=noms).values_list('nom', 'valeur'))
+    changes = {}
+    for nom in noms:
+        valeur = COUNTERS[nom].queryset().count()
+        Compteur.objects.update_or_create(nom=nom, defaults={'valeur': valeur})
+        changes[nom] = (existing.get(nom), valeur)
+    return changes
+
+
+# ============ READ PATH ============
+def read_all():
+    """Return every counter value with a single query."""
+    values = dict(Compteur.objects.filter(nom__in=COUNTERS).values_list('nom', 'valeur'))
+    missing = [nom for nom in COUNTERS if nom not in values]
+    if missing:
+        values.update({nom: new for nom, (old, new) in reconcile(missing).items()})
+    return values
+
+
+class LazyCounters:
+    """Counter values loaded on first access, so unused stats cost no query."""
+
+    def __init__(self):
+        self._values = None
+
+    def __getitem__(self, nom):
+        if self._values is None:
+            self._values = read_all()
+        return self._values[nom]
+
+    def __getattr__(self, nom):
+        if nom.startswith('_') or nom not in COUNTERS:
+            raise AttributeError(nom)
+        return self[nom]
@@ -0,0 +1,190 @@
+"""
+donations/dispatch.py - Rank available transporteurs for a mission and dispatch the backlog
+
+``Dispatcher`` loads the available transporteurs in one query. Correlated
+subqueries annotate each one with:
+- the number of open missions: pickups and deliveries assigned and not
+  finished
+- the number of propositions assigned to it, and how many of those it
+  refused
+
+``rank()`` orders them for a mission by a weighted score of:
+- proximity: the transporteur's postal code, read from its ``address``,
+  against the mission's ``code_postal``/``ville``
+- workload: fewer open missions is better
+- reliability: the share of assignments it did not refuse
+
+``auto_assign()`` dispatches every proposition and demande waiting for a
+transporteur, oldest first. It updates the workloads in memory as it goes,
+so the backlog is spread out instead of piling on the best ranked
+transporteur. The result is written in one transaction with
+``bulk_update`` and one ``notifications.service.send()``.
+"""
+
+import re
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from notifications import service
+from users.models import Transporteur
+from .models import DemandeDon, PropositionDon
+
+WEIGHTS = {'proximite': 0.50, 'charge': 0.35, 'fiabilite': 0.15}
+# No known postal code: neither favoured nor excluded
+UNKNOWN_PROXIMITY = 0.3
+# auto_assign() leaves missions unassigned rather than exceed this many open missions
+MAX_OPEN_MISSIONS = 8
+
+OPEN_PROPOSITIONS = Q(statut__in=['validee', 'ramassee']) & ~Q(transporteur_statut='refusee')
+OPEN_DEMANDES = Q(statut__in=['validee', 'en_cours', 'en_livraison'])
+
+# Missions waiting for a transporteur
+WAITING_PROPOSITIONS = Q(statut='validee') & (Q(transporteur_assignee__isnull=True) | Q(transporteur_statut='refusee'))
+WAITING_DEMANDES = Q(statut='validee', transporteur_livraison__isnull=True)
+
+CODE_POSTAL_RE = re.compile(r'\b(\d{5})\b')
+
+
+def _count(model, field, condition=Q()):
+    rows = (model.objects.filter(condition, **{field: OuterRef('pk')}).order_by()
+            .values(field).annotate(n=Count('pk')).values('n'))
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def available_transporteurs():
+    """Available transporteurs annotated with their open missions and refusal history, in one query."""
+    return (Transporteur.objects.filter(disponibilite=True)
+            .annotate(
+                missions_propositions=_count(PropositionDon, 'transporteur_assignee', OPEN_PROPOSITIONS),
+                missions_demandes=_count(DemandeDon, 'transporteur_livraison', OPEN_DEMANDES),
+                affectations=_count(PropositionDon, 'transporteur_assignee'),
+                refus=_count(PropositionDon, 'transporteur_assignee', Q(transporteur_statut='refusee')),
+            ).order_by('id'))
+
+
+def code_postal_of(address):
+    match = CODE_POSTAL_RE.search(address or '')
+    return match.group(1) if match else ''
+
+
+class Dispatcher:
+    def __init__(self, transporteurs=None):
+        self.transporteurs = list(available_transporteurs() if transporteurs is None else transporteurs)
+        for t in self.transporteurs:
+            t.missions_ouvertes = t.missions_propositions + t.missions_demandes
+            t.taux_refus = t.refus / t.affectations if t.affectations else 0.0
+            t.code_postal = code_postal_of(t.address)
+            t.adresse_normalisee = (t.address or '').lower()
+
+    def proximity(self, transporteur, code_postal, ville):
+        code_postal = (code_postal or '').strip()
+        if transporteur.code_postal and code_postal:
+            if transporteur.code_postal == code_postal:
+                return 1.0
+            # Same département
+            if transporteur.code_postal[:2] == code_postal[:2]:
+                return 0.8
+            return 0.0
+        ville = (ville or '').strip().lower()
+        if ville and ville in transporteur.adresse_normalisee:
+            return 0.8
+        return UNKNOWN_PROXIMITY
+
+    def score(self, transporteur, code_postal, ville):
+        return 100 * (WEIGHTS['proximite'] * self.proximity(transporteur, code_postal, ville)
+                      + WEIGHTS['charge'] / (1 + transporteur.missions_ouvertes)
+                      + WEIGHTS['fiabilite'] * (1 - transporteur.taux_refus))
+
+    def rank(self, code_postal='', ville='', exclude=()):
+        """Transporteurs best first, each with a ``score`` (0-100) attribute."""
+        ranked = []
+        for t in self.transporteurs:
+            if t.id in exclude:
+                continue
+            t.score = round(self.score(t, code_postal, ville))
+            ranked.append(t)
+        ranked.sort(key=lambda t: (-t.score, t.missions_ouvertes, t.id))
+        return ranked
+
+    def rank_for(self, mission):
+        """Rank for a PropositionDon or a DemandeDon, without the transporteur that refused it."""
+        exclude = ()
+        if isinstance(mission, PropositionDon) and mission.transporteur_statut == 'refusee':
+            exclude = (mission.transporteur_assignee_id,)
+        return self.rank(mission.code_postal, mission.ville, exclude)
+
+
+# ============ AUTO-ASSIGN ============
+def backlog():
+    """(propositions, demandes) waiting for a transporteur, oldest first."""
+    propositions = PropositionDon.objects.filter(WAITING_PROPOSITIONS).order_by('date_proposition', 'id')
+    demandes = DemandeDon.objects.filter(WAITING_DEMANDES).order_by('date_demande', 'id')
+    return list(propositions), list(demandes)
+
+
+class Dispatch:
+    def __init__(self):
+        self.assignments = []   # (mission, transporteur, score)
+        self.unassigned = []    # mission
+        self.applied = 0
+
+    def __len__(self):
+        return len(self.assignments)
+
+
+def plan(dispatcher=None):
+    dispatcher = dispatcher or Dispatcher()
+    result = Dispatch()
+    propositions, demandes = backlog()
+    for mission in propositions + demandes:
+        ranked = [t for t in dispatcher.rank_for(mission) if t.missions_ouvertes < MAX_OPEN_MISSIONS]
+        if not ranked:
+            result.unassigned.append(mission)
+            continue
+        best = ranked[0]
+        best.missions_ouvertes += 1
+        result.assignments.append((mission, best, best.score))
+    return result
+
+
+def apply(result, membre=None):
+    """Write ``result``; returns the number of missions assigned."""
+    fields = ['membre_validateur'] if membre is not None else []
+    propositions, demandes, notifications = [], [], []
+    with transaction.atomic():
+        # Skip missions a member handled by hand since plan()
+        still_waiting = {
+            model: set(model.objects.select_for_update().filter(
+                waiting, id__in=[m.id for m, _, _ in result.assignments if isinstance(m, model)],
+            ).values_list('id', flat=True))
+            for model, waiting in ((PropositionDon, WAITING_PROPOSITIONS), (DemandeDon, WAITING_DEMANDES))
+        }
+        for mission, transporteur, _ in result.assignments:
+            if mission.id not in still_waiting[type(mission)]:
+                continue
+            if membre is not None:
+                mission.membre_validateur = membre
+            if isinstance(mission, PropositionDon):
+                mission.transporteur_assignee = transporteur
+                mission.transporteur_statut = 'en_attente'
+                propositions.append(mission)
+                notifications.append(service.build(transporteur.id, 'mission_proposition', {'proposition': mission}))
+            else:
+                mission.transporteur_livraison = transporteur
+                demandes.append(mission)
+                notifications.append(service.build(transporteur.id, 'mission_demande', {'demande': mission}))
+        PropositionDon.objects.bulk_update(
+            propositions, ['transporteur_assignee', 'transporteur_statut'] + fields)
+        DemandeDon.objects.bulk_update(demandes, ['transporteur_livraison'] + fields)
+        service.send(notifications)
+    return len(notifications)
+
+
+def auto_assign(membre=None, dry_run=False):
+    """Dispatch the whole backlog in one call; returns the ``Dispatch`` plan."""
+    result = plan()
+    if not dry_run:
+        result.applied = apply(result, membre)
+    return result
@@ -1,6 +1,31 @@
 from django import forms
+from django.forms.models import ModelChoiceIterator, ModelChoiceIteratorValue
+
+from . import categories
 from .models import PropositionDon , DemandeDon
 
+
+class CategorieTreeIterator(ModelChoiceIterator):
+    """Choices from the process-local category tree: rendering a picker costs no query."""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for node in categories.tree():
+            yield (ModelChoiceIteratorValue(node.id, node), node.label)
+
+    def __len__(self):
+        return len(categories.tree()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(categories.tree())
+
+
+class CategorieChoiceField(forms.ModelChoiceField):
+    """Category picker indented by depth; only validating a submitted value queries the database."""
+    iterator = CategorieTreeIterator
+
+
 class PropositionDonForm(forms.ModelForm):
     class Meta:
         model = PropositionDon
@@ -16,6 +41,7 @@ class PropositionDonForm(forms.ModelForm):
             "code_postal",
             "disponibilite_ramassage",
         ]
+        field_classes = {"categorie": CategorieChoiceField}
 
 
 
@@ -32,3 +58,4 @@ class DemandeDonForm(forms.ModelForm):
             
 
                   ]
+        field_classes = {'categorie_recherchee': CategorieChoiceField}
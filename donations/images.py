@@ -0,0 +1,217 @@
+"""
+donations/images.py - Renditions of the proposition and stock photos
+
+An uploaded photo is processed once, off the request path:
+- the EXIF orientation is applied to the pixels, then every EXIF tag is
+  dropped. A phone photo can carry the GPS position of the donateur's
+  home. The cleaned photo is stored as a new file and the rows point to
+  it; the upload, now unreferenced, is deleted by ``collect_blobs``.
+- WebP and JPEG copies are written next to the cleaned photo for each of
+  ``WIDTHS`` narrower than it, so ``<sha256>.jpg`` gets
+  ``<sha256>.w320.webp``, ``<sha256>.w320.jpg`` and so on. A photo is
+  never upscaled.
+- a ``PLACEHOLDER_WIDTH`` pixels wide WebP is kept as a data URI, shown
+  blurred while the real image loads.
+
+The result is stored in the row's ``photos_variantes`` field; see
+``describe()``. It is written to every PropositionDon and Don that share
+the file, since ``intake`` copies the proposition's photo to the Don.
+
+``enqueue()`` hands a row to a background thread once the transaction
+commits. Rows the thread never got to, for example after a restart, are
+picked up by the ``process_images`` command. Until a photo is processed,
+the ``{% photo %}`` tag falls back to the original.
+"""
+
+import atexit
+import base64
+import logging
+import os
+import queue
+import threading
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.db.models.fields.json import KT
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import blobs
+from .models import Don, PropositionDon
+from .storage import photo_storage
+
+logger = logging.getLogger(__name__)
+
+MODELS = (PropositionDon, Don)
+WIDTHS = (160, 320, 640, 1280)
+FORMATS = {'webp': ('WEBP', 80), 'jpg': ('JPEG', 82)}
+PLACEHOLDER_WIDTH = 16
+ORIGINAL_QUALITY = 90
+MAX_PIXELS = 50_000_000
+
+
+# ============ RENDITIONS ============
+def variant_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return f"{root}.w{width}.{ext}"
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def flatten(image):
+    """RGB copy of ``image``; transparent areas become white."""
+    if has_alpha(image):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, pil_format, quality):
+    buffer = BytesIO()
+    image.save(buffer, pil_format, quality=quality, optimize=pil_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def overwrite(name, content):
+    photo_storage().save_rendition(name, ContentFile(content))
+
+
+def placeholder(image):
+    small = image.copy()
+    small.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+    return "data:image/webp;base64," + base64.b64encode(encode(small, 'WEBP', 40)).decode()
+
+
+def process(name):
+    """Store ``name`` stripped and oriented, write its renditions; returns the ``photos_variantes``.
+
+    Their ``source`` is the name of the cleaned photo.
+    """
+    storage = photo_storage()
+    with storage.open(name, 'rb') as f:
+        source = Image.open(f)
+        if source.width * source.height > MAX_PIXELS:
+            raise ValueError(f"{name}: {source.width}x{source.height} is too large")
+        pil_format = source.format if source.format in ('JPEG', 'PNG', 'WEBP') else 'JPEG'
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    if pil_format == 'JPEG':
+        image = flatten(image)
+    else:
+        image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    # Saved without exif=: the cleaned photo carries no EXIF at all
+    name = storage.save(name, ContentFile(encode(image, pil_format, ORIGINAL_QUALITY)))
+
+    rgb = flatten(image)
+    widths = [width for width in WIDTHS if width < rgb.width] or [rgb.width]
+    for width in widths:
+        resized = rgb.resize((width, round(rgb.height * width / rgb.width)), Image.LANCZOS)
+        for ext, (variant_format, quality) in FORMATS.items():
+            overwrite(variant_name(name, width, ext), encode(resized, variant_format, quality))
+    return describe(name, rgb.width, rgb.height, widths, placeholder(rgb))
+
+
+def describe(name, width, height, widths, placeholder):
+    return {'source': name, 'width': width, 'height': height, 'widths': widths, 'placeholder': placeholder}
+
+
+def is_current(instance):
+    """Whether the row's renditions were made from its current photo."""
+    return bool(instance.photos) and (instance.photos_variantes or {}).get('source') == instance.photos.name
+
+
+def process_row(model, pk):
+    """Process the photo of one row, unless it already is; returns whether renditions were written."""
+    instance = model._default_manager.filter(pk=pk).only('photos', 'photos_variantes').first()
+    if instance is None or not instance.photos or is_current(instance):
+        return False
+    name = instance.photos.name
+    try:
+        variantes = process(name)
+    except (OSError, ValueError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.exception("Could not process photo %s", name)
+        return False
+    clean = variantes['source']
+    for other in MODELS:
+        # photos=name: a photo replaced meanwhile keeps waiting for its own renditions
+        moved = other._default_manager.filter(photos=name).update(photos=clean, photos_variantes=variantes)
+        if clean != name:
+            blobs.adjust([clean] * moved)
+            blobs.adjust([name] * moved, -1)
+    return True
+
+
+def pending(model):
+    """Ids of the ``model`` rows whose photo has no current renditions."""
+    return (model._default_manager.exclude(photos='').exclude(photos__isnull=True)
+            .alias(source=KT('photos_variantes__source')).exclude(source=F('photos'), source__isnull=False)
+            .order_by('pk').values_list('pk', flat=True))
+
+
+# ============ BACKGROUND WORKER ============
+class ImageQueue:
+    """A daemon thread processing the rows handed to ``put()``, one at a time."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def put(self, model, pk):
+        self.start()
+        self.queue.put((model, pk))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="image-pipeline", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+        connections.close_all()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            close_old_connections()
+            try:
+                process_row(*item)
+            except Exception:
+                logger.exception("Image pipeline failed on %s #%s", item[0].__name__, item[1])
+
+
+image_queue = ImageQueue()
+
+
+def enqueue(sender, instance, raw=False, **kwargs):
+    """post_save receiver: process a new or replaced photo after commit."""
+    if raw or not instance.photos or is_current(instance):
+        return
+    transaction.on_commit(lambda: image_queue.put(sender, instance.pk))
+
+
+# ============ TEMPLATES ============
+def srcset(variantes, ext):
+    """``srcset`` attribute listing the ``ext`` renditions, e.g. "….w160.webp 160w, ….w320.webp 320w"."""
+    storage = photo_storage()
+    return ", ".join(f"{storage.url(variant_name(variantes['source'], width, ext))} {width}w"
+                     for width in variantes['widths'])
+
+
+def fallback_url(variantes, ext='jpg', width=640):
+    """The rendition for browsers without ``srcset``: the widest one up to ``width``."""
+    widths = [w for w in variantes['widths'] if w <= width] or variantes['widths'][:1]
+    return photo_storage().url(variant_name(variantes['source'], widths[-1], ext))
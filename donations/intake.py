@@ -0,0 +1,65 @@
+"""
+donations/intake.py - Turn delivered propositions into stock, one or many at a time
+
+``stock_propositions()`` locks the propositions it is given and keeps the
+ones that can enter the stock: the donateur confirmed the handover
+(``donator_gives``) and no Don exists yet. It reserves one block of
+references from ``sequences`` and inserts every Don with one
+``bulk_create``, all in a single transaction. A proposition stocked
+concurrently is either skipped by the locked re-read or rejected by the
+unique ``proposition`` column, which rolls the whole intake back; it is
+never stocked twice.
+
+``bulk_create`` sends no signal, so the intake adjusts the
+``total_donations`` counter and the photo reference counts, reindexes
+the new Dons for search and invalidates the matching index itself.
+"""
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from . import blobs, counters, matching, search
+from .models import Don, PropositionDon
+from .sequences import don_references
+
+LIEU_STOCKAGE = "Entrepôt principal"
+BATCH_SIZE = 500
+
+
+def stockable(propositions):
+    """The propositions among ``propositions`` that can enter the stock, locked for the transaction."""
+    ids = [getattr(proposition, 'pk', proposition) for proposition in propositions]
+    # NOT EXISTS rather than don_realise__isnull: PostgreSQL refuses FOR UPDATE
+    # on the nullable side of the LEFT JOIN that the latter compiles to
+    return list(PropositionDon.objects.select_for_update()
+                .filter(~Exists(Don.objects.filter(proposition=OuterRef('pk'))), id__in=ids, donator_gives=True)
+                .order_by('id'))
+
+
+def stock_propositions(propositions, lieu_stockage=LIEU_STOCKAGE):
+    """Create the Dons of the stockable ``propositions`` (objects or ids); returns them."""
+    with transaction.atomic():
+        eligible = stockable(propositions)
+        if not eligible:
+            return []
+        references = don_references(len(eligible))
+        dons = Don.objects.bulk_create([
+            Don(proposition=proposition, reference=reference, categorie_id=proposition.categorie_id,
+                type_materiel=proposition.type_materiel, quantite=proposition.quantite,
+                description=proposition.description, etat=proposition.etat, photos=proposition.photos,
+                photos_variantes=proposition.photos_variantes, lieu_stockage=lieu_stockage)
+            for proposition, reference in zip(eligible, references)
+        ], batch_size=BATCH_SIZE)
+        if any(don.pk is None for don in dons):
+            dons = list(Don.objects.filter(reference__in=references))
+        counters.adjust('total_donations', len(dons))
+        blobs.adjust([don.photos.name for don in dons])
+        search.reindex(Don, [don.pk for don in dons])
+        transaction.on_commit(matching.invalidate)
+    return dons
+
+
+def stock_proposition(proposition, lieu_stockage=LIEU_STOCKAGE):
+    """The Don created for ``proposition``, or None if it cannot enter the stock."""
+    dons = stock_propositions([proposition], lieu_stockage)
+    return dons[0] if dons else None
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from donations import allocation
+
+
+class Command(BaseCommand):
+    help = ("Attribute the en_stock dons to the validated demandes that have none, "
+            "most urgent first, in a single transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report the proposed allocation without writing it.")
+
+    def handle(self, *args, **options):
+        result = allocation.plan()
+        for demande, don_id, score in result.pairs:
+            self.stdout.write(f"Demande #{demande.id} ({demande.urgence}) <- Don #{don_id} [score {score}]")
+        for demande, reason in result.unallocated:
+            self.stdout.write(self.style.WARNING(f"Demande #{demande.id} ({demande.urgence}): {reason}"))
+
+        if options['dry_run']:
+            summary = f"{len(result)} attribution(s) proposée(s), rien n'a été écrit."
+        else:
+            allocation.apply(result)
+            summary = f"{result.applied} attribution(s) enregistrée(s) sur {len(result)} proposée(s)."
+        timings = ", ".join(f"{phase} {ms} ms" for phase, ms in result.timings.items())
+        self.stdout.write(self.style.SUCCESS(f"{summary} ({timings})"))
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from donations import benchmarks
+
+DEFAULT_BASELINE = Path(benchmarks.__file__).with_name('benchmark_baseline.json')
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic dataset in a throwaway test database, measure the main views "
+            "and functions (benchmarks.FUNCTIONS, e.g. tour planning) and fail if they "
+            "regressed against the committed baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('views', nargs='*', help="Views or functions to benchmark (default: all).")
+        parser.add_argument('--scale', type=float, default=None,
+                            help="Dataset size relative to donations.benchmarks.DATASET "
+                                 "(default: the baseline's scale).")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per view or function.")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Write the measurements to the baseline instead of comparing.")
+        parser.add_argument('--time-tolerance', type=float, default=0.5)
+        parser.add_argument('--memory-tolerance', type=float, default=0.25)
+
+    def handle(self, *args, **options):
+        unknown = set(options['views']) - set(benchmarks.BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}")
+
+        baseline = None
+        if not options['update_baseline']:
+            try:
+                baseline = benchmarks.load_baseline(options['baseline'])
+            except FileNotFoundError:
+                raise CommandError(f"No baseline at {options['baseline']} (use --update-baseline)")
+        scale = options['scale'] or (baseline['scale'] if baseline else 0.1)
+        if baseline and scale != baseline['scale']:
+            raise CommandError(f"The baseline was measured at scale {baseline['scale']}, not {scale}.")
+
+        results = self.measure(scale, options['views'], options['repeat'])
+        for name, result in results.items():
+            self.stdout.write(f"{name:<24} {result['queries']:>4} queries {result['time_ms']:>9} ms "
+                              f"{result['peak_kb']:>9} KiB")
+
+        if options['update_baseline']:
+            benchmarks.save_baseline(options['baseline'], scale, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        regressions = benchmarks.compare(results, baseline, options['time_tolerance'],
+                                         options['memory_tolerance'])
+        if regressions:
+            raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regression against the baseline."))
+
+    def measure(self, scale, views, repeat):
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding dataset at scale {scale}...")
+            dataset = benchmarks.seed(scale)
+            return benchmarks.run(dataset, views or None, repeat)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
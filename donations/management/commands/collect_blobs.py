@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from donations import blobs
+
+
+class Command(BaseCommand):
+    help = ("Delete the stored photo files no proposition or don points to anymore, "
+            "after recomputing the reference counts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-hours', type=float, default=blobs.MIN_AGE.total_seconds() / 3600,
+                            help="Keep files younger than this: their row may not be saved yet.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted.")
+
+    def handle(self, *args, **options):
+        for nom, (old, new) in blobs.reconcile().items():
+            self.stdout.write(self.style.WARNING(f"{nom}: {old} -> {new} référence(s)"))
+        run = blobs.collect(timedelta(hours=options['min_age_hours']), options['dry_run'])
+        verbe = "à supprimer" if options['dry_run'] else "supprimé(s)"
+        self.stdout.write(f"Déduplication: {blobs.saved_bytes()} octet(s) économisé(s).")
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.blobs} fichier(s) non référencé(s), {run.files} fichier(s) {verbe}, {run.bytes} octet(s) libéré(s)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from donations import dispatch
+
+
+class Command(BaseCommand):
+    help = ("Assign a transporteur to every validated proposition and demande still waiting for one, "
+            "balancing the workload and favouring nearby transporteurs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report the proposed assignments without writing them.")
+
+    def handle(self, *args, **options):
+        result = dispatch.auto_assign(dry_run=options['dry_run'])
+        for mission, transporteur, score in result.assignments:
+            self.stdout.write(f"{mission} -> {transporteur.username} [score {score}]")
+        for mission in result.unassigned:
+            self.stdout.write(self.style.WARNING(f"{mission}: aucun transporteur disponible"))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{len(result)} affectation(s) proposée(s), rien n'a été écrit."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{result.applied} affectation(s) enregistrée(s) sur {len(result)} proposée(s)."))
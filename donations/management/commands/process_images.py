@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from donations import images
+
+
+class Command(BaseCommand):
+    help = ("Strip EXIF from the proposition and stock photos that have no current renditions, "
+            "and write their thumbnails and blur placeholder.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Process at most this many photos.")
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for model in images.MODELS:
+            for pk in list(images.pending(model)):
+                if options['limit'] is not None and processed + failed >= options['limit']:
+                    break
+                if images.process_row(model, pk):
+                    processed += 1
+                else:
+                    failed += 1
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} photo(s) non traitée(s), voir les logs."))
+        self.stdout.write(self.style.SUCCESS(f"{processed} photo(s) traitée(s)."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from donations import categories
+
+
+class Command(BaseCommand):
+    help = ("Recompute the category closure table from the parent links "
+            "(after bulk updates or raw SQL that bypassed the signals).")
+
+    def handle(self, *args, **options):
+        rows = categories.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{rows} lien(s) de catégorie reconstruit(s)."))
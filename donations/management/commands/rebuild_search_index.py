@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from donations import search
+
+
+class Command(BaseCommand):
+    help = ("Reindex every proposition, demande, don and categorie for full-text search "
+            "(after migrating a database that already has rows, or after bulk writes "
+            "or raw SQL that bypassed the signals).")
+
+    def handle(self, *args, **options):
+        counts = search.rebuild()
+        detail = ", ".join(f"{kind} {n}" for kind, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"{sum(counts.values())} ligne(s) indexée(s) ({detail})."))
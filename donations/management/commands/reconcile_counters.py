@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from donations import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the platform counters from the source tables (run periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('noms', nargs='*', help="Counters to reconcile (default: all).")
+
+    def handle(self, *args, **options):
+        noms = options['noms'] or None
+        unknown = set(noms or []) - set(counters.COUNTERS)
+        if unknown:
+            self.stderr.write(f"Compteurs inconnus: {', '.join(sorted(unknown))}")
+            return
+        for nom, (old, new) in counters.reconcile(noms).items():
+            if old != new:
+                self.stdout.write(self.style.WARNING(f"{nom}: {old} -> {new}"))
+            else:
+                self.stdout.write(f"{nom}: {new}")
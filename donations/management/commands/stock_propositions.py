@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from donations import intake
+from donations.models import PropositionDon
+
+
+class Command(BaseCommand):
+    help = ("Add every proposition whose handover the donateur confirmed and that has no Don yet "
+            "to the stock, in a single transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int,
+                            help="Only these propositions (default: every stockable proposition).")
+        parser.add_argument('--lieu', default=intake.LIEU_STOCKAGE, help="Lieu de stockage of the new dons.")
+
+    def handle(self, *args, **options):
+        propositions = options['ids'] or PropositionDon.objects.filter(
+            donator_gives=True, don_realise__isnull=True).values_list('id', flat=True)
+        dons = intake.stock_propositions(list(propositions), options['lieu'])
+        for don in dons:
+            self.stdout.write(f"Proposition #{don.proposition_id} -> {don.reference}")
+        self.stdout.write(self.style.SUCCESS(f"{len(dons)} don(s) ajouté(s) au stock."))
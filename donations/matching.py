@@ -0,0 +1,228 @@
+"""
+donations/matching.py - Rank the stock against a demande
+
+``StockIndex`` is a per-process snapshot of the matchable stock. Each don
+is stored with its text already normalized into a token set, and the dons
+are grouped by categorie. Matching a demande only visits the candidate
+sets of the categories under the one it asks for. If the demande has no
+categorie, it only visits the dons that share a token with it. Scoring is
+pure Python over precomputed values, so the cost depends on the size of
+the subtree and not on the size of the stock.
+
+The snapshot is rebuilt when the stock version in the cache changes.
+Signals bump the version when a Don or a CategorieObjet is saved or
+deleted. The snapshot also expires after ``INDEX_TTL`` seconds, which
+covers bulk writes and other processes. A stale snapshot can only affect
+the ranking: the dons of the final ranking are reloaded and rechecked
+against the database before they are shown.
+"""
+
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import CategorieClosure, Don
+
+# Stock that can still be given to a demande
+MATCHABLE_STATUTS = ('en_stock', 'garde_meuble', 'en_depot_vente')
+
+WEIGHTS = {'categorie': 0.30, 'texte': 0.30, 'etat': 0.15, 'quantite': 0.10, 'localisation': 0.15}
+# Urgent demandes favour what can be delivered quickly and in full over condition
+URGENT_WEIGHTS = {'categorie': 0.30, 'texte': 0.25, 'etat': 0.05, 'quantite': 0.15, 'localisation': 0.25}
+URGENT = ('haute', 'urgente')
+
+ETAT_SCORES = {'neuf': 1.0, 'bon_etat': 0.8, 'etat_moyen': 0.5, 'a_reparer': 0.2}
+# A don from a sub-category loses this much per level below the requested one
+DEPTH_PENALTY = 0.15
+MIN_CATEGORY_SCORE = 0.4
+
+INDEX_TTL = 300
+VERSION_KEY = 'donations:stock-version'
+
+STOPWORDS = frozenset("""
+    a au aux avec besoin ce ces cet cette d dans de des du en et il ils je l la le les leur mon ma mes
+    ne nous on ou par pas pour plus que qui sa se ses son sur un une vos votre vous y
+""".split())
+
+
+def words(*texts):
+    """Lowercased, accent-free, singular words of ``texts`` without stopwords, in order."""
+    text = unicodedata.normalize('NFKD', ' '.join(t for t in texts if t).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    for word in re.findall(r'[a-z0-9]+', text):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 3 and word[-1] in 'sx':
+            word = word[:-1]
+        yield word
+
+
+def tokenize(*texts):
+    """The set of ``words()`` of ``texts``."""
+    return frozenset(words(*texts))
+
+
+class Candidate:
+    __slots__ = ('id', 'categorie_id', 'tokens', 'etat_score', 'quantite', 'ville', 'code_postal')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.categorie_id = row['categorie_id']
+        self.tokens = tokenize(row['type_materiel'], row['description'])
+        self.etat_score = ETAT_SCORES.get(row['etat'], 0.5)
+        self.quantite = row['quantite']
+        self.ville = (row['proposition__ville'] or '').strip().lower()
+        self.code_postal = (row['proposition__code_postal'] or '').strip()
+
+
+class Match:
+    """A ranked don with its overall score (0-100) and per-criterion scores (0-1)."""
+
+    def __init__(self, don, score, details):
+        self.don = don
+        self.score = score
+        self.details = details
+
+
+class StockIndex:
+    def __init__(self, version=None, statuts=MATCHABLE_STATUTS):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.subtrees = defaultdict(dict)
+        for ancestor_id, descendant_id, depth in CategorieClosure.objects.values_list(
+                'ancestor_id', 'descendant_id', 'depth'):
+            self.subtrees[ancestor_id][descendant_id] = depth
+
+        self.by_categorie = defaultdict(list)
+        self.by_token = defaultdict(list)
+        rows = (Don.objects.order_by()
+                .filter(statut__in=statuts, demandes_attribuees__isnull=True)
+                .values('id', 'categorie_id', 'type_materiel', 'description', 'etat', 'quantite',
+                        'proposition__ville', 'proposition__code_postal'))
+        for row in rows.iterator():
+            candidate = Candidate(row)
+            self.by_categorie[candidate.categorie_id].append(candidate)
+            for token in candidate.tokens:
+                self.by_token[token].append(candidate)
+
+    def subtree(self, categorie_id):
+        """{categorie_id: depth} of a categorie and all its descendants."""
+        return self.subtrees.get(categorie_id) or {categorie_id: 0}
+
+    def candidates(self, demande, tokens):
+        """Yield ``(candidate, depth)``; depth is None when the demande has no categorie."""
+        if demande.categorie_recherchee_id is not None:
+            for categorie_id, depth in self.subtree(demande.categorie_recherchee_id).items():
+                for candidate in self.by_categorie.get(categorie_id, ()):
+                    yield candidate, depth
+            return
+        seen = set()
+        for token in tokens:
+            for candidate in self.by_token.get(token, ()):
+                if candidate.id not in seen:
+                    seen.add(candidate.id)
+                    yield candidate, None
+
+
+# ============ INDEX CACHE ============
+_index = None
+_lock = threading.Lock()
+
+
+def stock_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate(**kwargs):
+    """Signal receiver: the stock changed, rebuild the index on next use."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def get_index():
+    global _index
+    version = stock_version()
+    index = _index
+    if index is None or index.version != version or time.monotonic() - index.built_at > INDEX_TTL:
+        with _lock:
+            if _index is index:
+                _index = StockIndex(version)
+            index = _index
+    return index
+
+
+# ============ SCORING ============
+def category_score(depth):
+    return 0.5 if depth is None else max(MIN_CATEGORY_SCORE, 1.0 - DEPTH_PENALTY * depth)
+
+
+class Scorer:
+    """Scores candidates against one demande; the demande side is computed once."""
+
+    def __init__(self, demande):
+        self.type_tokens = tokenize(demande.type_materiel)
+        self.tokens = self.type_tokens | tokenize(demande.description_besoin)
+        self.weights = URGENT_WEIGHTS if demande.urgence in URGENT else WEIGHTS
+        self.quantite = max(1, demande.quantite_desiree)
+        self.code_postal = (demande.code_postal or '').strip()
+        self.ville = (demande.ville or '').strip().lower()
+        # type_materiel tokens count double
+        self.wanted = len(self.tokens) + len(self.type_tokens)
+
+    def location(self, candidate):
+        if self.code_postal and self.code_postal == candidate.code_postal:
+            return 1.0
+        if candidate.ville and candidate.ville == self.ville:
+            return 0.8
+        # Same département
+        if self.code_postal[:2] and self.code_postal[:2] == candidate.code_postal[:2]:
+            return 0.5
+        return 0.0
+
+    def details(self, candidate, depth):
+        """Per-criterion scores between 0 and 1."""
+        found = len(self.tokens & candidate.tokens) + len(self.type_tokens & candidate.tokens)
+        return {
+            'categorie': category_score(depth),
+            'texte': found / self.wanted if self.wanted else 0.0,
+            'etat': candidate.etat_score,
+            'quantite': min(1.0, candidate.quantite / self.quantite),
+            'localisation': self.location(candidate),
+        }
+
+    def score(self, candidate, depth):
+        """Weighted sum of ``details()`` on a 0-100 scale, without building the dict (hot path)."""
+        w = self.weights
+        total = (w['categorie'] * category_score(depth)
+                 + w['etat'] * candidate.etat_score
+                 + w['quantite'] * min(1.0, candidate.quantite / self.quantite)
+                 + w['localisation'] * self.location(candidate))
+        if self.wanted:
+            found = len(self.tokens & candidate.tokens) + len(self.type_tokens & candidate.tokens)
+            total += w['texte'] * found / self.wanted
+        return 100 * total
+
+
+def match(demande, limit=20, index=None):
+    """Return the ``limit`` best matching dons for ``demande``, best first, as ``Match`` objects."""
+    index = index or get_index()
+    scorer = Scorer(demande)
+    # Over-fetch so that dons attributed since the snapshot do not shorten the list
+    shortlist = heapq.nsmallest(
+        limit * 2,
+        ((-scorer.score(candidate, depth), candidate.id, candidate, depth)
+         for candidate, depth in index.candidates(demande, scorer.tokens)),
+        key=lambda s: (s[0], s[1]))
+
+    dons = Don.objects.filter(
+        id__in=[s[1] for s in shortlist], statut__in=MATCHABLE_STATUTS, demandes_attribuees__isnull=True,
+    ).select_related('categorie', 'proposition').in_bulk()
+    return [Match(dons[candidate.id], round(-score), scorer.details(candidate, depth))
+            for score, _, candidate, depth in shortlist if candidate.id in dons][:limit]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0 on 2026-10-17 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0005_propositiondon_donator_gives_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Compteur',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=50, unique=True)),
+                ('valeur', models.IntegerField(default=0)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Compteur',
+                'verbose_name_plural': 'Compteurs',
+            },
+        ),
+        migrations.AddField(
+            model_name='demandedon',
+            name='demandeur_confirme_reception',
+            field=models.BooleanField(blank=True, default=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='demandedon',
+            name='transporteur_confirme',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='demandedon',
+            name='transporteur_date_reponse',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='demandedon',
+            name='transporteur_raison_refus',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='propositiondon',
+            name='transporteur_livre',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='propositiondon',
+            name='transporteur_recoit',
+            field=models.BooleanField(default=False),
+        ),
+    ]
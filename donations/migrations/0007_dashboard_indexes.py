@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0006_compteur'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='demandedon',
+            index=models.Index(fields=['-date_demande', '-id'], name='demande_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandedon',
+            index=models.Index(fields=['statut', '-date_demande', '-id'], name='demande_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='don',
+            index=models.Index(fields=['-date_entree_stock', '-id'], name='don_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='don',
+            index=models.Index(fields=['statut', '-date_entree_stock', '-id'], name='don_statut_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propositiondon',
+            index=models.Index(fields=['-date_proposition', '-id'], name='proposition_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propositiondon',
+            index=models.Index(fields=['statut', '-date_proposition', '-id'], name='proposition_statut_date_idx'),
+        ),
+    ]
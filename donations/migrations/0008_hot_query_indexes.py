@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0007_dashboard_indexes'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='demandedon',
+            index=models.Index(fields=['transporteur_livraison', 'statut'], name='demande_transport_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandedon',
+            index=models.Index(fields=['participant_requerant', '-date_demande'], name='demande_requerant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='don',
+            index=models.Index(fields=['categorie', 'statut'], name='don_categorie_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propositiondon',
+            index=models.Index(fields=['transporteur_assignee', 'transporteur_statut', 'statut'], name='proposition_transport_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propositiondon',
+            index=models.Index(fields=['participant_donateur', '-date_proposition'], name='proposition_donateur_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-17 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    CategorieObjet = apps.get_model('donations', 'CategorieObjet')
+    CategorieClosure = apps.get_model('donations', 'CategorieClosure')
+    parents = dict(CategorieObjet.objects.values_list('id', 'parent_id'))
+    rows = []
+    for categorie_id in parents:
+        node, depth, seen = categorie_id, 0, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            rows.append(CategorieClosure(ancestor_id=node, descendant_id=categorie_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    CategorieClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorieClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='donations.categorieobjet')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='donations.categorieobjet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='categorie_closure_desc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='categorie_closure_unique')],
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 18:10
+
+from django.db import migrations
+
+SCHEMA = {
+    'sqlite': (
+        ["CREATE VIRTUAL TABLE donations_search USING fts5("
+         "titre, body, tokenize = 'unicode61 remove_diacritics 2')"],
+        ["DROP TABLE donations_search"],
+    ),
+    'postgresql': (
+        ["CREATE TABLE donations_search ("
+         "kind smallint NOT NULL, object_id bigint NOT NULL, document tsvector NOT NULL, "
+         "PRIMARY KEY (kind, object_id))",
+         "CREATE INDEX donations_search_document_idx ON donations_search USING GIN (document)"],
+        ["DROP TABLE donations_search"],
+    ),
+}
+
+
+def create_index(apps, schema_editor):
+    # Schema only: the rows that already exist are indexed by the
+    # rebuild_search_index command, which follows the current models.
+    create, _ = SCHEMA.get(schema_editor.connection.vendor, ([], []))
+    for statement in create:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    _, drop = SCHEMA.get(schema_editor.connection.vendor, ([], []))
+    for statement in drop:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0009_categorieclosure'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=50, unique=True)),
+                ('dernier', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Séquence',
+                'verbose_name_plural': 'Séquences',
+            },
+        ),
+    ]
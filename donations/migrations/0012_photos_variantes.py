@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0011_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='don',
+            name='photos_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='propositiondon',
+            name='photos_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
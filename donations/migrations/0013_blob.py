@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-17 19:40
+
+import donations.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0012_photos_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('empreinte', models.CharField(max_length=64, unique=True)),
+                ('nom', models.CharField(max_length=100, unique=True)),
+                ('taille', models.PositiveBigIntegerField()),
+                ('references', models.IntegerField(default=0)),
+                ('envois', models.PositiveIntegerField(default=0)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Fichier',
+                'verbose_name_plural': 'Fichiers',
+                'indexes': [models.Index(fields=['references'], name='blob_references_idx')],
+            },
+        ),
+        migrations.AlterField(
+            model_name='don',
+            name='photos',
+            field=models.ImageField(blank=True, null=True, storage=donations.storage.photo_storage, upload_to='dons/'),
+        ),
+        migrations.AlterField(
+            model_name='propositiondon',
+            name='photos',
+            field=models.ImageField(blank=True, null=True, storage=donations.storage.photo_storage,
+                                    upload_to='propositions/dons/'),
+        ),
+    ]
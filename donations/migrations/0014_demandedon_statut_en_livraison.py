@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0013_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='demandedon',
+            name='statut',
+            field=models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours de traitement'), ('validee', 'Validée'), ('refusee', 'Refusée'), ('en_livraison', 'En cours de livraison'), ('terminee', 'Terminée'), ('annulee', 'Annulée')], default='en_attente', max_length=20),
+        ),
+    ]
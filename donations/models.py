@@ -1,7 +1,10 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 from users.models import Participant, Membre, Transporteur   # import roles from users app
 
+from .storage import photo_storage
+
 
 class CategorieObjet(models.Model):
     """Categories for organizing items"""
@@ -23,6 +26,73 @@ class CategorieObjet(models.Model):
     def __str__(self):
         return self.nom
 
+    def clean(self):
+        if self.pk and self.parent_id and self.descendants().filter(pk=self.parent_id).exists():
+            raise ValidationError({'parent': "Une catégorie ne peut pas être rangée sous l'une de ses sous-catégories."})
+
+    def descendants(self, include_self=True):
+        """The whole subtree in one query, through the closure table."""
+        qs = CategorieObjet.objects.filter(ancestor_links__ancestor=self)
+        return qs if include_self else qs.exclude(pk=self.pk)
+
+    def ancestors(self, include_self=False):
+        """Ancestors in one query, root first."""
+        qs = CategorieObjet.objects.filter(descendant_links__descendant=self).order_by('-descendant_links__depth')
+        return qs if include_self else qs.exclude(pk=self.pk)
+
+
+class CategorieClosure(models.Model):
+    """
+    One row per (ancestor, descendant) pair of the category tree, including
+    each category with itself at depth 0. Maintained by donations/categories.py.
+    """
+    ancestor = models.ForeignKey(CategorieObjet, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(CategorieObjet, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='categorie_closure_unique'),
+        ]
+        indexes = [
+            # ancestors(): the unique constraint already covers descendants()
+            models.Index(fields=['descendant', 'depth'], name='categorie_closure_desc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class PropositionDonQuerySet(models.QuerySet):
+    """Role-scoped listings, with the relations their templates read already joined."""
+
+    def for_participant(self, participant):
+        return (self.filter(participant_donateur=participant)
+                .select_related('categorie', 'membre_validateur', 'transporteur_assignee')
+                .order_by('-date_proposition'))
+
+    def for_transporteur(self, transporteur):
+        """Pickups the transporteur accepted, whatever their statut."""
+        return (self.filter(transporteur_assignee=transporteur, transporteur_statut='acceptee')
+                .select_related('categorie', 'participant_donateur'))
+
+    def active_for_transporteur(self, transporteur):
+        return self.for_transporteur(transporteur).exclude(statut='terminee').order_by('-date_proposition')
+
+    def terminated_for_transporteur(self, transporteur):
+        return self.for_transporteur(transporteur).filter(statut='terminee').order_by('-date_validation')
+
+    def with_associated_demande(self):
+        """
+        Load categorie, transporteur, don and the demande the don was attributed
+        to in two queries, whatever the number of rows. Read the demande through
+        ``PropositionDon.demande_associee``.
+        """
+        return self.select_related('categorie', 'transporteur_assignee', 'don_realise').prefetch_related(
+            models.Prefetch('don_realise__demandes_attribuees',
+                            queryset=DemandeDon.objects.all(), to_attr='demandes_associees')
+        )
+
 
 class PropositionDon(models.Model):
 
@@ -59,7 +129,9 @@ class PropositionDon(models.Model):
     quantite = models.IntegerField(default=1)
     description = models.TextField()
     etat = models.CharField(max_length=20, choices=ETAT_CHOICES, default='bon_etat')
-    photos = models.ImageField(upload_to='propositions/dons/', blank=True, null=True)
+    photos = models.ImageField(upload_to='propositions/dons/', storage=photo_storage, blank=True, null=True)
+    # Renditions of the photo, written by donations/images.py
+    photos_variantes = models.JSONField(default=dict, blank=True, editable=False)
 
     adresse_ramassage = models.TextField()
     ville = models.CharField(max_length=100)
@@ -90,15 +162,37 @@ class PropositionDon(models.Model):
     transporteur_livre = models.BooleanField(default=False)  # ✅ Transporter confirms they delivered to receiver
     donator_gives = models.BooleanField(default=False)  # ✅
 
+    objects = PropositionDonQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Proposition de don"
         verbose_name_plural = "Propositions de dons"
         ordering = ['-date_proposition']
+        indexes = [
+            # Keyset pagination and statut filters of the membre dashboard
+            models.Index(fields=['-date_proposition', '-id'], name='proposition_date_idx'),
+            models.Index(fields=['statut', '-date_proposition', '-id'], name='proposition_statut_date_idx'),
+            # Transporteur missions: active/terminated pickups per assignee
+            models.Index(fields=['transporteur_assignee', 'transporteur_statut', 'statut'],
+                         name='proposition_transport_idx'),
+            # Participant listings (mes_propositions, participant_dashboard)
+            models.Index(fields=['participant_donateur', '-date_proposition'], name='proposition_donateur_idx'),
+        ]
 
     def __str__(self):
         return f"Proposition #{self.id} - {self.type_materiel}"
 
+    @property
+    def demande_associee(self):
+        """Demande that received this proposition's don, or None."""
+        try:
+            don = self.don_realise
+        except Don.DoesNotExist:
+            return None
+        if hasattr(don, 'demandes_associees'):
+            return don.demandes_associees[0] if don.demandes_associees else None
+        return don.demandes_attribuees.first()
+
 
 class Don(models.Model):
     STATUT_CHOICES = (
@@ -119,7 +213,9 @@ class Don(models.Model):
     quantite = models.IntegerField(default=1)
     description = models.TextField()
     etat = models.CharField(max_length=20, choices=PropositionDon.ETAT_CHOICES, default='bon_etat')
-    photos = models.ImageField(upload_to='dons/', blank=True, null=True)
+    photos = models.ImageField(upload_to='dons/', storage=photo_storage, blank=True, null=True)
+    # Renditions of the photo, written by donations/images.py
+    photos_variantes = models.JSONField(default=dict, blank=True, editable=False)
 
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='en_stock')
     date_entree_stock = models.DateTimeField(auto_now_add=True)
@@ -136,6 +232,12 @@ class Don(models.Model):
         verbose_name = "Don"
         verbose_name_plural = "Dons"
         ordering = ['-date_entree_stock']
+        indexes = [
+            models.Index(fields=['-date_entree_stock', '-id'], name='don_date_idx'),
+            models.Index(fields=['statut', '-date_entree_stock', '-id'], name='don_statut_date_idx'),
+            # Stock matching a demande's category
+            models.Index(fields=['categorie', 'statut'], name='don_categorie_statut_idx'),
+        ]
 
     def __str__(self):
         ref = self.reference if self.reference else f"Don-{self.id}"
@@ -143,16 +245,33 @@ class Don(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.reference:
-        # Generate reference before saving
-            self.reference = f"DON-{timezone.now().year}-{self.id or 0:06d}"
+            from .sequences import don_references
+            self.reference = don_references(1)[0]
         super().save(*args, **kwargs)
 
-    # If reference was generated with id=0, update after first save
-        if self.reference.endswith("000000"):
-            self.reference = f"DON-{timezone.now().year}-{self.id:06d}"
-            super().save(update_fields=["reference"])
 
 
+class DemandeDonQuerySet(models.QuerySet):
+    """Role-scoped listings, with the relations their templates read already joined."""
+
+    def for_participant(self, participant):
+        return (self.filter(participant_requerant=participant)
+                .select_related('participant_requerant', 'categorie_recherchee', 'membre_validateur',
+                                'transporteur_livraison', 'don_attribue')
+                .order_by('-date_demande'))
+
+    def for_transporteur(self, transporteur):
+        """Deliveries assigned to the transporteur, whatever their statut."""
+        return (self.filter(transporteur_livraison=transporteur)
+                .select_related('categorie_recherchee', 'participant_requerant'))
+
+    def active_for_transporteur(self, transporteur):
+        return (self.for_transporteur(transporteur)
+                .exclude(statut__in=['annulee', 'terminee']).order_by('-date_demande'))
+
+    def terminated_for_transporteur(self, transporteur):
+        return self.for_transporteur(transporteur).filter(statut='terminee').order_by('-date_validation')
+
 
 class DemandeDon(models.Model):
 
@@ -183,6 +302,7 @@ class DemandeDon(models.Model):
         ('en_cours', 'En cours de traitement'),
         ('validee', 'Validée'),
         ('refusee', 'Refusée'),
+        ('en_livraison', 'En cours de livraison'),
         ('terminee', 'Terminée'),
         ('annulee', 'Annulée'),
     )
@@ -206,14 +326,71 @@ class DemandeDon(models.Model):
     transporteur_date_reponse = models.DateTimeField(null=True, blank=True)
     transporteur_raison_refus = models.TextField(blank=True) 
 
+    objects = DemandeDonQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Demande de don"
         verbose_name_plural = "Demandes de dons"
         ordering = ['urgence', '-date_demande']
+        indexes = [
+            models.Index(fields=['-date_demande', '-id'], name='demande_date_idx'),
+            models.Index(fields=['statut', '-date_demande', '-id'], name='demande_statut_date_idx'),
+            # Transporteur deliveries per assignee
+            models.Index(fields=['transporteur_livraison', 'statut'], name='demande_transport_idx'),
+            # Participant listings (mes_demandes, participant_dashboard)
+            models.Index(fields=['participant_requerant', '-date_demande'], name='demande_requerant_idx'),
+        ]
 
     def __str__(self):
         return f"Demande #{self.id} - {self.type_materiel}"
 
     def setStatus(self):
         self.statut='validee'
+
+
+class Compteur(models.Model):
+    """Denormalized platform counter, maintained by donations/counters.py"""
+    nom = models.CharField(max_length=50, unique=True)
+    valeur = models.IntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Compteur"
+        verbose_name_plural = "Compteurs"
+
+    def __str__(self):
+        return f"{self.nom} = {self.valeur}"
+
+
+class Sequence(models.Model):
+    """Last number handed out by a named sequence, maintained by donations/sequences.py"""
+    nom = models.CharField(max_length=50, unique=True)
+    dernier = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Séquence"
+        verbose_name_plural = "Séquences"
+
+    def __str__(self):
+        return f"{self.nom} = {self.dernier}"
+
+
+class Blob(models.Model):
+    """A photo file stored once under its content hash, see donations/storage.py"""
+    empreinte = models.CharField(max_length=64, unique=True)  # sha256, hex
+    nom = models.CharField(max_length=100, unique=True)
+    taille = models.PositiveBigIntegerField()
+    # Rows whose photo is this file, and how many uploads it absorbed
+    references = models.IntegerField(default=0)
+    envois = models.PositiveIntegerField(default=0)
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Fichier"
+        verbose_name_plural = "Fichiers"
+        indexes = [
+            models.Index(fields=['references'], name='blob_references_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nom} ({self.references} réf.)"
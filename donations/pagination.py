@@ -0,0 +1,83 @@
+"""
+donations/pagination.py - Keyset (cursor) pagination for dashboard listings
+
+Pages are ordered newest first on ``(date_field, id)`` and the next page is
+fetched with ``WHERE (date, id) < (last_date, last_id)``, so the cost of a
+page does not grow with its position in the listing, unlike OFFSET.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` on ``(-date_field, -id)``, or ``-id`` alone."""
+
+    def __init__(self, queryset, date_field=None, per_page=12):
+        self.queryset = queryset
+        self.date_field = date_field
+        self.per_page = per_page
+
+    @property
+    def ordering(self):
+        if self.date_field:
+            return (f'-{self.date_field}', '-id')
+        return ('-id',)
+
+    def encode(self, obj):
+        key = [obj.id]
+        if self.date_field:
+            key.insert(0, getattr(obj, self.date_field).isoformat())
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    def decode(self, cursor):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if self.date_field:
+                date, pk = key
+                return datetime.fromisoformat(date), int(pk)
+            (pk,) = key
+            return None, int(pk)
+        except (ValueError, TypeError):
+            raise InvalidCursor(cursor)
+
+    def after(self, cursor):
+        date, pk = self.decode(cursor)
+        if not self.date_field:
+            return Q(id__lt=pk)
+        return (Q(**{f'{self.date_field}__lt': date})
+                | Q(**{self.date_field: date, 'id__lt': pk}))
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(cursor))
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode(rows[-1])
+        return KeysetPage(rows, next_cursor)
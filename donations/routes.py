@@ -0,0 +1,262 @@
+"""
+donations/routes.py - Group a transporteur's missions of a day into ordered tours
+
+The stops of a day are the accepted pickups whose ``date_ramassage`` is
+that day and the deliveries whose ``date_livraison`` is that day. They are
+clustered by département, then by ville. A cluster bigger than
+``MAX_STOPS_PER_TOUR`` is split into several tours.
+
+Each tour is ordered by a nearest-neighbour walk from the transporteur's
+address, improved with 2-opt. Pickups with an ``heure_ramassage`` keep
+their chronological order. The other stops are inserted where they add the
+least distance.
+
+There is no geocoding. Distances come from ``DistanceTable``, which reads
+them from an offline CSV of ``code_postal_a,code_postal_b,km`` rows when
+``settings.ROUTE_DISTANCE_TABLE`` is set. Pairs missing from the table are
+estimated from how much of the two addresses the stops share.
+"""
+
+import csv
+from datetime import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .dispatch import code_postal_of
+from .models import DemandeDon, PropositionDon
+
+MAX_STOPS_PER_TOUR = 12
+
+# Estimated km between two stops sharing...
+SAME_CODE_POSTAL_KM = 2
+SAME_VILLE_KM = 6
+SAME_DEPARTEMENT_KM = 25
+OTHER_DEPARTEMENT_KM = 150
+
+ROUTED_DEMANDES = ('validee', 'en_cours', 'en_livraison')
+
+
+class Stop:
+    __slots__ = ('kind', 'mission_id', 'adresse', 'ville', 'code_postal', 'heure')
+
+    def __init__(self, kind, mission_id, adresse, ville, code_postal, heure=None):
+        self.kind = kind
+        self.mission_id = mission_id
+        self.adresse = adresse
+        self.ville = (ville or '').strip()
+        self.code_postal = (code_postal or '').strip()
+        self.heure = heure
+
+    @property
+    def departement(self):
+        return self.code_postal[:2]
+
+    def as_dict(self):
+        return {
+            'type': self.kind,
+            'id': self.mission_id,
+            'adresse': self.adresse,
+            'ville': self.ville,
+            'code_postal': self.code_postal,
+            'heure': self.heure.strftime('%H:%M') if self.heure else None,
+        }
+
+
+class DistanceTable:
+    """Symmetric km between postal codes: the offline table first, then an estimate."""
+
+    def __init__(self, known=None):
+        self.known = {}
+        for (a, b), km in (known or {}).items():
+            self.known[(a, b)] = self.known[(b, a)] = km
+
+    @classmethod
+    def from_csv(cls, path):
+        known = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or not row[2].replace('.', '', 1).isdigit():
+                    continue  # header or malformed line
+                known[(row[0].strip(), row[1].strip())] = float(row[2])
+        return cls(known)
+
+    def between(self, a, b):
+        if a is b:
+            return 0.0
+        km = self.known.get((a.code_postal, b.code_postal))
+        if km is not None:
+            return km
+        if a.code_postal and a.code_postal == b.code_postal:
+            return SAME_CODE_POSTAL_KM
+        if a.ville and a.ville.lower() == b.ville.lower():
+            return SAME_VILLE_KM
+        if a.departement and a.departement == b.departement:
+            return SAME_DEPARTEMENT_KM
+        return OTHER_DEPARTEMENT_KM
+
+
+_default_table = None
+
+
+def default_table():
+    global _default_table
+    if _default_table is None:
+        path = getattr(settings, 'ROUTE_DISTANCE_TABLE', None)
+        _default_table = DistanceTable.from_csv(path) if path else DistanceTable()
+    return _default_table
+
+
+# ============ ORDERING ============
+def length(start, stops, table):
+    points = ([start] if start else []) + stops
+    return sum(table.between(a, b) for a, b in zip(points, points[1:]))
+
+
+def nearest_neighbour(start, stops, table):
+    remaining, route = list(stops), []
+    current = start or (remaining.pop(0) if remaining else None)
+    if start is None and current is not None:
+        route.append(current)
+    while remaining:
+        nearest = min(remaining, key=lambda s: table.between(current, s))
+        remaining.remove(nearest)
+        route.append(nearest)
+        current = nearest
+    return route
+
+
+def two_opt(start, route, table):
+    """Reverse segments of ``route`` while that shortens it (open path from ``start``)."""
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(route) - 1):
+            before = route[i - 1] if i else start
+            for j in range(i + 1, len(route)):
+                after = route[j + 1] if j + 1 < len(route) else None
+                old = ((table.between(before, route[i]) if before else 0)
+                       + (table.between(route[j], after) if after else 0))
+                new = ((table.between(before, route[j]) if before else 0)
+                       + (table.between(route[i], after) if after else 0))
+                if new < old - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+def cheapest_insertion(start, timed, free, table):
+    """Keep ``timed`` in order and insert each ``free`` stop where it adds the least distance."""
+    route = list(timed)
+    for stop in nearest_neighbour(start, free, table):
+        best_position, best_cost = 0, None
+        for position in range(len(route) + 1):
+            before = route[position - 1] if position else start
+            after = route[position] if position < len(route) else None
+            cost = ((table.between(before, stop) if before else 0)
+                    + (table.between(stop, after) if after else 0)
+                    - (table.between(before, after) if before and after else 0))
+            if best_cost is None or cost < best_cost:
+                best_position, best_cost = position, cost
+        route.insert(best_position, stop)
+    return route
+
+
+def order(start, stops, table):
+    timed = sorted((s for s in stops if s.heure), key=lambda s: s.heure)
+    if timed:
+        return cheapest_insertion(start, timed, [s for s in stops if not s.heure], table)
+    return two_opt(start, nearest_neighbour(start, stops, table), table)
+
+
+# ============ PLANNING ============
+class Tour:
+    def __init__(self, stops, distance_km):
+        self.stops = stops
+        self.distance_km = round(distance_km, 1)
+
+    @property
+    def first_appointment(self):
+        return min((s.heure for s in self.stops if s.heure), default=None)
+
+    @property
+    def label(self):
+        villes = sorted({s.ville for s in self.stops if s.ville})
+        return ", ".join(villes) or "Sans ville"
+
+    def as_dict(self):
+        return {'zone': self.label, 'distance_km': self.distance_km,
+                'etapes': [s.as_dict() for s in self.stops]}
+
+
+class DayPlan:
+    def __init__(self, day, tours):
+        self.day = day
+        self.tours = tours
+
+    @property
+    def stop_count(self):
+        return sum(len(t.stops) for t in self.tours)
+
+    @property
+    def distance_km(self):
+        return round(sum(t.distance_km for t in self.tours), 1)
+
+    def as_dict(self):
+        return {'date': self.day.isoformat(), 'distance_km': self.distance_km,
+                'tournees': [t.as_dict() for t in self.tours]}
+
+
+def clusters(stops):
+    """Stops grouped by département then ville, big groups split to MAX_STOPS_PER_TOUR."""
+    groups = {}
+    for stop in stops:
+        groups.setdefault(stop.departement, {}).setdefault(stop.ville.lower(), []).append(stop)
+    for villes in groups.values():
+        pending = []
+        for ville_stops in sorted(villes.values(), key=len, reverse=True):
+            if len(pending) + len(ville_stops) > MAX_STOPS_PER_TOUR and pending:
+                yield pending
+                pending = []
+            pending.extend(ville_stops)
+            while len(pending) > MAX_STOPS_PER_TOUR:
+                yield pending[:MAX_STOPS_PER_TOUR]
+                pending = pending[MAX_STOPS_PER_TOUR:]
+        if pending:
+            yield pending
+
+
+def plan_stops(day, stops, start=None, table=None):
+    table = table or default_table()
+    tours = []
+    for cluster in clusters(stops):
+        route = order(start, cluster, table)
+        tours.append(Tour(route, length(start, route, table)))
+    # Tours with appointments first, earliest first, then the closest tours
+    tours.sort(key=lambda t: (t.first_appointment is None, t.first_appointment or time.min,
+                              table.between(start, t.stops[0]) if start else 0))
+    return DayPlan(day, tours)
+
+
+def stops_for(day, propositions, demandes):
+    """Stops of ``day`` among missions already loaded (e.g. the dashboard's querysets)."""
+    stops = [Stop('ramassage', p.id, p.adresse_ramassage, p.ville, p.code_postal, p.heure_ramassage)
+             for p in propositions if p.date_ramassage == day and p.statut == 'validee']
+    stops += [Stop('livraison', d.id, d.adresse_livraison, d.ville, d.code_postal)
+              for d in demandes if d.date_livraison == day and d.statut in ROUTED_DEMANDES]
+    return stops
+
+
+def start_of(transporteur):
+    code_postal = code_postal_of(transporteur.address)
+    return Stop('depart', transporteur.id, transporteur.address, '', code_postal) if code_postal else None
+
+
+def plan_day(transporteur, day=None, propositions=None, demandes=None):
+    """Tours of ``transporteur`` for ``day`` (default today); loads the missions unless given."""
+    day = day or timezone.localdate()
+    if propositions is None:
+        propositions = PropositionDon.objects.active_for_transporteur(transporteur).filter(date_ramassage=day)
+    if demandes is None:
+        demandes = DemandeDon.objects.active_for_transporteur(transporteur).filter(date_livraison=day)
+    return plan_stops(day, stops_for(day, propositions, demandes), start_of(transporteur))
@@ -0,0 +1,303 @@
+"""
+donations/search.py - Full-text search over propositions, demandes, stock and categories
+
+Every searchable row has one entry in the ``donations_search`` index. The
+entry has a title (``type_materiel`` or the categorie's ``nom``) and a
+body (the descriptions and the ville). Both are normalized with
+``matching.words()`` before they are indexed: lowercased, without accents
+or stopwords, plurals folded to the singular. A search for "tables
+pliantes" therefore finds "Table pliante". Query words are matched as
+prefixes, so "chais" already finds "chaise". The title counts three
+times as much as the body in the ranking.
+
+The index lives in the database, behind a backend picked from the
+connection vendor, or from ``settings.SEARCH_BACKEND`` (a dotted path):
+- ``Fts5Backend``: an SQLite FTS5 virtual table. The rowid encodes
+  (kind, id), so updates and deletes are rowid lookups.
+- ``PostgresBackend``: a table with a weighted ``tsvector`` and a GIN
+  index.
+- ``ScanBackend``: no index. It falls back to ``icontains`` on the
+  models, for other databases.
+
+The signal receivers rewrite an entry in the same transaction as the
+row, so a rolled back save leaves the index untouched. ``bulk_create``
+and ``QuerySet.update()`` send no signal; callers of those use
+``reindex()``, and ``rebuild_search_index`` repairs any drift. The
+migration creating the index only creates it: run that command once
+after migrating a database that already has rows.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .matching import words
+from .models import CategorieObjet, DemandeDon, Don, PropositionDon
+
+TABLE = 'donations_search'
+PER_PAGE = 20
+MAX_PAGE = 50
+BATCH_SIZE = 1000
+
+
+class Source:
+    """A searchable model: which fields go in the title and the body, and where a hit links to."""
+
+    def __init__(self, kind, code, label, model, titre, body, url):
+        self.kind = kind
+        self.code = code
+        self.label = label
+        self.model = model
+        self.titre = titre
+        self.body = body
+        self.url = url
+
+    @property
+    def fields(self):
+        return (self.titre,) + self.body
+
+    def entry(self, values):
+        """(titre, body) as indexed, from a {field: value} mapping."""
+        return ' '.join(words(values[self.titre])), ' '.join(words(*(values[f] for f in self.body)))
+
+    def entries(self, ids):
+        """(id, titre, body) of the rows ``ids``, in one query."""
+        rows = self.model._default_manager.filter(id__in=ids).order_by().values('id', *self.fields)
+        return [(row['id'],) + self.entry(row) for row in rows]
+
+
+SOURCES = {
+    source.kind: source for source in (
+        Source('proposition', 0, "Propositions", PropositionDon, 'type_materiel', ('description', 'ville'),
+               lambda obj: reverse('proposition_detail', args=[obj.id])),
+        Source('demande', 1, "Demandes", DemandeDon, 'type_materiel', ('description_besoin', 'ville'),
+               lambda obj: reverse('demande_detail', args=[obj.id])),
+        Source('don', 2, "Stock", Don, 'type_materiel', ('description', 'reference'),
+               lambda obj: reverse('proposition_detail', args=[obj.proposition_id])),
+        Source('categorie', 3, "Catégories", CategorieObjet, 'nom', ('description',),
+               lambda obj: f"{reverse('stock_list')}?categorie={obj.id}"),
+    )
+}
+BY_CODE = {source.code: source for source in SOURCES.values()}
+KINDS = len(SOURCES)
+
+
+def source_for(model):
+    for source in SOURCES.values():
+        if source.model is model:
+            return source
+    return None
+
+
+# ============ BACKENDS ============
+class Fts5Backend:
+    def rowid(self, source, object_id):
+        return object_id * KINDS + source.code
+
+    def replace(self, cursor, source, entries):
+        self.remove(cursor, source, [object_id for object_id, _, _ in entries])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, titre, body) VALUES (%s, %s, %s)",
+            [(self.rowid(source, object_id), titre, body) for object_id, titre, body in entries])
+
+    def remove(self, cursor, source, ids):
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = [self.rowid(source, object_id) for object_id in ids[start:start + BATCH_SIZE]]
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+    def clear(self, cursor, source):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid %% {KINDS} = %s", [source.code])
+
+    def search(self, cursor, terms, sources, limit, offset):
+        """[(code, id, score, total)] best first."""
+        match = ' '.join(f'"{term}"*' for term in terms)
+        kinds = ', '.join(str(source.code) for source in sources)
+        # bm25() cannot be used next to a window function: score in a subquery
+        cursor.execute(
+            f"SELECT code, object_id, score, COUNT(*) OVER () FROM ("
+            f"SELECT rowid %% {KINDS} AS code, rowid / {KINDS} AS object_id, -bm25({TABLE}, 3.0, 1.0) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s AND rowid %% {KINDS} IN ({kinds})"
+            f") ORDER BY score DESC, object_id DESC LIMIT %s OFFSET %s",
+            [match, limit, offset])
+        return cursor.fetchall()
+
+    def count(self, cursor, terms, sources):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        kinds = ', '.join(str(source.code) for source in sources)
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE {TABLE} MATCH %s AND rowid %% {KINDS} IN ({kinds})",
+                       [match])
+        return cursor.fetchone()[0]
+
+
+class PostgresBackend:
+    DOCUMENT = "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')"
+
+    def replace(self, cursor, source, entries):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (kind, object_id, document) VALUES (%s, %s, {self.DOCUMENT}) "
+            f"ON CONFLICT (kind, object_id) DO UPDATE SET document = EXCLUDED.document",
+            [(source.code, object_id, titre, body) for object_id, titre, body in entries])
+
+    def remove(self, cursor, source, ids):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s AND object_id = ANY(%s)", [source.code, list(ids)])
+
+    def clear(self, cursor, source):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE kind = %s", [source.code])
+
+    def search(self, cursor, terms, sources, limit, offset):
+        query = ' & '.join(f"{term}:*" for term in terms)
+        cursor.execute(
+            f"SELECT kind, object_id, ts_rank(document, q), COUNT(*) OVER () "
+            f"FROM {TABLE}, to_tsquery('simple', %s) q WHERE document @@ q AND kind = ANY(%s) "
+            f"ORDER BY 3 DESC, object_id DESC LIMIT %s OFFSET %s",
+            [query, [source.code for source in sources], limit, offset])
+        return cursor.fetchall()
+
+    def count(self, cursor, terms, sources):
+        query = ' & '.join(f"{term}:*" for term in terms)
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE document @@ to_tsquery('simple', %s) AND kind = ANY(%s)",
+                       [query, [source.code for source in sources]])
+        return cursor.fetchone()[0]
+
+
+class ScanBackend:
+    """No index: every search scans the tables with icontains."""
+
+    def replace(self, cursor, source, entries):
+        pass
+
+    def remove(self, cursor, source, ids):
+        pass
+
+    def clear(self, cursor, source):
+        pass
+
+    def matching(self, terms, sources):
+        for source in sources:
+            q = Q()
+            for term in terms:
+                q &= Q(*[Q(**{f'{field}__icontains': term}) for field in source.fields], _connector=Q.OR)
+            yield source, source.model._default_manager.filter(q).order_by('-id').values_list('id', flat=True)
+
+    def search(self, cursor, terms, sources, limit, offset):
+        rows = [(source.code, object_id, 0.0)
+                for source, ids in self.matching(terms, sources) for object_id in ids[:offset + limit]]
+        total = len(rows)
+        return [row + (total,) for row in rows[offset:offset + limit]]
+
+    def count(self, cursor, terms, sources):
+        return sum(ids.count() for _, ids in self.matching(terms, sources))
+
+
+BACKENDS = {'sqlite': Fts5Backend, 'postgresql': PostgresBackend}
+
+
+def get_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, ScanBackend)()
+
+
+# ============ INDEXING ============
+def reindex(model, ids):
+    """Rewrite the entries of the ``model`` rows ``ids`` (deleted rows are dropped)."""
+    source = source_for(model)
+    ids = list(ids)
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            entries = source.entries(chunk)
+            found = {object_id for object_id, _, _ in entries}
+            backend.remove(cursor, source, [object_id for object_id in chunk if object_id not in found])
+            if entries:
+                backend.replace(cursor, source, entries)
+
+
+def rebuild():
+    """Reindex every searchable row; returns {kind: rows indexed}."""
+    backend, counts = get_backend(), {}
+    with connection.cursor() as cursor:
+        for source in SOURCES.values():
+            backend.clear(cursor, source)
+            ids = list(source.model._default_manager.order_by('id').values_list('id', flat=True))
+            for start in range(0, len(ids), BATCH_SIZE):
+                backend.replace(cursor, source, source.entries(ids[start:start + BATCH_SIZE]))
+            counts[source.kind] = len(ids)
+    return counts
+
+
+def index_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    source = source_for(sender)
+    if raw or (update_fields is not None and not set(update_fields) & set(source.fields)):
+        return
+    entry = source.entry({field: getattr(instance, field) for field in source.fields})
+    with connection.cursor() as cursor:
+        get_backend().replace(cursor, source, [(instance.pk,) + entry])
+
+
+def remove_on_delete(sender, instance, **kwargs):
+    with connection.cursor() as cursor:
+        get_backend().remove(cursor, source_for(sender), [instance.pk])
+
+
+# ============ SEARCH ============
+class Hit:
+    def __init__(self, source, obj, score):
+        self.kind = source.kind
+        self.label = source.label
+        self.obj = obj
+        self.score = score
+        self.url = source.url(obj)
+
+    @property
+    def titre(self):
+        return getattr(self.obj, 'type_materiel', None) or str(self.obj)
+
+    def as_dict(self):
+        return {'type': self.kind, 'id': self.obj.id, 'titre': self.titre, 'url': self.url,
+                'score': round(self.score, 3)}
+
+
+class Results:
+    def __init__(self, query, kinds, page, hits, total, per_page):
+        self.query = query
+        self.kinds = kinds
+        self.page = page
+        self.hits = hits
+        self.total = total
+        self.pages = min(MAX_PAGE, -(-total // per_page))
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    def as_dict(self):
+        return {'q': self.query, 'types': self.kinds, 'page': self.page, 'pages': self.pages,
+                'total': self.total, 'resultats': [hit.as_dict() for hit in self.hits]}
+
+
+def search(query, kinds=None, page=1, per_page=PER_PAGE):
+    """Ranked hits of ``query`` among ``kinds`` (default: all), ``per_page`` at a time."""
+    kinds = [kind for kind in (kinds or SOURCES) if kind in SOURCES] or list(SOURCES)
+    terms = list(dict.fromkeys(words(query)))
+    page = max(1, min(page, MAX_PAGE))
+    if not terms:
+        return Results(query, kinds, page, [], 0, per_page)
+    backend = get_backend()
+    sources = [SOURCES[kind] for kind in kinds]
+    with connection.cursor() as cursor:
+        rows = backend.search(cursor, terms, sources, per_page, (page - 1) * per_page)
+        total = rows[0][3] if rows else backend.count(cursor, terms, sources)
+
+    # One query per kind present in the page
+    wanted = {}
+    for code, object_id, _, _ in rows:
+        wanted.setdefault(code, []).append(object_id)
+    loaded = {code: BY_CODE[code].model._default_manager.in_bulk(ids) for code, ids in wanted.items()}
+    hits = [Hit(BY_CODE[code], loaded[code][object_id], score)
+            for code, object_id, score, _ in rows if object_id in loaded[code]]
+    return Results(query, kinds, page, hits, total, per_page)
@@ -0,0 +1,58 @@
+"""
+donations/sequences.py - Gap-tolerant, concurrency-safe number sequences
+
+A ``Sequence`` row holds the last number a named sequence handed out.
+``reserve(nom, n)`` takes the next ``n`` numbers in one
+``UPDATE ... SET dernier = dernier + n``. That statement holds the row's
+write lock until the transaction ends, so two callers can never receive
+the same number, however many workers run. Reserving a block costs the
+same as reserving one number, which is what bulk intake relies on. A
+rolled back reservation gives its numbers back; one that commits but is
+not used leaves a gap.
+
+Don references are numbered per year: ``DON-<year>-<number>``. The first
+reservation of a year creates its sequence. The sequence starts after
+the highest reference of that year already in the table, so references
+created before the sequences existed are never reused.
+"""
+
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Don, Sequence
+
+REFERENCE_RE = re.compile(r'^DON-(\d{4})-(\d+)$')
+
+
+def reserve(nom, n=1, start=0):
+    """The next ``n`` numbers of sequence ``nom`` as a range; a new sequence begins after ``start``."""
+    if n < 1:
+        return range(0)
+    with transaction.atomic():
+        if not Sequence.objects.filter(nom=nom).update(dernier=F('dernier') + n):
+            try:
+                with transaction.atomic():
+                    Sequence.objects.create(nom=nom, dernier=start + n)
+            except IntegrityError:
+                # Another worker created it first
+                Sequence.objects.filter(nom=nom).update(dernier=F('dernier') + n)
+        last = Sequence.objects.filter(nom=nom).values_list('dernier', flat=True).get()
+    return range(last - n + 1, last + 1)
+
+
+def highest_reference(year):
+    """Highest number among the existing DON-<year>-<number> references."""
+    numbers = [int(match.group(2)) for match in map(REFERENCE_RE.match, Don.objects.filter(
+        reference__startswith=f"DON-{year}-").values_list('reference', flat=True)) if match]
+    return max(numbers, default=0)
+
+
+def don_references(n, year=None):
+    """``n`` fresh Don references for ``year`` (default: the current year)."""
+    year = year or timezone.now().year
+    nom = f"don-reference-{year}"
+    start = 0 if Sequence.objects.filter(nom=nom).exists() else highest_reference(year)
+    return [f"DON-{year}-{number:06d}" for number in reserve(nom, n, start)]
@@ -0,0 +1,82 @@
+"""
+donations/signals.py - Keep platform counters, the category closure, the stock index, the search index, the photo renditions and the photo reference counts in sync with model changes and status transitions
+"""
+
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, pre_save
+
+from . import blobs, categories, counters, images, matching, search, transitions
+from .models import CategorieObjet, Don
+
+
+def _snapshot(instance):
+    return {counter.nom: counter.matches(instance) for counter in counters.counters_for(type(instance))}
+
+
+def remember_counted_state(sender, instance, **kwargs):
+    """Record which counters the row belongs to as loaded, without any query."""
+    instance._counted_state = _snapshot(instance)
+
+
+def update_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = {} if created else getattr(instance, '_counted_state', {})
+    current = _snapshot(instance)
+    for nom, now in current.items():
+        before = previous.get(nom, False)
+        if now is None or before is None:
+            # A tracked field was deferred: leave it to reconcile_counters.
+            continue
+        counters.adjust(nom, int(now) - int(before))
+    instance._counted_state = current
+
+
+def update_counters_on_transition(sender, instance, field, source, **kwargs):
+    """A transition is an UPDATE: compare the row before and after it instead of waiting for post_save."""
+    after = instance.__dict__
+    before = {**after, field: source}
+    for counter in counters.counters_for(sender):
+        was, now = counter.matches_state(before), counter.matches_state(after)
+        if was is not None and now is not None:
+            counters.adjust(counter.nom, int(now) - int(was))
+    instance._counted_state = _snapshot(instance)
+
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    for nom, counted in _snapshot(instance).items():
+        if counted:
+            counters.adjust(nom, -1)
+
+
+def connect():
+    models = {counter.model for counter in counters.COUNTERS.values()}
+    for model in models:
+        uid = f"counters-{model._meta.label_lower}"
+        post_init.connect(remember_counted_state, sender=model, dispatch_uid=uid)
+        post_save.connect(update_counters_on_save, sender=model, dispatch_uid=uid)
+        post_delete.connect(update_counters_on_delete, sender=model, dispatch_uid=uid)
+        transitions.status_changed.connect(update_counters_on_transition, sender=model, dispatch_uid=uid)
+
+    uid = "categories-closure"
+    pre_save.connect(categories.check_parent, sender=CategorieObjet, dispatch_uid=uid)
+    post_save.connect(categories.sync_closure, sender=CategorieObjet, dispatch_uid=uid)
+    pre_delete.connect(categories.detach_children, sender=CategorieObjet, dispatch_uid=uid)
+
+    for model in (Don, CategorieObjet):
+        uid = f"matching-{model._meta.label_lower}"
+        post_save.connect(matching.invalidate, sender=model, dispatch_uid=uid)
+        post_delete.connect(matching.invalidate, sender=model, dispatch_uid=uid)
+
+    for source in search.SOURCES.values():
+        uid = f"search-{source.model._meta.label_lower}"
+        post_save.connect(search.index_on_save, sender=source.model, dispatch_uid=uid)
+        post_delete.connect(search.remove_on_delete, sender=source.model, dispatch_uid=uid)
+
+    for model in images.MODELS:
+        post_save.connect(images.enqueue, sender=model, dispatch_uid=f"images-{model._meta.label_lower}")
+
+    for model in blobs.MODELS:
+        uid = f"blobs-{model._meta.label_lower}"
+        post_init.connect(blobs.remember_photo, sender=model, dispatch_uid=uid)
+        post_save.connect(blobs.update_references_on_save, sender=model, dispatch_uid=uid)
+        post_delete.connect(blobs.update_references_on_delete, sender=model, dispatch_uid=uid)
@@ -0,0 +1,97 @@
+"""
+donations/stock.py - Server-side filters and facet counts for the stock list
+
+Every facet is computed from a single ``GROUP BY categorie, statut, etat,
+lieu_stockage`` aggregate. Its size depends on the number of distinct
+values, not on the number of dons. Each dimension is counted with the
+filters of the other dimensions applied, so a facet shows how many dons
+selecting that value would return. The listing itself is keyset-paginated
+on ``(date_entree_stock, id)``.
+"""
+
+from django.db.models import Count, Q
+
+from .models import Don
+from .pagination import KeysetPaginator
+
+# Value used in query strings for dons without a categorie
+SANS_CATEGORIE = '0'
+
+
+class StockFilter:
+    DIMENSIONS = ('categorie', 'statut', 'etat', 'lieu_stockage')
+
+    def __init__(self, params, per_page=24):
+        self.per_page = per_page
+        self.selected = {
+            'categorie': {v for v in params.getlist('categorie') if v.isdigit()},
+            'statut': {v for v in params.getlist('statut') if v},
+            'etat': {v for v in params.getlist('etat') if v},
+            'lieu_stockage': {v for v in params.getlist('lieu_stockage') if v},
+        }
+
+    @property
+    def active(self):
+        return any(self.selected.values())
+
+    def condition(self):
+        """Q matching the selected values of every dimension."""
+        q = Q()
+        for dimension, values in self.selected.items():
+            if not values:
+                continue
+            if dimension == 'categorie':
+                ids = [int(v) for v in values if v != SANS_CATEGORIE]
+                match = Q(categorie_id__in=ids)
+                if SANS_CATEGORIE in values:
+                    match |= Q(categorie__isnull=True)
+                q &= match
+            else:
+                q &= Q(**{f'{dimension}__in': values})
+        return q
+
+    def page(self, cursor=None):
+        queryset = (Don.objects.filter(self.condition())
+                    .select_related('categorie', 'proposition__participant_donateur'))
+        return KeysetPaginator(queryset, date_field='date_entree_stock', per_page=self.per_page).page(cursor)
+
+    # ============ FACETS ============
+    def _key(self, row, dimension):
+        if dimension == 'categorie':
+            return str(row['categorie']) if row['categorie'] is not None else SANS_CATEGORIE
+        return row[dimension]
+
+    def _matches(self, row, exclude=None):
+        return all(not values or self._key(row, dimension) in values
+                   for dimension, values in self.selected.items() if dimension != exclude)
+
+    def facets(self):
+        """Return ``(total, facets)``: the filtered count and, per dimension, a list of options."""
+        rows = list(Don.objects.order_by()
+                    .values('categorie', 'categorie__nom', 'statut', 'etat', 'lieu_stockage')
+                    .annotate(n=Count('id')))
+        labels = {
+            'categorie': {str(r['categorie']): r['categorie__nom'] for r in rows if r['categorie'] is not None},
+            'statut': dict(Don.STATUT_CHOICES),
+            'etat': dict(Don._meta.get_field('etat').choices),
+            'lieu_stockage': {},
+        }
+        labels['categorie'][SANS_CATEGORIE] = "Non catégorisé"
+
+        facets = {}
+        for dimension in self.DIMENSIONS:
+            counts = {}
+            for row in rows:
+                key = self._key(row, dimension)
+                counts.setdefault(key, 0)
+                if self._matches(row, exclude=dimension):
+                    counts[key] += row['n']
+            facets[dimension] = sorted(
+                ({'value': key,
+                  'label': labels[dimension].get(key, key),
+                  'count': count,
+                  'selected': key in self.selected[dimension]}
+                 for key, count in counts.items() if key),
+                key=lambda option: option['label'].lower())
+        total = sum(row['n'] for row in rows if self._matches(row))
+        return total, facets
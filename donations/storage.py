@@ -0,0 +1,106 @@
+"""
+donations/storage.py - Content-addressed storage for the donation photos
+
+``ContentAddressedStorage`` names every file after the SHA-256 of its
+bytes: ``blobs/<2 first hex digits>/<sha256><ext>``. The name the
+uploader chose only contributes its extension. The upload is hashed while
+it is copied to a temporary file, chunk by chunk, so even a large upload
+is never held in memory. If the content is already stored, the copy is
+dropped and the existing name is returned: the same photo uploaded for
+ten propositions takes the disk space of one.
+
+Each stored file has a ``Blob`` row with its size, how many uploads it
+absorbed (``envois``) and how many rows point to it (``references``,
+kept by donations/blobs.py). Files are never deleted here; the
+``collect_blobs`` command removes the unreferenced ones. The renditions
+donations/images.py derives from a photo are written next to it, under
+their own name, with ``save_rendition()``.
+
+The storage is registered as ``STORAGES['photos']`` and used by the
+``photos`` fields of PropositionDon and Don through ``photo_storage()``.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+
+PREFIX = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+
+def photo_storage():
+    return storages['photos']
+
+
+def blob_name(empreinte, ext):
+    return f"{PREFIX}/{empreinte[:2]}/{empreinte}{ext}"
+
+
+def extension(name):
+    ext = os.path.splitext(name)[1].lower()
+    return ext if 1 < len(ext) <= 6 and ext[1:].isalnum() else ''
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, in _save()
+        return name
+
+    def _spool(self, content, directory):
+        """Copy ``content`` to a temporary file of ``directory``; returns (path, sha256 hex digest, size)."""
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        digest, size = hashlib.sha256(), 0
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in content.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        return tmp, digest.hexdigest(), size
+
+    def _publish(self, tmp, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(tmp, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+        os.replace(tmp, path)
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        tmp = None
+        try:
+            tmp, empreinte, size = self._spool(content, self.path(PREFIX))
+            with transaction.atomic():
+                # The lock makes a concurrent collect_blobs wait, or finish deleting first
+                blob = Blob.objects.select_for_update().filter(empreinte=empreinte).first()
+                if blob is None:
+                    blob, _ = Blob.objects.get_or_create(
+                        empreinte=empreinte, defaults={'nom': blob_name(empreinte, extension(name)), 'taille': size})
+                Blob.objects.filter(pk=blob.pk).update(envois=F('envois') + 1)
+                path = self.path(blob.nom)
+                if not os.path.exists(path):
+                    self._publish(tmp, path)
+        finally:
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+        return blob.nom
+
+    def save_rendition(self, name, content):
+        """Store ``content`` under ``name`` as is, replacing any previous file; returns ``name``.
+
+        Renditions are named after their source (``<sha256>.w320.webp``), not
+        after their own bytes, and have no ``Blob`` row: ``collect_blobs``
+        deletes them with their source.
+        """
+        path = self.path(name)
+        tmp = None
+        try:
+            tmp, _, _ = self._spool(content, os.path.dirname(path))
+            self._publish(tmp, path)
+        finally:
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+        return name
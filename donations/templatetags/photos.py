@@ -0,0 +1,46 @@
+"""
+donations/templatetags/photos.py - Responsive <picture> markup for the proposition and stock photos
+
+    {% load photos %}
+    {% photo don sizes="(max-width: 768px) 100vw, 200px" class="img-thumbnail w-100" %}
+
+renders a WebP ``<source>`` and a JPEG ``<img>``, each with a ``srcset``
+listing every rendition, so the browser downloads the smallest one that
+fills ``sizes``. The blur placeholder is the image background until it
+loads. A photo the pipeline has not processed yet is rendered from the
+original file.
+"""
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from donations import images
+
+register = template.Library()
+
+DEFAULT_SIZES = "100vw"
+
+
+@register.simple_tag
+def photo(obj, sizes=DEFAULT_SIZES, alt="", loading="lazy", style="", **attrs):
+    """``obj`` is a PropositionDon or a Don with a photo; extra keyword arguments become ``<img>`` attributes."""
+    if not obj.photos:
+        return ""
+    alt = alt or getattr(obj, 'type_materiel', "")
+    extra = format_html_join("", ' {}="{}"', sorted(attrs.items()))
+    if not images.is_current(obj):
+        return format_html('<img src="{}" alt="{}" loading="{}" style="{}"{}>',
+                           obj.photos.url, alt, loading, style, extra)
+
+    variantes = obj.photos_variantes
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"'
+        ' style="background: center / cover no-repeat url({}); {}"{}>'
+        '</picture>',
+        images.srcset(variantes, 'webp'), sizes,
+        images.fallback_url(variantes), images.srcset(variantes, 'jpg'), sizes,
+        variantes['width'], variantes['height'], alt, loading,
+        variantes['placeholder'], style, extra,
+    )
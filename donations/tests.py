@@ -1,3 +1,995 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, time, timedelta
+from io import BytesIO, StringIO
+from time import sleep
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from notifications.models import Notification
+from users.models import Membre, Participant, Transporteur
+from . import allocation, benchmarks, blobs, categories, counters, dispatch, images, intake, matching, routes, search, sequences, storage, transitions
+from .context_processors import home_stats
+from .forms import DemandeDonForm
+from .models import Blob, CategorieClosure, CategorieObjet, Compteur, DemandeDon, Don, PropositionDon, Sequence
+from .stock import StockFilter
+
+
+def make_proposition(participant, **kwargs):
+    defaults = dict(
+        participant_donateur=participant,
+        type_materiel="Chaise",
+        description="Chaise en bois",
+        adresse_ramassage="1 rue de la Paix",
+        ville="Paris",
+        code_postal="75001",
+        disponibilite_ramassage="Samedi",
+    )
+    defaults.update(kwargs)
+    return PropositionDon.objects.create(**defaults)
+
+
+def make_demande(participant, **kwargs):
+    defaults = dict(
+        participant_requerant=participant,
+        type_materiel="Chaise",
+        description_besoin="Besoin d'une chaise",
+        adresse_livraison="2 rue de la Paix",
+        ville="Paris",
+        code_postal="75002",
+    )
+    defaults.update(kwargs)
+    return DemandeDon.objects.create(**defaults)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+
+    def value(self, nom):
+        return Compteur.objects.get(nom=nom).valeur
+
+    def test_counters_follow_status_transitions(self):
+        demande = make_demande(self.participant)
+        self.assertEqual(self.value('active_requests'), 1)
+        demande.statut = 'validee'
+        demande.save()
+        self.assertEqual(self.value('active_requests'), 0)
+
+        proposition = make_proposition(self.participant)
+        proposition.statut = 'terminee'
+        proposition.save()
+        self.assertEqual(self.value('completed_missions'), 1)
+        proposition.delete()
+        self.assertEqual(self.value('completed_missions'), 0)
+
+    def test_reloaded_instance_keeps_counter_exact(self):
+        make_demande(self.participant)
+        demande = DemandeDon.objects.get()
+        demande.statut = 'refusee'
+        demande.save()
+        demande.save()
+        self.assertEqual(self.value('active_requests'), 0)
+
+    def test_transporteur_availability(self):
+        transporteur = Transporteur.objects.create(username="bob", vehicule="Camion")
+        self.assertEqual(self.value('total_transporters'), 1)
+        transporteur.disponibilite = False
+        transporteur.save()
+        self.assertEqual(self.value('total_transporters'), 0)
+
+    def test_reconcile_repairs_drift(self):
+        make_demande(self.participant)
+        DemandeDon.objects.update(statut='validee')  # bypasses signals
+        self.assertEqual(self.value('active_requests'), 1)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertEqual(self.value('active_requests'), 0)
+        self.assertIn("active_requests: 1 -> 0", out.getvalue())
+
+    def test_context_processor_is_lazy(self):
+        make_proposition(self.participant)
+        counters.reconcile()
+        request = RequestFactory().get('/')
+        with self.assertNumQueries(0):
+            context = home_stats(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(str(context['total_donations']), "0")
+            self.assertEqual(context['completed_missions'], 0)
+            self.assertEqual(context['platform_stats'].active_requests, 0)
+
+    def test_don_counted_once(self):
+        proposition = make_proposition(self.participant)
+        Don.objects.create(proposition=proposition, type_materiel="Chaise", description="x")
+        self.assertEqual(Compteur.objects.get(nom='total_donations').valeur, 1)
+
+
+class AssociatedDemandeTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.requerant = Participant.objects.create(username="bob")
+
+    def make_rows(self, n):
+        for i in range(n):
+            proposition = make_proposition(self.participant)
+            if i % 2:
+                don = Don.objects.create(proposition=proposition, type_materiel="Chaise", description="x")
+                make_demande(self.requerant, don_attribue=don)
+
+    def list_with_demandes(self):
+        return [(p.categorie, p.transporteur_assignee, p.demande_associee)
+                for p in PropositionDon.objects.with_associated_demande().filter(
+                    participant_donateur=self.participant)]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.make_rows(2)
+        with self.assertNumQueries(2):
+            self.list_with_demandes()
+        self.make_rows(8)
+        with self.assertNumQueries(2):
+            rows = self.list_with_demandes()
+        self.assertEqual(sum(demande is not None for _, _, demande in rows), 5)
+
+    def test_matches_unprefetched_lookup(self):
+        self.make_rows(4)
+        for proposition in PropositionDon.objects.with_associated_demande():
+            expected = DemandeDon.objects.filter(don_attribue__proposition=proposition).first()
+            self.assertEqual(proposition.demande_associee, expected)
+            self.assertEqual(PropositionDon.objects.get(pk=proposition.pk).demande_associee, expected)
+
+
+class BenchmarkTests(TestCase):
+    def test_every_view_runs_on_seeded_data(self):
+        dataset = benchmarks.seed(scale=0.002)
+        results = benchmarks.run(dataset, repeat=1)
+        self.assertEqual(set(results), set(benchmarks.BENCHMARKS))
+        for name in benchmarks.VIEWS:
+            self.assertGreater(results[name]['queries'], 0)
+        # Tour planning is pure computation
+        self.assertEqual(results['plan_stops_1000']['queries'], 0)
+        self.assertGreater(results['plan_stops_1000']['time_ms'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'scale': 1, 'views': {'v': {'queries': 5, 'time_ms': 100, 'peak_kb': 100}}}
+        self.assertEqual(benchmarks.compare({'v': {'queries': 5, 'time_ms': 140, 'peak_kb': 120}}, baseline), [])
+        regressions = benchmarks.compare({'v': {'queries': 6, 'time_ms': 200, 'peak_kb': 200}}, baseline)
+        self.assertEqual(len(regressions), 3)
+
+
+class StockListTests(TestCase):
+    def setUp(self):
+        participant = Participant.objects.create(username="alice")
+        self.client.force_login(Membre.objects.create(username="membre", user_type="membre"))
+        self.meubles = CategorieObjet.objects.create(nom="Meubles")
+        self.livres = CategorieObjet.objects.create(nom="Livres")
+        rows = [(self.meubles, 'en_stock', 'neuf', 'A'), (self.meubles, 'reserve', 'neuf', 'A'),
+                (self.livres, 'en_stock', 'bon_etat', 'B'), (None, 'en_stock', 'neuf', 'B')]
+        for categorie, statut, etat, lieu in rows:
+            Don.objects.create(proposition=make_proposition(participant), categorie=categorie, statut=statut,
+                               etat=etat, lieu_stockage=lieu, type_materiel="Chaise", description="x")
+
+    def get(self, **params):
+        response = self.client.get(reverse('stock_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def counts(self, context, dimension):
+        return {option['value']: option['count'] for option in context['facets'][dimension]}
+
+    def test_filters_and_facets(self):
+        context = self.get(categorie=[self.meubles.id, '0'], statut='en_stock')
+        self.assertEqual(len(context['dons']), 2)
+        self.assertEqual(context['total'], 2)
+        # Each facet is counted with the filters of the other dimensions only
+        self.assertEqual(self.counts(context, 'categorie'),
+                         {str(self.meubles.id): 1, str(self.livres.id): 1, '0': 1})
+        self.assertEqual(self.counts(context, 'statut'), {'en_stock': 2, 'reserve': 1})
+        self.assertEqual(self.counts(context, 'lieu_stockage'), {'A': 1, 'B': 1})
+
+    def test_query_count_is_constant(self):
+        with self.assertNumQueries(4):  # session, user, one page, one facet aggregate
+            context = self.get()
+            self.assertEqual(context['total'], 4)
+            [don.proposition.participant_donateur.username for don in context['dons']]
+
+    def test_pagination(self):
+        first = StockFilter(QueryDict(), per_page=3).page()
+        second = StockFilter(QueryDict(), per_page=3).page(first.next_cursor)
+        self.assertEqual(len(first) + len(second), 4)
+        self.assertFalse(second.has_next)
+
+
+class MatchingTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.meubles = CategorieObjet.objects.create(nom="Meubles")
+        self.chaises = CategorieObjet.objects.create(nom="Chaises", parent=self.meubles)
+        self.livres = CategorieObjet.objects.create(nom="Livres")
+
+    def make_don(self, categorie, type_materiel="Chaise", description="Chaise en bois", code_postal="75001",
+                 **kwargs):
+        proposition = make_proposition(self.participant, code_postal=code_postal)
+        return Don.objects.create(proposition=proposition, categorie=categorie, type_materiel=type_materiel,
+                                  description=description, **kwargs)
+
+    def ids(self, demande):
+        return [m.don.id for m in matching.match(demande)]
+
+    def test_subtree_and_availability(self):
+        in_subcategory = self.make_don(self.chaises)
+        in_category = self.make_don(self.meubles)
+        self.make_don(self.livres, type_materiel="Livre")
+        self.make_don(self.meubles, statut='donne')
+        make_demande(self.participant, don_attribue=self.make_don(self.meubles))
+
+        demande = make_demande(self.participant, categorie_recherchee=self.meubles)
+        self.assertEqual(self.ids(demande), [in_category.id, in_subcategory.id])
+
+    def test_ranking(self):
+        far_and_worn = self.make_don(self.meubles, code_postal="13001", etat='a_reparer')
+        table = self.make_don(self.meubles, type_materiel="Table", description="Table basse")
+        close = self.make_don(self.meubles, code_postal="75002", etat='neuf')
+        demande = make_demande(self.participant, categorie_recherchee=self.meubles,
+                               description_besoin="Chaises pour la cuisine")
+        self.assertEqual(self.ids(demande), [close.id, far_and_worn.id, table.id])
+        best = matching.match(demande)[0]
+        self.assertEqual(best.details['localisation'], 1.0)
+        self.assertLessEqual(best.score, 100)
+
+    def test_quantity_fit(self):
+        one = self.make_don(self.meubles, quantite=1)
+        four = self.make_don(self.meubles, quantite=4)
+        demande = make_demande(self.participant, categorie_recherchee=self.meubles, quantite_desiree=4)
+        self.assertEqual(self.ids(demande), [four.id, one.id])
+
+    def test_without_categorie_matches_on_text(self):
+        chaise = self.make_don(self.livres, description="Chaise pliante")
+        self.make_don(self.livres, type_materiel="Roman", description="Roman policier")
+        demande = make_demande(self.participant, type_materiel="Chaises", description_besoin="")
+        self.assertEqual(self.ids(demande), [chaise.id])
+
+    def test_index_follows_stock_changes(self):
+        demande = make_demande(self.participant, categorie_recherchee=self.meubles)
+        self.assertEqual(self.ids(demande), [])
+        don = self.make_don(self.meubles)
+        self.assertEqual(self.ids(demande), [don.id])
+        # Bulk updates bypass the signals; the final check still drops the don
+        Don.objects.filter(id=don.id).update(statut='vendu')
+        self.assertEqual(self.ids(demande), [])
+
+    def test_view(self):
+        don = self.make_don(self.chaises)
+        demande = make_demande(self.participant, categorie_recherchee=self.meubles)
+        self.client.force_login(Membre.objects.create(username="membre", user_type="membre"))
+        matching.get_index()
+        with self.assertNumQueries(4):  # session, user, demande, ranked dons
+            response = self.client.get(reverse('related_items', args=[demande.id]))
+        self.assertEqual([m.don for m in response.context['matches']], [don])
+        self.assertContains(response, "Correspondance avec la demande")
+
+
+class AllocationTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.meubles = CategorieObjet.objects.create(nom="Meubles")
+        self.chaises = CategorieObjet.objects.create(nom="Chaises", parent=self.meubles)
+        self.livres = CategorieObjet.objects.create(nom="Livres")
+
+    def make_don(self, categorie, quantite=1, **kwargs):
+        return Don.objects.create(proposition=make_proposition(self.participant), categorie=categorie,
+                                  quantite=quantite, type_materiel="Chaise", description="x", **kwargs)
+
+    def make_demande(self, categorie, **kwargs):
+        kwargs.setdefault('statut', 'validee')
+        return make_demande(self.participant, categorie_recherchee=categorie, **kwargs)
+
+    def test_priority_quantity_and_category(self):
+        lot = self.make_don(self.chaises, quantite=4)
+        single = self.make_don(self.meubles)
+        self.make_don(self.meubles, statut='reserve')
+        self.make_don(self.livres)
+        old = self.make_demande(self.meubles, urgence='faible')
+        urgent = self.make_demande(self.meubles, urgence='urgente')
+        big = self.make_demande(self.meubles, quantite_desiree=3)
+        self.make_demande(self.meubles, statut='en_attente')
+
+        result = allocation.plan()
+        self.assertEqual([(d.id, don_id) for d, don_id, _ in result.pairs],
+                         [(urgent.id, single.id), (big.id, lot.id)])
+        self.assertEqual([d.id for d, _ in result.unallocated], [old.id])
+        self.assertEqual(set(result.timings), {'chargement', 'calcul'})
+
+    def test_dry_run_writes_nothing(self):
+        self.make_don(self.meubles)
+        demande = self.make_demande(self.meubles)
+        out = StringIO()
+        call_command('allocate_stock', '--dry-run', stdout=out)
+        self.assertIn(f"Demande #{demande.id}", out.getvalue())
+        self.assertIn("1 attribution(s) proposée(s)", out.getvalue())
+        self.assertIsNone(DemandeDon.objects.get(id=demande.id).don_attribue)
+
+    def test_apply_in_one_transaction(self):
+        dons = [self.make_don(self.meubles) for _ in range(3)]
+        demandes = [self.make_demande(self.meubles) for _ in range(3)]
+        result = allocation.plan()
+        # Attributed by hand after the plan was made: skipped by apply()
+        DemandeDon.objects.filter(id=demandes[0].id).update(don_attribue=dons[2])
+        with self.assertNumQueries(6):  # savepoint, 2 locking reads, 2 bulk updates, release
+            self.assertEqual(allocation.apply(result), 1)
+        self.assertEqual(DemandeDon.objects.get(id=demandes[1].id).don_attribue, dons[1])
+        self.assertEqual(Don.objects.get(id=dons[1].id).statut, 'reserve')
+        self.assertEqual(Don.objects.get(id=dons[0].id).statut, 'en_stock')
+        self.assertIn('ecriture', result.timings)
+
+    def test_view_is_member_only(self):
+        self.make_don(self.meubles)
+        demande = self.make_demande(self.meubles)
+        self.client.force_login(self.participant)
+        self.assertRedirects(self.client.get(reverse('allouer_stock')), reverse('home'),
+                             fetch_redirect_response=False)
+        self.client.force_login(Membre.objects.create(username="membre", user_type="membre"))
+        response = self.client.get(reverse('allouer_stock'))
+        self.assertEqual(len(response.context['allocation']), 1)
+        _, don_id, _ = response.context['allocation'].pairs[0]
+        self.client.post(reverse('allouer_stock'), {'paires': [f"{demande.id}-{don_id}"]})
+        self.assertIsNotNone(DemandeDon.objects.get(id=demande.id).don_attribue)
+
+    def test_view_applies_the_reviewed_pairs(self):
+        don = self.make_don(self.meubles)
+        demande = self.make_demande(self.meubles, urgence='faible')
+        self.client.force_login(Membre.objects.create(username="membre", user_type="membre"))
+        response = self.client.get(reverse('allouer_stock'))
+        self.assertContains(response, f'name="paires" value="{demande.id}-{don.id}"')
+        # A more urgent demande arrives before the member confirms: a fresh plan would give it the don
+        urgent = self.make_demande(self.meubles, urgence='urgente')
+        self.client.post(reverse('allouer_stock'), {'paires': [f"{demande.id}-{don.id}", "x-1"]})
+        self.assertEqual(DemandeDon.objects.get(id=demande.id).don_attribue_id, don.id)
+        self.assertIsNone(DemandeDon.objects.get(id=urgent.id).don_attribue)
+
+    def test_posted_pairs_never_share_a_don(self):
+        don = self.make_don(self.meubles)
+        first, second = self.make_demande(self.meubles), self.make_demande(self.meubles)
+        result = allocation.from_pairs([f"{first.id}-{don.id}", f"{second.id}-{don.id}"])
+        self.assertEqual(allocation.apply(result), 1)
+        self.assertEqual(DemandeDon.objects.filter(don_attribue=don).count(), 1)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        self.maison = CategorieObjet.objects.create(nom="Maison")
+        self.meubles = CategorieObjet.objects.create(nom="Meubles", parent=self.maison)
+        self.chaises = CategorieObjet.objects.create(nom="Chaises", parent=self.meubles)
+        self.loisirs = CategorieObjet.objects.create(nom="Loisirs")
+
+    def closure(self):
+        return set(CategorieClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_single_query_descendants_and_ancestors(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.maison.descendants()), {self.maison, self.meubles, self.chaises})
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.chaises.ancestors()), [self.maison, self.meubles])
+        self.assertEqual(list(self.loisirs.descendants(include_self=False)), [])
+
+    def test_move_and_delete_keep_closure_exact(self):
+        self.meubles.parent = self.loisirs
+        self.meubles.save()
+        self.assertEqual(list(self.chaises.ancestors()), [self.loisirs, self.meubles])
+        self.assertEqual(set(self.maison.descendants()), {self.maison})
+
+        self.meubles.delete()
+        self.assertEqual(list(CategorieObjet.objects.get(pk=self.chaises.pk).ancestors()), [])
+        maintained = self.closure()
+        self.assertEqual(categories.rebuild(), len(maintained))
+        self.assertEqual(self.closure(), maintained)
+
+    def test_cycle_refused(self):
+        self.maison.parent = self.chaises
+        with self.assertRaises(ValueError):
+            self.maison.save()
+        with self.assertRaises(ValidationError):
+            self.maison.full_clean()
+
+    def test_picker_renders_from_cached_tree(self):
+        DemandeDonForm().as_p()
+        with self.assertNumQueries(0):
+            html = DemandeDonForm().as_p()
+        positions = [html.index(label) for label in ("Loisirs", "Maison", "— Meubles", "— — Chaises")]
+        self.assertEqual(positions, sorted(positions))
+        CategorieObjet.objects.create(nom="Livres", parent=self.loisirs)
+        self.assertIn("— Livres", DemandeDonForm().as_p())
+        form = DemandeDonForm(data={'type_materiel': "Chaise", 'categorie_recherchee': self.chaises.pk,
+                                    'description_besoin': "x", 'quantite_desiree': 1, 'urgence': 'faible'})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['categorie_recherchee'], self.chaises)
+
+
+class DispatchTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.paris = Transporteur.objects.create(username="paris", vehicule="Camion", address="3 rue Oberkampf 75011 Paris")
+        self.lyon = Transporteur.objects.create(username="lyon", vehicule="Camion", address="1 quai 69002 Lyon")
+        Transporteur.objects.create(username="absent", vehicule="Camion", disponibilite=False)
+
+    def test_ranking_in_one_query(self):
+        with self.assertNumQueries(1):
+            dispatcher = dispatch.Dispatcher()
+        self.assertEqual([t.username for t in dispatcher.rank('75001', 'Paris')], ["paris", "lyon"])
+        self.assertEqual([t.username for t in dispatcher.rank('69001', 'Lyon')], ["lyon", "paris"])
+
+    def test_workload_and_refusals_count(self):
+        for _ in range(3):
+            make_proposition(self.participant, statut='validee', transporteur_assignee=self.paris,
+                             transporteur_statut='acceptee')
+        make_demande(self.participant, statut='en_cours', transporteur_livraison=self.paris)
+        make_proposition(self.participant, statut='terminee', transporteur_assignee=self.paris)
+        make_proposition(self.participant, statut='validee', transporteur_assignee=self.lyon,
+                         transporteur_statut='refusee')
+        paris, lyon = sorted(dispatch.Dispatcher().transporteurs, key=lambda t: t.username != "paris")
+        self.assertEqual((paris.missions_ouvertes, paris.refus, paris.affectations), (4, 0, 4))
+        self.assertEqual((lyon.missions_ouvertes, lyon.taux_refus), (0, 1.0))
+
+    def test_auto_assign_spreads_the_backlog(self):
+        voisin = Transporteur.objects.create(username="voisin", vehicule="Camion", address="75011 Paris")
+        refused = make_proposition(self.participant, statut='validee', transporteur_assignee=self.paris,
+                                   transporteur_statut='refusee')
+        waiting = [make_proposition(self.participant, statut='validee') for _ in range(3)]
+        demande = make_demande(self.participant, statut='validee')
+
+        preview = dispatch.auto_assign(dry_run=True)
+        self.assertEqual(len(preview), 5)
+        self.assertFalse(Notification.objects.exists())
+
+        membre = Membre.objects.create(username="membre", user_type="membre")
+        result = dispatch.auto_assign(membre=membre)
+        self.assertEqual(result.applied, 5)
+        self.assertEqual(PropositionDon.objects.get(id=refused.id).transporteur_assignee, voisin)
+        assignees = [p.transporteur_assignee_id for p in PropositionDon.objects.filter(id__in=[w.id for w in waiting])]
+        assignees.append(DemandeDon.objects.get(id=demande.id).transporteur_livraison_id)
+        # Both Paris transporteurs share the work; Lyon is too far
+        self.assertEqual(set(assignees), {self.paris.id, voisin.id})
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(len(dispatch.auto_assign()), 0)
+
+    def test_assign_view_lists_ranked_transporteurs(self):
+        demande = make_demande(self.participant, statut='validee', code_postal="69003", ville="Lyon")
+        self.client.force_login(Membre.objects.create(username="membre", user_type="membre"))
+        response = self.client.get(reverse('assign_transporteur_demande', args=[demande.id]))
+        self.assertEqual([t.username for t in response.context['transporteurs']], ["lyon", "paris"])
+        self.assertContains(response, "2 transporteur(s) disponible(s)")
+
+
+class RouteTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.transporteur = Transporteur.objects.create(username="bob", vehicule="Camion",
+                                                        address="3 rue Oberkampf 75011 Paris")
+        self.day = date(2026, 10, 17)
+
+    def test_clusters_by_zone_and_keeps_appointments_in_order(self):
+        make_proposition(self.participant, statut='validee', transporteur_assignee=self.transporteur,
+                         transporteur_statut='acceptee', date_ramassage=self.day, heure_ramassage=time(14), code_postal="75011")
+        make_proposition(self.participant, statut='validee', transporteur_assignee=self.transporteur,
+                         transporteur_statut='acceptee', date_ramassage=self.day, heure_ramassage=time(9), code_postal="75020")
+        make_demande(self.participant, statut='en_livraison', transporteur_livraison=self.transporteur,
+                     date_livraison=self.day, code_postal="75011")
+        make_demande(self.participant, statut='en_livraison', transporteur_livraison=self.transporteur,
+                     date_livraison=self.day, ville="Lyon", code_postal="69002")
+        # Another day and a refused mission are not routed
+        make_proposition(self.participant, statut='validee', transporteur_assignee=self.transporteur,
+                         transporteur_statut='acceptee', date_ramassage=date(2026, 10, 18))
+        make_demande(self.participant, statut='refusee', transporteur_livraison=self.transporteur,
+                     date_livraison=self.day)
+
+        plan = routes.plan_day(self.transporteur, self.day)
+        self.assertEqual(plan.stop_count, 4)
+        paris, lyon = plan.tours
+        self.assertEqual(lyon.label, "Lyon")
+        heures = [s.heure for s in paris.stops if s.heure]
+        self.assertEqual(heures, [time(9), time(14)])
+
+    def test_distance_table_overrides_the_estimate(self):
+        a = routes.Stop('livraison', 1, '', 'Paris', '75001')
+        b = routes.Stop('livraison', 2, '', 'Paris', '75020')
+        self.assertEqual(routes.DistanceTable().between(a, b), routes.SAME_VILLE_KM)
+        self.assertEqual(routes.DistanceTable({('75020', '75001'): 9.5}).between(a, b), 9.5)
+
+    def test_thousand_stops_are_all_planned(self):
+        # The same plan benchmark_views times as plan_stops_1000
+        plan = benchmarks.plan_stops(None)()
+        self.assertEqual(sorted(s.mission_id for t in plan.tours for s in t.stops), list(range(1000)))
+        self.assertTrue(all(len(t.stops) <= routes.MAX_STOPS_PER_TOUR for t in plan.tours))
+
+    def test_json_endpoint(self):
+        make_demande(self.participant, statut='validee', transporteur_livraison=self.transporteur,
+                     date_livraison=self.day)
+        url = reverse('tournees_transporteur')
+        self.client.force_login(self.transporteur)
+        response = self.client.get(url, {'date': '2026-10-17'})
+        self.assertEqual(response.json()['date'], '2026-10-17')
+        self.assertEqual(len(response.json()['tournees'][0]['etapes']), 1)
+        self.assertEqual(self.client.get(url, {'date': '17/10/2026'}).status_code, 400)
+        self.client.force_login(self.participant)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.membre = Membre.objects.create(username="membre", user_type="membre")
+
+    def test_accents_plurals_and_prefixes(self):
+        table = make_proposition(self.participant, type_materiel="Table pliante", description="Pieds en métal")
+        make_demande(self.participant, type_materiel="Vêtements", description_besoin="Pour l'hiver", ville="Évry")
+        self.assertEqual([h.obj for h in search.search("tables pliantes").hits], [table])
+        self.assertEqual([h.obj for h in search.search("METAL").hits], [table])
+        self.assertEqual([h.kind for h in search.search("vetement evry").hits], ['demande'])
+        self.assertEqual([h.obj for h in search.search("pli").hits], [table])
+        self.assertEqual(search.search("le la des").total, 0)
+
+    def test_title_ranks_above_body_and_kinds_filter(self):
+        in_body = make_proposition(self.participant, type_materiel="Meuble", description="Une armoire ancienne")
+        in_title = make_proposition(self.participant, type_materiel="Armoire", description="En chêne")
+        categorie = CategorieObjet.objects.create(nom="Armoires")
+        ranked = [h.obj for h in search.search("armoire").hits]
+        self.assertEqual((set(ranked[:2]), ranked[2]), ({in_title, categorie}, in_body))
+        self.assertEqual([h.obj for h in search.search("armoire", ['categorie']).hits], [categorie])
+
+    def test_index_follows_saves_deletes_and_rollbacks(self):
+        proposition = make_proposition(self.participant, type_materiel="Canapé")
+        proposition.type_materiel = "Fauteuil"
+        proposition.save()
+        self.assertEqual(search.search("canape").total, 0)
+        self.assertEqual(search.search("fauteuil").total, 1)
+        try:
+            with transaction.atomic():
+                make_proposition(self.participant, type_materiel="Lampe")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(search.search("lampe").total, 0)
+        proposition.delete()
+        self.assertEqual(search.search("fauteuil").total, 0)
+
+    def test_pagination_and_rebuild(self):
+        for i in range(25):
+            make_demande(self.participant, type_materiel=f"Chaise {i}")
+        first = search.search("chaise", per_page=10)
+        self.assertEqual((first.total, first.pages, len(first.hits), first.has_next), (25, 3, 10, True))
+        last = search.search("chaise", page=3, per_page=10)
+        self.assertEqual(len(last.hits), 5)
+        self.assertEqual(search.search("chaise", page=4, per_page=10).total, 25)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.TABLE}")
+        self.assertEqual(search.search("chaise").total, 0)
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("demande 25", out.getvalue())
+        self.assertEqual(search.search("chaise").total, 25)
+
+    def test_one_query_for_the_ranking(self):
+        for i in range(30):
+            make_proposition(self.participant, type_materiel="Vélo", description=f"Vélo numéro {i}")
+        with self.assertNumQueries(2):  # the ranked page with its total, then the propositions
+            results = search.search("velo")
+        self.assertEqual(results.total, 30)
+
+    def test_endpoint(self):
+        make_proposition(self.participant, type_materiel="Réfrigérateur")
+        url = reverse('recherche')
+        self.client.force_login(self.participant)
+        self.assertEqual(self.client.get(url, {'q': 'frigo', 'format': 'json'}).status_code, 403)
+        self.client.force_login(self.membre)
+        data = self.client.get(url, {'q': 'refrigerateur', 'format': 'json'}).json()
+        self.assertEqual((data['total'], data['resultats'][0]['type']), (1, 'proposition'))
+        response = self.client.get(url, {'q': 'refrigerateur', 'type': 'don'})
+        self.assertContains(response, "0 résultat(s)")
+        self.assertContains(self.client.get(url, {'q': 'refrigerateur'}), "Réfrigérateur")
+
+
+class IntakeTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.membre = Membre.objects.create(username="membre", user_type="membre")
+
+    def test_references_are_sequential_and_skip_existing(self):
+        year = timezone.now().year
+        Don.objects.create(proposition=make_proposition(self.participant), reference=f"DON-{year}-000041",
+                           type_materiel="Chaise", description="x")
+        first = Don.objects.create(proposition=make_proposition(self.participant), type_materiel="Table",
+                                   description="x")
+        self.assertEqual(first.reference, f"DON-{year}-000042")
+        self.assertEqual(sequences.don_references(3), [f"DON-{year}-0000{n}" for n in (43, 44, 45)])
+        self.assertEqual(sequences.don_references(1, year=2001), ["DON-2001-000001"])
+
+    def test_bulk_intake_in_one_insert(self):
+        propositions = [make_proposition(self.participant, type_materiel=f"Chaise {i}", donator_gives=True)
+                        for i in range(20)]
+        pending = make_proposition(self.participant)
+        matching.stock_version()
+        version = matching.stock_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            dons = intake.stock_propositions(propositions + [pending])
+        self.assertEqual(len(dons), 20)
+        self.assertEqual(len({don.reference for don in dons}), 20)
+        self.assertFalse(Don.objects.filter(proposition=pending).exists())
+        self.assertEqual(Compteur.objects.get(nom='total_donations').valeur, 20)
+        self.assertEqual(search.search("chaise", ['don']).total, 20)
+        self.assertGreater(matching.stock_version(), version)
+        # Already stocked: nothing left to do
+        self.assertEqual(intake.stock_propositions(propositions), [])
+
+        ids = [make_proposition(self.participant, donator_gives=True).id for _ in range(50)]
+        with self.assertNumQueries(13):  # independent of the number of propositions
+            intake.stock_propositions(ids)
+
+    def test_locked_query_has_no_outer_join(self):
+        proposition = make_proposition(self.participant, donator_gives=True)
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            self.assertEqual(intake.stockable([proposition]), [proposition])
+        select, = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertNotIn("JOIN", select)
+
+    def test_ajouter_au_stock_twice(self):
+        proposition = make_proposition(self.participant, donator_gives=True)
+        self.client.force_login(self.membre)
+        url = reverse('ajouter_au_stock', args=[proposition.id])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(Don.objects.filter(proposition=proposition).count(), 1)
+
+    def test_command(self):
+        make_proposition(self.participant, donator_gives=True)
+        make_proposition(self.participant)
+        out = StringIO()
+        call_command('stock_propositions', stdout=out)
+        self.assertIn("1 don(s) ajouté(s) au stock.", out.getvalue())
+        self.assertEqual(Don.objects.count(), 1)
+
+
+class SequenceConcurrencyTests(TransactionTestCase):
+    WORKERS = 8
+    ROUNDS = 25
+
+    def reserve_many(self, results, errors):
+        try:
+            for _ in range(self.ROUNDS):
+                for attempt in range(100):
+                    try:
+                        results.extend(sequences.reserve('stress', 3))
+                        break
+                    except OperationalError:  # SQLite: the table is locked by another writer
+                        sleep(0.001 * (attempt + 1))
+                else:
+                    raise AssertionError("sequence still locked after 100 attempts")
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def test_parallel_reservations_are_unique_and_contiguous(self):
+        results, errors = [], []
+        threads = [threading.Thread(target=self.reserve_many, args=(results, errors))
+                   for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        total = self.WORKERS * self.ROUNDS * 3
+        self.assertEqual(sorted(results), list(range(1, total + 1)))
+        self.assertEqual(Sequence.objects.get(nom='stress').dernier, total)
+
+
+def jpeg_with_exif(width, height, orientation=6):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x8825] = {2: (48.0, 51.0, 24.0)}  # GPSLatitude
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'JPEG', exif=exif)
+    return SimpleUploadedFile("chaise.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.participant = Participant.objects.create(username="alice")
+
+    def test_strips_exif_orients_and_writes_renditions(self):
+        proposition = make_proposition(self.participant, photos=jpeg_with_exif(1600, 700))
+        self.assertTrue(images.process_row(PropositionDon, proposition.id))
+        proposition.refresh_from_db()
+        variantes = proposition.photos_variantes
+        self.assertEqual((variantes['width'], variantes['height']), (700, 1600))
+        self.assertEqual(variantes['widths'], [160, 320, 640])
+        self.assertTrue(variantes['placeholder'].startswith("data:image/webp;base64,"))
+        self.assertLess(len(variantes['placeholder']), 400)
+
+        with Image.open(proposition.photos.path) as original:
+            self.assertEqual(original.size, (700, 1600))
+            self.assertEqual(dict(original.getexif()), {})
+        for width in variantes['widths']:
+            for ext in ('webp', 'jpg'):
+                with default_storage.open(images.variant_name(proposition.photos.name, width, ext)) as f:
+                    self.assertEqual(Image.open(f).width, width)
+        # Already current: nothing to redo
+        self.assertFalse(images.process_row(PropositionDon, proposition.id))
+
+    def test_renditions_follow_the_photo_storage(self):
+        photos = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, photos)
+        override = override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'photos': {'BACKEND': 'donations.storage.ContentAddressedStorage',
+                       'OPTIONS': {'location': photos, 'base_url': '/photos/'}},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        # The field resolved photo_storage() when the model was defined
+        patch = mock.patch.object(PropositionDon._meta.get_field('photos'), 'storage', storage.photo_storage())
+        patch.start()
+        self.addCleanup(patch.stop)
+        proposition = make_proposition(self.participant, photos=jpeg_with_exif(400, 300, orientation=1))
+        images.process_row(PropositionDon, proposition.id)
+        proposition.refresh_from_db()
+        variantes = proposition.photos_variantes
+        rendition = images.variant_name(variantes['source'], 320, 'webp')
+        self.assertTrue(os.path.exists(os.path.join(photos, rendition)))
+        self.assertEqual(os.listdir(self.media), [])
+        self.assertIn(f"/photos/{rendition} 320w", images.srcset(variantes, 'webp'))
+        self.assertEqual(images.fallback_url(variantes), f"/photos/{images.variant_name(variantes['source'], 320, 'jpg')}")
+        # Collected with their source once nothing points to it
+        proposition.delete()
+        blobs.collect(min_age=timedelta(0))
+        self.assertFalse(os.path.exists(os.path.join(photos, rendition)))
+
+    def test_small_photo_is_not_upscaled(self):
+        proposition = make_proposition(self.participant, photos=jpeg_with_exif(100, 80, orientation=1))
+        images.process_row(PropositionDon, proposition.id)
+        proposition.refresh_from_db()
+        self.assertEqual(proposition.photos_variantes['widths'], [100])
+
+    def test_processed_after_commit_and_shared_with_the_don(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            proposition = make_proposition(self.participant, donator_gives=True, photos=jpeg_with_exif(900, 600))
+        self.assertEqual(len(callbacks), 1)
+        don = intake.stock_proposition(proposition)
+        self.assertEqual(list(images.pending(Don)), [don.id])
+
+        out = StringIO()
+        call_command('process_images', stdout=out)
+        self.assertIn("1 photo(s) traitée(s).", out.getvalue())
+        don.refresh_from_db()
+        self.assertEqual(don.photos_variantes['widths'], [160, 320])
+        self.assertEqual(list(images.pending(PropositionDon)), [])
+
+    def test_template_tag(self):
+        proposition = make_proposition(self.participant, type_materiel="Chaise",
+                                       photos=jpeg_with_exif(900, 600, orientation=1))
+        template = Template('{% load photos %}{% photo obj sizes="240px" class="img-thumbnail" %}')
+        html = template.render(Context({'obj': proposition}))
+        self.assertInHTML(f'<img src="{proposition.photos.url}" alt="Chaise" loading="lazy" style="" '
+                          f'class="img-thumbnail">', html)
+
+        images.process_row(PropositionDon, proposition.id)
+        proposition.refresh_from_db()
+        html = template.render(Context({'obj': proposition}))
+        self.assertIn('<source type="image/webp" srcset="/media/blobs/', html)
+        self.assertIn('.w160.webp 160w, ', html)
+        self.assertIn('.w640.jpg 640w" sizes="240px" width="900" height="600"', html)
+        self.assertEqual(template.render(Context({'obj': make_proposition(self.participant)})), "")
+
+
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.participant = Participant.objects.create(username="alice")
+
+    def upload(self, content, name="photo.JPG"):
+        return make_proposition(self.participant, photos=SimpleUploadedFile(name, content))
+
+    def test_identical_uploads_are_stored_once(self):
+        content = b"x" * 1000
+        first, second = self.upload(content), self.upload(content, name="autre.jpg")
+        empreinte = hashlib.sha256(content).hexdigest()
+        self.assertEqual(first.photos.name, f"blobs/{empreinte[:2]}/{empreinte}.jpg")
+        self.assertEqual(second.photos.name, first.photos.name)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.taille, blob.envois, blob.references), (1000, 2, 2))
+        self.assertEqual(blobs.saved_bytes(), 1000)
+        self.assertEqual(os.listdir(os.path.dirname(first.photos.path)), [f"{empreinte}.jpg"])
+
+    def test_large_upload_is_hashed_in_chunks(self):
+        content = os.urandom(storage.CHUNK_SIZE * 5 + 123)
+        source = BytesIO(content)
+        reads = []
+        read = source.read
+        source.read = lambda size=-1: reads.append(size) or read(size)
+        name = storage.photo_storage().save("grande.png", File(source))
+        self.assertEqual(name, storage.blob_name(hashlib.sha256(content).hexdigest(), ".png"))
+        self.assertTrue(all(0 < size <= storage.CHUNK_SIZE for size in reads))
+        with storage.photo_storage().open(name) as f:
+            self.assertEqual(f.read(), content)
+
+    def test_references_follow_replacements_deletions_and_intake(self):
+        a, b = b"a" * 10, b"b" * 10
+        proposition = self.upload(a)
+        proposition.photos = SimpleUploadedFile("b.jpg", b)
+        proposition.donator_gives = True
+        proposition.save()
+        self.assertEqual(dict(Blob.objects.values_list('nom', 'references')),
+                         {storage.blob_name(hashlib.sha256(a).hexdigest(), ".jpg"): 0,
+                          proposition.photos.name: 1})
+        intake.stock_proposition(proposition)
+        self.assertEqual(Blob.objects.get(nom=proposition.photos.name).references, 2)
+        proposition.delete()  # cascades to the Don
+        self.assertEqual(Blob.objects.get(nom=proposition.photos.name).references, 0)
+
+    def test_collect_deletes_unreferenced_files_and_renditions(self):
+        kept = self.upload(jpeg_with_exif(400, 300).read(), name="kept.jpg")
+        gone = self.upload(b"gone" * 100)
+        images.process_row(PropositionDon, kept.id)
+        kept.refresh_from_db()
+        raw, clean = Blob.objects.exclude(nom=gone.photos.name).order_by('references')
+        self.assertEqual((raw.references, clean.nom), (0, kept.photos.name))
+        gone_path = gone.photos.path
+        gone.delete()
+        PropositionDon.objects.filter(pk=kept.pk).update(photos=raw.nom)  # drift: no signal
+
+        out = StringIO()
+        call_command('collect_blobs', '--min-age-hours=0', stdout=out)
+        self.assertIn(f"{raw.nom}: 0 -> 1 référence(s)", out.getvalue())
+        self.assertFalse(os.path.exists(gone_path))
+        self.assertFalse(Blob.objects.filter(nom=gone.photos.name).exists())
+        # The cleaned photo lost its only row: its renditions go with it
+        self.assertEqual(os.listdir(os.path.dirname(os.path.join(self.media, clean.nom))), [])
+        self.assertTrue(default_storage.exists(raw.nom))
+
+    def test_collect_keeps_young_files(self):
+        self.upload(b"young").delete()
+        run = blobs.collect()
+        self.assertEqual((run.blobs, run.files), (0, 0))
+        self.assertEqual(Blob.objects.count(), 1)
+
+
+class TransitionTests(TestCase):
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.membre = Membre.objects.create(username="membre", user_type="membre")
+        self.transporteur = Transporteur.objects.create(username="bob", vehicule="Camion")
+
+    def value(self, nom):
+        return Compteur.objects.get(nom=nom).valeur
+
+    def test_one_conditional_update_of_the_event_columns(self):
+        proposition = make_proposition(self.participant)
+        PropositionDon.objects.filter(pk=proposition.pk).update(description="Modifiée entre-temps")
+        with CaptureQueriesContext(connection) as queries:
+            transitions.transition(proposition, 'valider', membre_validateur=self.membre)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "donations_propositiondon"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"statut" = \'en_attente\'', updates[0].split('WHERE')[1])
+        self.assertNotIn('"description"', updates[0])
+        proposition.refresh_from_db()
+        self.assertEqual((proposition.statut, proposition.membre_validateur), ('validee', self.membre))
+        self.assertIsNotNone(proposition.date_validation)
+        self.assertEqual(proposition.description, "Modifiée entre-temps")
+
+    def test_conflict_leaves_the_row_untouched(self):
+        demande = make_demande(self.participant)
+        stale = DemandeDon.objects.get(pk=demande.pk)
+        transitions.transition(demande, 'valider', membre_validateur=self.membre)
+        with self.assertRaises(transitions.TransitionError) as raised:
+            transitions.transition(stale, 'refuser', membre_validateur=self.membre, raison_refus="Doublon")
+        self.assertEqual(raised.exception.current, 'validee')
+        self.assertIn("« Validée »", raised.exception.message)
+        demande.refresh_from_db()
+        self.assertEqual((demande.statut, demande.raison_refus), ('validee', ''))
+        self.assertEqual(stale.statut, 'en_attente')
+
+        DemandeDon.objects.filter(pk=demande.pk).delete()
+        with self.assertRaises(transitions.TransitionError) as raised:
+            transitions.transition(demande, 'livrer')
+        self.assertIsNone(raised.exception.current)
+
+    def test_stale_answer_after_reassignment(self):
+        carol = Transporteur.objects.create(username="carol", vehicule="Camionnette")
+        proposition = make_proposition(self.participant)
+        transitions.transition(proposition, 'assigner', transporteur_assignee=self.transporteur)
+        stale = PropositionDon.objects.get(pk=proposition.pk)
+        transitions.transition(proposition, 'assigner', transporteur_assignee=carol)
+        with self.assertRaises(transitions.TransitionError) as raised:
+            transitions.transition(stale, 'accepter_mission')
+        self.assertEqual(raised.exception.changed, ('transporteur_assignee',))
+        self.assertIn("modifié entre-temps", raised.exception.message)
+        proposition.refresh_from_db()
+        self.assertEqual((proposition.transporteur_assignee, proposition.transporteur_statut), (carol, 'en_attente'))
+
+        demande = make_demande(self.participant, statut='validee', transporteur_livraison=self.transporteur)
+        stale = DemandeDon.objects.get(pk=demande.pk)
+        transitions.transition(demande, 'assigner', transporteur_livraison=carol)
+        for event in ('accepter_mission', 'livrer', 'refuser_mission'):
+            with self.assertRaises(transitions.TransitionError):
+                transitions.transition(stale, event)
+        demande.refresh_from_db()
+        self.assertEqual((demande.statut, demande.transporteur_livraison), ('validee', carol))
+        transitions.transition(demande, 'accepter_mission')
+        self.assertEqual(demande.statut, 'en_cours')
+
+    def test_refused_without_query(self):
+        proposition = make_proposition(self.participant, statut='terminee')
+        self.assertFalse(transitions.allowed(proposition, 'valider'))
+        with self.assertNumQueries(0), self.assertRaises(transitions.TransitionError):
+            transitions.transition(proposition, 'valider')
+        with self.assertRaises(TypeError):
+            transitions.transition(make_proposition(self.participant), 'valider', statut='terminee')
+
+    def test_signal_and_counters(self):
+        received = []
+
+        def receiver(sender, event, source, target, **kwargs):
+            received.append((sender, event, source, target))
+
+        transitions.status_changed.connect(receiver)
+        self.addCleanup(transitions.status_changed.disconnect, receiver)
+        demande = make_demande(self.participant)
+        proposition = make_proposition(self.participant, statut='validee')
+        self.assertEqual(self.value('active_requests'), 1)
+        transitions.transition(demande, 'valider')
+        transitions.transition(proposition, 'terminer')
+        self.assertEqual(self.value('active_requests'), 0)
+        self.assertEqual(self.value('completed_missions'), 1)
+        self.assertEqual(received, [(DemandeDon, 'valider', 'en_attente', 'validee'),
+                                    (PropositionDon, 'terminer', 'validee', 'terminee')])
+        # A later save() of the same instance does not count it twice
+        proposition.save()
+        self.assertEqual(self.value('completed_missions'), 1)
+        self.assertEqual(counters.reconcile()['completed_missions'], (1, 1))
+
+    def test_dashboard_accepts_once(self):
+        demande = make_demande(self.participant, statut='validee', transporteur_livraison=self.transporteur)
+        self.client.force_login(self.transporteur)
+        url = reverse('transporteur_dashboard')
+        self.client.post(url, {'action': 'accepter_demande', 'demande_id': demande.id})
+        demande.refresh_from_db()
+        self.assertEqual((demande.statut, demande.transporteur_confirme), ('en_cours', True))
+        response = self.client.post(url, {'action': 'accepter_demande', 'demande_id': demande.id})
+        self.assertIn("action impossible", str(list(get_messages(response.wsgi_request))[-1]))
+
+        self.client.post(url, {'action': 'terminer_demande', 'demande_id': demande.id})
+        demande.refresh_from_db()
+        self.assertEqual(demande.statut, 'terminee')
+        self.assertEqual(demande.date_livraison, timezone.localdate())
+
+    def test_confirmer_reception(self):
+        demande = make_demande(self.participant, statut='terminee')
+        self.client.force_login(self.participant)
+        self.client.get(reverse('confirmer_reception_demande', args=[demande.id]))
+        demande.refresh_from_db()
+        self.assertTrue(demande.demandeur_confirme_reception)
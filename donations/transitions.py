@@ -0,0 +1,192 @@
+"""
+donations/transitions.py - Declarative status transitions, each written with one conditional UPDATE
+
+``TRANSITIONS`` lists, per model, the events a row can go through: which
+status field the event moves, from which states, to which state, and
+which other columns it writes. ``transition(obj, 'valider', ...)``
+applies one:
+
+    UPDATE donations_propositiondon
+       SET statut = 'validee', date_validation = ..., membre_validateur_id = ...
+     WHERE id = 42 AND statut = 'en_attente'
+
+The expected state is the one ``obj`` was loaded with, i.e. the one the
+user acted on. An event can also guard other columns: a transporteur's
+answer carries ``AND transporteur_livraison_id = <loaded>``, so it cannot
+land on a mission reassigned to someone else in the meantime. If another
+request changed the row in between, no row matches: nothing is written
+and ``TransitionError`` reports what changed. Only the event's columns
+are written, so a concurrent edit of other fields is never overwritten
+by a stale copy.
+
+``QuerySet.update()`` sends no ``post_save``. Every applied transition
+sends ``status_changed`` instead, in the same transaction; the platform
+counters follow it (donations/signals.py).
+"""
+
+from django.contrib import messages
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import DemandeDon, PropositionDon
+
+# sender=model, instance, event, field, source, target
+status_changed = Signal()
+
+
+class TransitionError(Exception):
+    """``event`` cannot apply: the row is not, or no longer, in one of its source states.
+
+    ``current`` is the state found, None if the row was deleted;
+    ``changed`` lists the guard columns that no longer hold their loaded value.
+    """
+
+    def __init__(self, instance, event, current, changed=()):
+        self.instance = instance
+        self.event = event
+        self.current = current
+        self.changed = tuple(changed)
+        super().__init__(f"{type(instance).__name__} #{instance.pk}: {event} impossible from {current!r}"
+                         + (f", {', '.join(self.changed)} changed" if self.changed else ""))
+
+    @property
+    def message(self):
+        """User-facing explanation, in French."""
+        nom = f"{self.instance._meta.verbose_name.capitalize()} #{self.instance.pk}"
+        if self.current is None:
+            return f"{nom} n'existe plus."
+        if self.changed:
+            labels = ", ".join(str(self.instance._meta.get_field(name).verbose_name) for name in self.changed)
+            return f"{nom} : action impossible, modifié entre-temps ({labels})."
+        field = TRANSITIONS[type(self.instance)][self.event].field
+        label = dict(self.instance._meta.get_field(field).choices).get(self.current, self.current)
+        return f"{nom} : action impossible, son statut est « {label} »."
+
+
+class Transition:
+    """``field`` goes from one of ``sources`` to ``target``.
+
+    ``sets`` are written by every application (a callable is called each
+    time); ``params`` are the columns the caller passes to ``transition()``;
+    ``guards`` must still hold the value ``obj`` was loaded with.
+    """
+
+    def __init__(self, field, sources, target, sets=None, params=(), guards=()):
+        self.field = field
+        self.sources = tuple(sources)
+        self.target = target
+        self.sets = sets or {}
+        self.params = tuple(params)
+        self.guards = tuple(guards)
+
+    def values(self, params):
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise TypeError(f"unexpected column(s) for this transition: {', '.join(sorted(unknown))}")
+        values = {name: value() if callable(value) else value for name, value in self.sets.items()}
+        values.update(params)
+        values[self.field] = self.target
+        return values
+
+    def expected(self, instance, source):
+        """The WHERE conditions besides the pk: the loaded status and guard values."""
+        expected = {self.field: source}
+        for name in self.guards:
+            attname = instance._meta.get_field(name).attname
+            expected[attname] = getattr(instance, attname)
+        return expected
+
+
+# The transporteur answering must still be the one assigned
+PROPOSITION_MISSION = ('transporteur_assignee',)
+DEMANDE_MISSION = ('transporteur_livraison',)
+
+TRANSITIONS = {
+    PropositionDon: {
+        'valider': Transition('statut', ['en_attente'], 'validee',
+                              sets={'date_validation': timezone.now}, params=['membre_validateur']),
+        'refuser': Transition('statut', ['en_attente'], 'refusee',
+                              sets={'date_validation': timezone.now}, params=['membre_validateur', 'raison_refus']),
+        # A (re)assignment waits for the new transporteur's answer
+        'assigner': Transition('statut', ['en_attente', 'validee'], 'validee',
+                               sets={'date_validation': timezone.now, 'transporteur_statut': 'en_attente'},
+                               params=['membre_validateur', 'transporteur_assignee']),
+        'accepter_mission': Transition('transporteur_statut', ['en_attente'], 'acceptee',
+                                       guards=PROPOSITION_MISSION),
+        'refuser_mission': Transition('transporteur_statut', ['en_attente', 'acceptee'], 'refusee',
+                                      params=['raison_refus_transporteur'], guards=PROPOSITION_MISSION),
+        'terminer': Transition('statut', ['validee', 'ramassee'], 'terminee', params=['date_validation'],
+                               guards=PROPOSITION_MISSION),
+    },
+    DemandeDon: {
+        'valider': Transition('statut', ['en_attente'], 'validee',
+                              sets={'date_validation': timezone.now}, params=['membre_validateur']),
+        'refuser': Transition('statut', ['en_attente'], 'refusee',
+                              sets={'date_validation': timezone.now}, params=['membre_validateur', 'raison_refus']),
+        'assigner': Transition('statut', ['en_attente', 'validee'], 'validee',
+                               sets={'date_validation': timezone.now, 'transporteur_confirme': False},
+                               params=['membre_validateur', 'transporteur_livraison']),
+        'accepter_mission': Transition('statut', ['validee'], 'en_cours',
+                                       sets={'transporteur_confirme': True, 'transporteur_date_reponse': timezone.now},
+                                       guards=DEMANDE_MISSION),
+        # The demande goes back to the members, without transporteur
+        'refuser_mission': Transition('statut', ['validee', 'en_cours'], 'validee',
+                                      sets={'transporteur_livraison': None, 'transporteur_confirme': False,
+                                            'transporteur_date_reponse': timezone.now},
+                                      params=['transporteur_raison_refus'], guards=DEMANDE_MISSION),
+        'demarrer': Transition('statut', ['validee', 'en_cours'], 'en_livraison', guards=DEMANDE_MISSION),
+        'livrer': Transition('statut', ['validee', 'en_cours', 'en_livraison'], 'terminee',
+                             sets={'date_livraison': timezone.localdate},
+                             params=['date_validation', 'transporteur_confirme'], guards=DEMANDE_MISSION),
+        # The demandeur closes the demande once the items are in hand
+        'confirmer_reception': Transition('statut', ['validee', 'en_cours', 'en_livraison', 'terminee'], 'terminee',
+                                          sets={'demandeur_confirme_reception': True}),
+    },
+}
+
+
+def allowed(instance, event):
+    """Whether ``event`` applies to ``instance`` as loaded, without a query."""
+    rule = TRANSITIONS[type(instance)][event]
+    return getattr(instance, rule.field) in rule.sources
+
+
+def transition(instance, event, **params):
+    """Apply ``event`` to ``instance`` in one conditional UPDATE; ``instance`` is updated in place.
+
+    Raises TransitionError if the row is not in the state ``instance`` was
+    loaded with, if a guard column changed, or if that state is not a
+    source of ``event``.
+    """
+    model = type(instance)
+    rule = TRANSITIONS[model][event]
+    source = getattr(instance, rule.field)
+    if source not in rule.sources:
+        raise TransitionError(instance, event, source)
+    values = rule.values(params)
+    expected = rule.expected(instance, source)
+    with transaction.atomic():
+        rows = model._default_manager.filter(pk=instance.pk, **expected)
+        if not rows.update(**values):
+            current = model._default_manager.filter(pk=instance.pk).values(*expected).first()
+            if current is None:
+                raise TransitionError(instance, event, None)
+            guards = {name: model._meta.get_field(name).attname for name in rule.guards}
+            changed = [name for name, attname in guards.items() if current[attname] != expected[attname]]
+            raise TransitionError(instance, event, current[rule.field], changed)
+        for name, value in values.items():
+            setattr(instance, name, value)
+        status_changed.send(sender=model, instance=instance, event=event, field=rule.field,
+                            source=source, target=rule.target)
+    return instance
+
+
+def transition_or_warn(request, instance, event, **params):
+    """``transition()`` for views: a refused transition becomes a warning message; returns whether it applied."""
+    try:
+        transition(instance, event, **params)
+    except TransitionError as error:
+        messages.warning(request, error.message)
+        return False
+    return True
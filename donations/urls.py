@@ -32,6 +32,8 @@ urlpatterns = [
     name="ajouter_au_stock"
     ),
     path("dashboard/membre/stock/", stock_list, name="stock_list"), 
+    path("dashboard/membre/stock/allocation/", views.allouer_stock, name="allouer_stock"),
+    path("dashboard/membre/recherche/", views.recherche, name="recherche"),
     path('demandes/create/',create_demande,name="create_demande"),
     path("demande/<int:demande_id>/",demande_detail,name="demande_detail"),
     path("demande/<int:demande_id>/related_items/",getDemandeRelatedItems,name="related_items"),
@@ -7,14 +7,19 @@ donations/views.py - Views for donation management (propositions, demandes, stoc
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import IntegrityError
+from django.http import JsonResponse
 from django.utils import timezone
 
 # Local imports
+from . import allocation, intake, matching, search, transitions
 from .forms import PropositionDonForm, DemandeDonForm
 from .models import DemandeDon, PropositionDon, Don
+from .pagination import InvalidCursor
+from .stock import StockFilter
 from users.views import getAvailableTransporteurs
-from users.models import Transporteur
-from notifications.models import Notification
+from users.models import Membre, Transporteur
+from notifications import service as notifications
 
 
 # ============ DECORATORS ============
@@ -31,9 +36,24 @@ def participant_required(view_func):
 # ============ STOCK & INVENTORY VIEWS ============
 @login_required
 def stock_list(request):
-    """Display all donations in stock."""
-    dons = Don.objects.all()
-    return render(request, "donations/stock/stock_list.html", {"dons": dons})
+    """Display the stock, filtered and faceted server-side, one keyset page at a time."""
+    stock = StockFilter(request.GET)
+    try:
+        dons = stock.page(request.GET.get("cursor"))
+    except InvalidCursor:
+        messages.error(request, "Pagination invalide.")
+        return redirect("stock_list")
+    total, facets = stock.facets()
+
+    query = request.GET.copy()
+    query.pop("cursor", None)
+    return render(request, "donations/stock/stock_list.html", {
+        "dons": dons,
+        "total": total,
+        "facets": facets,
+        "filters_active": stock.active,
+        "query": query.urlencode(),
+    })
 
 
 @login_required
@@ -50,26 +70,65 @@ def ajouter_au_stock(request, proposition_id):
         messages.warning(request, "Le donateur n'a pas encore confirmé la remise au transporteur.")
         return redirect('proposition_detail', proposition_id=proposition_id)
 
-    # Prevent duplicate Don creation
-    if hasattr(proposition, 'don_realise'):
+    # The locked re-read and the unique proposition column keep a double click from stocking it twice
+    try:
+        don = intake.stock_proposition(proposition)
+    except IntegrityError:
+        don = None
+    if don is None:
         messages.warning(request, "Ce don est déjà en stock.")
         return redirect('membre_dashboard')
 
-    don = Don.objects.create(
-        proposition=proposition,
-        categorie=proposition.categorie,
-        type_materiel=proposition.type_materiel,
-        quantite=proposition.quantite,
-        description=proposition.description,
-        etat=proposition.etat,
-        photos=proposition.photos,
-        lieu_stockage="Entrepôt principal"
-    )
     messages.success(request, 
                      f"Proposition #{proposition.id} ajoutée au stock comme Don #{don.reference}.")
     return redirect('membre_dashboard')
 
 
+@login_required
+def allouer_stock(request):
+    """Preview the batch attribution of the stock to validated demandes, and apply it on POST (member only)."""
+    if not hasattr(request.user, 'membre'):
+        messages.error(request, "Accès réservé aux membres.")
+        return redirect('home')
+
+    if request.method == "POST":
+        # Apply the pairs the member reviewed; apply() skips the ones that changed since
+        result = allocation.from_pairs(request.POST.getlist('paires'))
+        allocation.apply(result)
+        messages.success(request, f"{result.applied} don(s) attribué(s) sur {len(result)} proposé(s).")
+        return redirect('allouer_stock')
+
+    result = allocation.plan()
+    return render(request, "donations/stock/allocation.html", {"allocation": result})
+
+
+@login_required
+def recherche(request):
+    """Ranked full-text search over propositions, demandes, stock and categories (member only).
+
+    ``?format=json`` returns the same page as JSON.
+    """
+    wants_json = request.GET.get("format") == "json"
+    if not hasattr(request.user, 'membre'):
+        if wants_json:
+            return JsonResponse({"error": "Accès réservé aux membres"}, status=403)
+        messages.error(request, "Accès réservé aux membres.")
+        return redirect('home')
+
+    page = request.GET.get("page", "1")
+    results = search.search(request.GET.get("q", ""), request.GET.getlist("type"),
+                            int(page) if page.isdigit() else 1)
+    if wants_json:
+        return JsonResponse(results.as_dict())
+    query = request.GET.copy()
+    query.pop("page", None)
+    return render(request, "donations/recherche.html", {
+        "results": results,
+        "kinds": search.SOURCES,
+        "query": query.urlencode(),
+    })
+
+
 # ============ PARTICIPANT DASHBOARD VIEWS ============
 @login_required
 def participant_donations(request):
@@ -96,6 +155,8 @@ def create_proposition(request):
             proposition.statut = "en_attente"
             proposition.participant_donateur = request.user.participant
             proposition.save()
+            # One INSERT for all the members, whatever their number
+            notifications.notify(Membre.objects.all(), 'nouvelle_proposition', {'proposition': proposition})
             messages.success(request, "Votre proposition de don a été créée avec succès. Elle sera validée par un membre.")
             return redirect("home")
     else:
@@ -134,21 +195,15 @@ def valider_demande(request, demande_id):
 
     action = request.POST.get('action')  # "valider" or "refuser"
     if action == "valider":
-        demande.statut = "validee"
-        demande.date_validation = timezone.now()
-        demande.membre_validateur = request.user.membre
-        demande.save()
+        if not transitions.transition_or_warn(request, demande, 'valider', membre_validateur=request.user.membre):
+            return redirect('liste_demandes')
         messages.success(request, f"Demande #{demande.id} validée avec succès.")
         # Redirect to assign transporteur after validation
         return redirect('assign_transporteur_demande', demande_id=demande.id)
     elif action == "refuser":
-        raison = request.POST.get('raison_refus', '')
-        demande.statut = "refusee"
-        demande.date_validation = timezone.now()
-        demande.membre_validateur = request.user.membre
-        demande.raison_refus = raison
-        demande.save()
-        messages.warning(request, f"Demande #{demande.id} refusée.")
+        if transitions.transition_or_warn(request, demande, 'refuser', membre_validateur=request.user.membre,
+                                          raison_refus=request.POST.get('raison_refus', '')):
+            messages.warning(request, f"Demande #{demande.id} refusée.")
         return redirect('liste_demandes')
     else:
         messages.error(request, "Action non reconnue.")
@@ -168,20 +223,16 @@ def traiter_proposition(request, proposition_id):
     if request.method == "POST":
         action = request.POST.get('action')
         if action == "valider":
-            proposition.statut = "validee"
-            proposition.date_validation = timezone.now()
-            proposition.membre_validateur = request.user.membre
-            proposition.save()
+            if not transitions.transition_or_warn(request, proposition, 'valider',
+                                                  membre_validateur=request.user.membre):
+                return redirect('membre_dashboard')
             messages.success(request, f"Proposition #{proposition.id} validée.")
             # Fix: Changed from 'assign_transporteur_view' to 'assign_transporteur'
             return redirect('assign_transporteur', proposition_id=proposition.id)
         elif action == "refuser":
-            proposition.statut = "refusee"
-            proposition.date_validation = timezone.now()
-            proposition.membre_validateur = request.user.membre
-            proposition.raison_refus = request.POST.get('raison_refus', '')
-            proposition.save()
-            messages.warning(request, f"Proposition #{proposition.id} refusée.")
+            if transitions.transition_or_warn(request, proposition, 'refuser', membre_validateur=request.user.membre,
+                                              raison_refus=request.POST.get('raison_refus', '')):
+                messages.warning(request, f"Proposition #{proposition.id} refusée.")
             return redirect('membre_dashboard')
         else:
             messages.error(request, "Action non reconnue.")
@@ -210,7 +261,7 @@ def transporteur_confirme_reception_proposition(request, proposition_id):
     
     if request.method == 'POST':
         proposition.transporteur_recoit = True
-        proposition.save()
+        proposition.save(update_fields=['transporteur_recoit'])
         
         messages.success(request, f"✅ Réception confirmée de la proposition #{proposition.id}!")
         return redirect('transporteur_dashboard')
@@ -231,11 +282,8 @@ def transporteur_confirme_livraison_demande(request, demande_id):
         return redirect('transporteur_dashboard')
     
     if request.method == 'POST':
-        demande.statut = 'terminee'
-        demande.date_livraison = timezone.now().date()
-        demande.save()
-        
-        messages.success(request, f"✅ Livraison confirmée pour la demande #{demande.id}!")
+        if transitions.transition_or_warn(request, demande, 'livrer'):
+            messages.success(request, f"✅ Livraison confirmée pour la demande #{demande.id}!")
         return redirect('transporteur_dashboard')
     
     return render(request, 'donations/demandes/transporteur_confirme_livraison.html', {
@@ -257,26 +305,17 @@ def assign_transporteur_proposition(request, proposition_id):
         transporteur_id = request.POST.get("transporteur_id")
         if transporteur_id:
             transporteur = get_object_or_404(Transporteur, id=transporteur_id)
-            proposition.transporteur_assignee = transporteur
-            proposition.statut = "validee"
-            proposition.date_validation = timezone.now()
-            proposition.membre_validateur = request.user.membre
-            proposition.save()
+            if not transitions.transition_or_warn(request, proposition, 'assigner', transporteur_assignee=transporteur,
+                                                  membre_validateur=request.user.membre):
+                return redirect('membre_dashboard')
 
-            # Create notification for transporteur
-            Notification.objects.create(
-                receiver=transporteur,
-                proposition=proposition,
-                titre=f"Nouvelle mission: Proposition #{proposition.id}",
-                message="Vous avez été assigné pour ramasser ce don. Veuillez accepter ou refuser la mission.",
-                demande=None,
-            )
+            notifications.notify([transporteur], 'mission_proposition', {'proposition': proposition})
 
             messages.success(request, f"Transporteur {transporteur} assigné à la proposition #{proposition.id}.")
             return redirect('membre_dashboard')
 
     # If GET request, show a form to choose transporteur
-    available_transporteurs = getAvailableTransporteurs()
+    available_transporteurs = getAvailableTransporteurs(proposition)
     return render(request, "donations/propositions/assign_transporteur.html", {
         "proposition": proposition,
         "transporteurs": available_transporteurs
@@ -298,23 +337,19 @@ def transporteur_confirme_proposition(request, proposition_id):
         action = request.POST.get('action')
         
         if action == 'accepter':
-            proposition.transporteur_statut = 'acceptee'
-            proposition.save()
-            messages.success(request, f"✅ Mission #{proposition.id} acceptée!")
+            if transitions.transition_or_warn(request, proposition, 'accepter_mission'):
+                messages.success(request, f"✅ Mission #{proposition.id} acceptée!")
             return redirect('transporteur_dashboard')
             
         elif action == 'refuser':
-            raison_refus = request.POST.get('raison_refus', '')
-            proposition.transporteur_statut = 'refusee'
-            proposition.raison_refus_transporteur = raison_refus
-            proposition.save()
-            messages.warning(request, f"❌ Mission #{proposition.id} refusée.")
+            if transitions.transition_or_warn(request, proposition, 'refuser_mission',
+                                              raison_refus_transporteur=request.POST.get('raison_refus', '')):
+                messages.warning(request, f"❌ Mission #{proposition.id} refusée.")
             return redirect('transporteur_dashboard')
             
         elif action == 'marquer comme terminer':
-            proposition.statut = 'terminee'
-            proposition.save()
-            messages.success(request, f"✅ Mission #{proposition.id} terminée!")
+            if transitions.transition_or_warn(request, proposition, 'terminer'):
+                messages.success(request, f"✅ Mission #{proposition.id} terminée!")
             return redirect('transporteur_dashboard')
     
     # GET request - display the confirmation page
@@ -334,20 +369,15 @@ def traiter_demande(request, demande_id):
     if request.method == "POST":
         action = request.POST.get('action')
         if action == "valider":
-            demande.statut = "validee"
-            demande.date_validation = timezone.now()
-            demande.membre_validateur = request.user.membre
-            demande.save()
+            if not transitions.transition_or_warn(request, demande, 'valider', membre_validateur=request.user.membre):
+                return redirect('membre_dashboard')
             messages.success(request, f"Demande #{demande.id} validée.")
             # Redirect to assign transporteur after validation
             return redirect('assign_transporteur_demande', demande_id=demande.id)
         elif action == "refuser":
-            demande.statut = "refusee"
-            demande.date_validation = timezone.now()
-            demande.membre_validateur = request.user.membre
-            demande.raison_refus = request.POST.get('raison_refus', '')
-            demande.save()
-            messages.warning(request, f"Demande #{demande.id} refusée.")
+            if transitions.transition_or_warn(request, demande, 'refuser', membre_validateur=request.user.membre,
+                                              raison_refus=request.POST.get('raison_refus', '')):
+                messages.warning(request, f"Demande #{demande.id} refusée.")
             return redirect('membre_dashboard')
         else:
             messages.error(request, "Action non reconnue.")
@@ -386,12 +416,12 @@ def demande_detail(request, demande_id):
 
 @login_required
 def getDemandeRelatedItems(request, demande_id):
-    """Get related items in stock for a specific demande."""
-    demande = get_object_or_404(DemandeDon, id=demande_id)
-    categorie = demande.categorie_recherchee
-    related_items = Don.objects.filter(categorie=categorie)
-    return render(request, "donations/demandes/related_items.html",
-                  {"related_items": related_items})
+    """Rank the available stock against a specific demande."""
+    demande = get_object_or_404(DemandeDon.objects.select_related('categorie_recherchee'), id=demande_id)
+    return render(request, "donations/demandes/related_items.html", {
+        "demande": demande,
+        "matches": matching.match(demande),
+    })
 
 
 # ============ TRANSPORTER ASSIGNMENT VIEWS ============
@@ -408,25 +438,16 @@ def assign_transporteur_demande(request, demande_id):
         transporteur_id = request.POST.get("transporteur_id")
         if transporteur_id:
             transporteur = get_object_or_404(Transporteur, id=transporteur_id)
-            demande.transporteur_livraison = transporteur
-            demande.statut = "validee"
-            demande.date_validation = timezone.now()
-            demande.membre_validateur = request.user.membre
-            demande.save()
+            if not transitions.transition_or_warn(request, demande, 'assigner', transporteur_livraison=transporteur,
+                                                  membre_validateur=request.user.membre):
+                return redirect('membre_dashboard')
 
-            # Create notification for transporteur
-            Notification.objects.create(
-                receiver=transporteur,
-                proposition=None,
-                demande=demande,
-                titre=f"Nouvelle mission: demande #{demande.id}",
-                message="Vous avez été assigné pour transporter ce don. Veuillez accepter ou refuser la mission."
-            )
+            notifications.notify([transporteur], 'mission_demande', {'demande': demande})
 
             messages.success(request, f"Transporteur {transporteur} assigné à la demande #{demande.id}.")
             return redirect('membre_dashboard')
 
-    available_transporteurs = getAvailableTransporteurs()
+    available_transporteurs = getAvailableTransporteurs(demande)
     return render(request, "donations/demandes/assign_transporteur.html", {
         "demande": demande,
         "transporteurs": available_transporteurs
@@ -447,26 +468,17 @@ def assign_transporteur_view(request, proposition_id):
         transporteur_id = request.POST.get("transporteur_id")
         if transporteur_id:
             transporteur = get_object_or_404(Transporteur, id=transporteur_id)
-            proposition.transporteur_assignee = transporteur
-            proposition.statut = "validee"
-            proposition.date_validation = timezone.now()
-            proposition.membre_validateur = request.user.membre
-            proposition.save()
+            if not transitions.transition_or_warn(request, proposition, 'assigner', transporteur_assignee=transporteur,
+                                                  membre_validateur=request.user.membre):
+                return redirect('membre_dashboard')
 
-            # Create notification for transporteur
-            Notification.objects.create(
-                receiver=transporteur,
-                proposition=proposition,
-                titre=f"Nouvelle mission: Proposition #{proposition.id}",
-                message="Vous avez été assigné pour ramasser ce don. Veuillez accepter ou refuser la mission.",
-                demande=None,
-            )
+            notifications.notify([transporteur], 'mission_proposition', {'proposition': proposition})
 
             messages.success(request, f"Transporteur {transporteur} assigné à la proposition #{proposition.id}.")
             return redirect('membre_dashboard')
 
     # If GET request, show a form to choose transporteur
-    available_transporteurs = getAvailableTransporteurs()
+    available_transporteurs = getAvailableTransporteurs(proposition)
     return render(request, "donations/propositions/assign_transporteur.html", {
         "proposition": proposition,
         "transporteurs": available_transporteurs
@@ -488,35 +500,24 @@ def transporteur_confirme_demande(request, demande_id):
         action = request.POST.get('action')
         
         if action == 'accepter':
-            demande.transporteur_confirme = True
-            demande.statut = 'en_cours'
-            demande.transporteur_date_reponse = timezone.now()
-            demande.save()
-            messages.success(request, f"✅ Mission #{demande.id} acceptée!")
+            if transitions.transition_or_warn(request, demande, 'accepter_mission'):
+                messages.success(request, f"✅ Mission #{demande.id} acceptée!")
             return redirect('transporteur_dashboard')
             
         elif action == 'refuser':
-            raison_refus = request.POST.get('raison_refus', '')
-            demande.transporteur_confirme = False
-            demande.transporteur_raison_refus = raison_refus
-            demande.transporteur_livraison = None
-            demande.statut = 'validee'
-            demande.transporteur_date_reponse = timezone.now()
-            demande.save()
-            messages.warning(request, f"❌ Mission #{demande.id} refusée.")
+            if transitions.transition_or_warn(request, demande, 'refuser_mission',
+                                              transporteur_raison_refus=request.POST.get('raison_refus', '')):
+                messages.warning(request, f"❌ Mission #{demande.id} refusée.")
             return redirect('transporteur_dashboard')
             
         elif action == 'demarrer':
-            demande.statut = 'en_livraison'
-            demande.save()
-            messages.success(request, f"🚚 Livraison #{demande.id} démarrée!")
+            if transitions.transition_or_warn(request, demande, 'demarrer'):
+                messages.success(request, f"🚚 Livraison #{demande.id} démarrée!")
             return redirect('transporteur_dashboard')
             
         elif action == 'marquer comme terminer':
-            demande.statut = 'terminee'
-            demande.date_livraison = timezone.now().date()
-            demande.save()
-            messages.success(request, f"✅ Mission #{demande.id} terminée!")
+            if transitions.transition_or_warn(request, demande, 'livrer'):
+                messages.success(request, f"✅ Mission #{demande.id} terminée!")
             return redirect('transporteur_dashboard')
     
     # GET request - display the page
@@ -538,14 +539,12 @@ def transporteur_reponse(request, proposition_id):
     if request.method == "POST":
         action = request.POST.get('action')
         if action == "accepter":
-            proposition.transporteur_statut = "acceptee"
-            proposition.save()
-            messages.success(request, f"Vous avez accepté la mission pour Proposition #{proposition.id}.")
+            if transitions.transition_or_warn(request, proposition, 'accepter_mission'):
+                messages.success(request, f"Vous avez accepté la mission pour Proposition #{proposition.id}.")
         elif action == "refuser":
-            proposition.transporteur_statut = "refusee"
-            proposition.raison_refus_transporteur = request.POST.get('raison_refus', '')
-            proposition.save()
-            messages.warning(request, f"Vous avez refusé la mission pour Proposition #{proposition.id}.")
+            if transitions.transition_or_warn(request, proposition, 'refuser_mission',
+                                              raison_refus_transporteur=request.POST.get('raison_refus', '')):
+                messages.warning(request, f"Vous avez refusé la mission pour Proposition #{proposition.id}.")
         else:
             messages.error(request, "Action non reconnue.")
 
@@ -562,9 +561,8 @@ def terminer_proposition(request, proposition_id):
         messages.error(request, "Vous n'êtes pas autorisé à terminer cette mission.")
         return redirect('transporteur_dashboard')
 
-    proposition.statut = "terminee"
-    proposition.save()
-    messages.success(request, f"Proposition #{proposition.id} marquée comme terminée.")
+    if transitions.transition_or_warn(request, proposition, 'terminer'):
+        messages.success(request, f"Proposition #{proposition.id} marquée comme terminée.")
     return redirect('transporteur_dashboard')
 
 
@@ -577,10 +575,7 @@ def marquer_demande_terminee_transporteur(request, demande_id):
         messages.error(request, "Vous n'êtes pas autorisé à terminer cette mission.")
         return redirect('transporteur_dashboard')
 
-    if demande.statut != 'terminee':
-        demande.statut = 'terminee'
-        demande.date_livraison = timezone.now().date()
-        demande.save()
+    if demande.statut != 'terminee' and transitions.transition_or_warn(request, demande, 'livrer'):
         messages.success(request, f"Demande #{demande.id} marquée comme terminée.")
 
     return redirect('transporteur_dashboard')
@@ -604,16 +599,12 @@ def confirmer_remise_donateur(request, proposition_id):
     
     if request.method == 'POST':
         proposition.donator_gives = True
-        proposition.save()
+        proposition.save(update_fields=['donator_gives'])
         
         # Notify member that items are ready to be added to stock
-        if proposition.membre_validateur:
-            Notification.objects.create(
-                receiver=proposition.membre_validateur,
-                proposition=proposition,
-                titre=f"Remise confirmée: Proposition #{proposition.id}",
-                message=f"Le donateur a confirmé la remise au transporteur. Vous pouvez ajouter ce don au stock."
-            )
+        if proposition.membre_validateur_id:
+            notifications.notify([proposition.membre_validateur_id], 'remise_confirmee',
+                                 {'proposition': proposition})
         
         messages.success(request, f"✅ Remise confirmée pour la proposition #{proposition.id}!")
         return redirect('mes_propositions')
@@ -649,11 +640,8 @@ def confirmer_reception_demande(request, demande_id):
         messages.info(request, "Vous avez déjà confirmé la réception de cette demande.")
         return redirect('mes_demandes')
     
-    # Confirm reception
-    demande.demandeur_confirme_reception = True
-    demande.save()
-    
-    messages.success(request, "Réception confirmée avec succès !")
+    if transitions.transition_or_warn(request, demande, 'confirmer_reception'):
+        messages.success(request, "Réception confirmée avec succès !")
     return redirect('mes_demandes')
 
 # ============ PARTICIPANT VIEWS ============
@@ -665,9 +653,7 @@ def mes_demandes(request):
         return redirect('home')
     
     # Get all demands by this participant
-    demandes = DemandeDon.objects.filter(
-        participant_requerant=request.user.participant
-    ).order_by('-date_demande')
+    demandes = DemandeDon.objects.for_participant(request.user.participant)
     
     # Handle POST request to terminate a demand
     if request.method == 'POST':
@@ -679,12 +665,8 @@ def mes_demandes(request):
             
             # Check if this participant owns the demand
             if demande.participant_requerant == request.user.participant:
-                # Terminate the demand
-                demande.statut = 'terminee'
-                demande.demandeur_confirme_reception = True
-                demande.save()
-                
-                messages.success(request, f"Demande #{demande.id} terminée avec succès !")
+                if transitions.transition_or_warn(request, demande, 'confirmer_reception'):
+                    messages.success(request, f"Demande #{demande.id} terminée avec succès !")
                 return redirect('mes_demandes')
             else:
                 messages.error(request, "Vous n'êtes pas autorisé à terminer cette demande.")
@@ -702,20 +684,10 @@ def mes_propositions(request):
         messages.error(request, "Accès non autorisé.")
         return redirect('dashboard')
     
-    # Get all propositions by this participant
-    propositions = PropositionDon.objects.filter(
-        participant_donateur=request.user.participant
-    ).order_by('-date_proposition')
-    
-    # Get associated demands for completed propositions
-    for proposition in propositions:
-        # Find if there's a demande associated with this proposition
-        try:
-            proposition.demande_associee = DemandeDon.objects.filter(
-                don_attribue__proposition=proposition
-            ).first()
-        except:
-            proposition.demande_associee = None
+    # Get all propositions by this participant, with their associated demande
+    propositions = PropositionDon.objects.for_participant(
+        request.user.participant
+    ).with_associated_demande()
     
     context = {
         'propositions': propositions
@@ -727,23 +699,16 @@ def mes_propositions(request):
 @login_required
 def proposition_details(request, proposition_id):
     """Detailed view of a specific proposition"""
-    proposition = get_object_or_404(PropositionDon, id=proposition_id)
+    proposition = get_object_or_404(PropositionDon.objects.with_associated_demande(), id=proposition_id)
     
     # Security check
-    if not hasattr(request.user, 'participant') or proposition.participant_donateur != request.user.participant:
+    if not hasattr(request.user, 'participant') or proposition.participant_donateur_id != request.user.participant.pk:
         messages.error(request, "Accès non autorisé.")
         return redirect('mes_propositions')
     
-    # Get associated demande if exists
-    demande_associee = None
-    try:
-        demande_associee = DemandeDon.objects.filter(don_attribue__proposition=proposition).first()
-    except:
-        pass
-    
     context = {
         'proposition': proposition,
-        'demande_associee': demande_associee
+        'demande_associee': proposition.demande_associee
     }
     
     return render(request, 'donations/propositions/proposition_details.html', context)
@@ -756,15 +721,13 @@ def mes_missions_acceptees(request):
    
     
     # Get propositions where the participant is the donor
-    propositions = PropositionDon.objects.filter(
-        participant_donateur=request.user
-    ).exclude(statut='en_attente').order_by('-date_proposition')
+    propositions = PropositionDon.objects.for_participant(request.user).exclude(statut='en_attente')
     
     # Get demands assigned to this participant (if they're also a transporter)
     demandes = DemandeDon.objects.none()
     if hasattr(request.user, 'transporteur'):
-        demandes = DemandeDon.objects.filter(
-            transporteur_livraison=request.user
+        demandes = DemandeDon.objects.for_transporteur(
+            request.user.transporteur
         ).exclude(statut='en_attente').order_by('-date_demande')
     
     context = {
@@ -779,7 +742,7 @@ def mes_missions_acceptees(request):
 def demandes_de_recuperateur(request, user_id):
     """Show all donation requests for a specific participant."""
     participant_recurant = get_object_or_404(Participant, id=user_id)
-    demandes = participant_recurant.demandes_dons.all()
+    demandes = DemandeDon.objects.for_participant(participant_recurant)
     return render(
         request,
         "donations/demandes/demandes_requperateur.html",
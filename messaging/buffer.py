@@ -0,0 +1,167 @@
+# messaging/buffer.py
+"""
+Write-behind buffer for chat messages.
+
+``save_message`` only enqueues the message; a background thread drains the
+queue and writes it with one ``bulk_create`` every ``MAX_BATCH`` messages or
+``FLUSH_INTERVAL_MS`` milliseconds, whichever comes first. The queue is
+bounded: when it is full, ``add`` waits up to ``PUT_TIMEOUT_MS`` and then
+raises ``BufferFull`` so callers can shed load. Pending messages are flushed
+on interpreter shutdown.
+
+A batch that fails to write, for example on a locked database or a dropped
+connection, is retried with the next batches up to ``MAX_ATTEMPTS`` times
+before it is dropped and logged. The flusher thread survives any error.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connections
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_BATCH": 100,
+    "FLUSH_INTERVAL_MS": 50,
+    "MAX_SIZE": 10000,
+    "PUT_TIMEOUT_MS": 500,
+    "MAX_ATTEMPTS": 3,
+}
+
+
+class BufferFull(Exception):
+    pass
+
+
+class MessageBuffer:
+    def __init__(self, max_batch=100, flush_interval_ms=50, max_size=10000, put_timeout_ms=500,
+                 max_attempts=3, autostart=True):
+        self.autostart = autostart
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout_ms / 1000
+        self.max_attempts = max_attempts
+        self.queue = queue.Queue(maxsize=max_size)
+        # Failed messages, written before the queue; outside it so a retry never blocks on a full queue
+        self._retries = deque()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls):
+        options = {**DEFAULTS, **getattr(settings, "CHAT_MESSAGE_BUFFER", {})}
+        return cls(
+            max_batch=options["MAX_BATCH"],
+            flush_interval_ms=options["FLUSH_INTERVAL_MS"],
+            max_size=options["MAX_SIZE"],
+            put_timeout_ms=options["PUT_TIMEOUT_MS"],
+            max_attempts=options["MAX_ATTEMPTS"],
+        )
+
+    # ============ PRODUCER SIDE ============
+    def add(self, sender_id, receiver_id, text):
+        """Queue a message for the next batch; raise BufferFull under back-pressure."""
+        if self.autostart:
+            self.start()
+        try:
+            self.queue.put(Message(sender_id=sender_id, receiver_id=receiver_id, text=text),
+                           timeout=self.put_timeout)
+        except queue.Full:
+            raise BufferFull()
+
+    # ============ CONSUMER SIDE ============
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-message-buffer", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the flusher thread and write every message still queued."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        connections.close_all()
+
+    def flush(self):
+        """Synchronously write everything currently queued. Returns the number of rows saved."""
+        saved = 0
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return saved
+            saved += self._write(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = self._drain(block=True)
+                if batch:
+                    close_old_connections()
+                    if not self._write(batch) and self._retries:
+                        # Give a locked or restarting database a moment before the retry
+                        self._stopping.wait(self.flush_interval)
+            except Exception:
+                logger.exception("Chat message flusher error")
+
+    def _drain(self, block):
+        """Collect up to max_batch messages, waiting at most flush_interval for the batch to fill."""
+        batch = []
+        while self._retries and len(batch) < self.max_batch:
+            batch.append(self._retries.popleft())
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            # One query validates every user referenced by the batch, instead of
+            # two lookups per message.
+            user_ids = {m.sender_id for m in batch} | {m.receiver_id for m in batch}
+            known = set(get_user_model().objects.filter(id__in=user_ids).values_list("id", flat=True))
+            valid = [m for m in batch if m.sender_id in known and m.receiver_id in known]
+            if len(valid) < len(batch):
+                logger.warning("Dropped %d chat message(s) addressed to unknown users", len(batch) - len(valid))
+            Message.objects.bulk_create(valid)
+        except Exception:
+            logger.exception("Failed to write a batch of %d chat message(s)", len(batch))
+            self._retry(batch)
+            return 0
+        return len(valid)
+
+    def _retry(self, batch):
+        dropped = 0
+        for message in batch:
+            message.pk = None  # may be set by an INSERT that was rolled back
+            message._buffer_attempts = getattr(message, "_buffer_attempts", 1) + 1
+            if message._buffer_attempts > self.max_attempts:
+                dropped += 1
+            else:
+                self._retries.append(message)
+        if dropped:
+            logger.error("Dropped %d chat message(s) after %d failed attempts", dropped, self.max_attempts)
+
+
+message_buffer = MessageBuffer.from_settings()
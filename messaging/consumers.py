@@ -0,0 +1,138 @@
+# messaging/consumers.py
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.contrib.auth import get_user_model
+
+from .models import Conversation, Message
+
+User = get_user_model()
+
+
+def user_group(user_id):
+    """Channel layer group receiving every chat event addressed to a user."""
+    return f"chat_user_{user_id}"
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    WebSocket endpoint used by templates/messaging/chat_room.html.
+
+    Each connected user joins their own group; frames are persisted as
+    Message rows and fanned out to the sender's and the receiver's groups.
+    The sender is always the authenticated user, never the client payload.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get("user")
+        user_id = self.scope["url_route"]["kwargs"]["user_id"]
+        if not self.user or not self.user.is_authenticated or self.user.id != user_id:
+            await self.close(code=4403)
+            return
+        self.group_name = user_group(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        handlers = {
+            "message": self.handle_message,
+            "typing": self.handle_typing,
+            "read_receipt": self.handle_read_receipt,
+            "delete_message": self.handle_delete_message,
+        }
+        handler = handlers.get(content.get("type"))
+        if handler is None:
+            await self.send_json({"type": "error", "detail": "Type de message inconnu"})
+            return
+        await handler(content)
+
+    # ============ INCOMING FRAMES ============
+    async def handle_message(self, content):
+        text = (content.get("text") or "").strip()
+        receiver_id = content.get("receiver_id")
+        if not text or not receiver_id:
+            await self.send_json({"type": "error", "detail": "receiver_id et text sont requis"})
+            return
+        message = await self.save_message(receiver_id, text)
+        if message is None:
+            await self.send_json({"type": "error", "detail": "Destinataire introuvable"})
+            return
+        event = {
+            "type": "chat.message",
+            "message_id": message.id,
+            "sender_id": self.user.id,
+            "sender_username": self.user.username,
+            "receiver_id": message.receiver_id,
+            "text": message.text,
+            "timestamp": message.timestamp.isoformat(),
+        }
+        await self.broadcast(event, self.user.id, message.receiver_id)
+
+    async def handle_typing(self, content):
+        receiver_id = content.get("receiver_id")
+        if receiver_id:
+            await self.channel_layer.group_send(user_group(receiver_id), {
+                "type": "chat.typing",
+                "sender_id": self.user.id,
+                "typing": bool(content.get("typing")),
+            })
+
+    async def handle_read_receipt(self, content):
+        sender_id = await self.get_sender_of_received(content.get("message_id"))
+        if sender_id:
+            await self.mark_conversation_read(sender_id)
+            await self.channel_layer.group_send(user_group(sender_id), {
+                "type": "chat.read_receipt",
+                "message_id": content["message_id"],
+                "reader_id": self.user.id,
+            })
+
+    async def handle_delete_message(self, content):
+        receiver_id = await self.delete_own_message(content.get("message_id"))
+        if receiver_id:
+            await self.broadcast({"type": "chat.message_deleted", "message_id": content["message_id"]},
+                                 self.user.id, receiver_id)
+
+    async def broadcast(self, event, *user_ids):
+        for user_id in set(user_ids):
+            await self.channel_layer.group_send(user_group(user_id), event)
+
+    # ============ GROUP EVENTS -> CLIENT ============
+    async def chat_message(self, event):
+        await self.send_json({**event, "type": "message"})
+
+    async def chat_typing(self, event):
+        await self.send_json({**event, "type": "typing"})
+
+    async def chat_read_receipt(self, event):
+        await self.send_json({**event, "type": "read_receipt"})
+
+    async def chat_message_deleted(self, event):
+        await self.send_json({**event, "type": "message_deleted"})
+
+    # ============ DATABASE ============
+    @database_sync_to_async
+    def save_message(self, receiver_id, text):
+        if not User.objects.filter(id=receiver_id).exists():
+            return None
+        return Message.objects.create(sender_id=self.user.id, receiver_id=receiver_id, text=text)
+
+    @database_sync_to_async
+    def get_sender_of_received(self, message_id):
+        return (Message.objects.filter(id=message_id, receiver_id=self.user.id)
+                .values_list("sender_id", flat=True).first())
+
+    @database_sync_to_async
+    def mark_conversation_read(self, other_id):
+        Conversation.objects.mark_read(self.user.id, other_id)
+
+    @database_sync_to_async
+    def delete_own_message(self, message_id):
+        receiver_id = (Message.objects.filter(id=message_id, sender_id=self.user.id)
+                       .values_list("receiver_id", flat=True).first())
+        if receiver_id:
+            Message.objects.filter(id=message_id).delete()
+        return receiver_id
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-17 17:40
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Concat, Greatest, Least
+
+
+def fill_conversation_key(apps, schema_editor):
+    Message = apps.get_model('messaging', 'Message')
+    Message.objects.update(conversation_key=Concat(
+        Cast(Least('sender_id', 'receiver_id'), models.CharField()),
+        models.Value('-'),
+        Cast(Greatest('sender_id', 'receiver_id'), models.CharField()),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation_key',
+            field=models.CharField(default='', editable=False, max_length=41),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_conversation_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation_key', 'id'], name='message_history_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-17 17:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_conversations(apps, schema_editor):
+    # Existing history is treated as read: there is no per-message read state to rebuild from.
+    Message = apps.get_model('messaging', 'Message')
+    Conversation = apps.get_model('messaging', 'Conversation')
+    last_ids = (Message.objects.values('conversation_key')
+                .annotate(last_id=models.Max('id')).values_list('last_id', flat=True))
+    conversations = []
+    for message in Message.objects.filter(id__in=list(last_ids)).iterator():
+        low_id, high_id = map(int, message.conversation_key.split('-'))
+        conversations.append(Conversation(
+            key=message.conversation_key, user_low_id=low_id, user_high_id=high_id,
+            last_message_id=message.id, last_timestamp=message.timestamp,
+        ))
+    Conversation.objects.bulk_create(conversations, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_message_conversation_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=41, unique=True)),
+                ('last_timestamp', models.DateTimeField()),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messaging.message')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_timestamp', '-id'], name='conversation_low_inbox_idx'), models.Index(fields=['user_high', '-last_timestamp', '-id'], name='conversation_high_inbox_idx')],
+            },
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
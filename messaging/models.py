@@ -1,7 +1,32 @@
 # messaging/models.py
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Sum, When
 from django.conf import settings
 
+
+def conversation_key(user_a_id, user_b_id):
+    """Normalized key shared by both directions of a conversation."""
+    low, high = sorted((int(user_a_id), int(user_b_id)))
+    return f"{low}-{high}"
+
+
+class MessageQuerySet(models.QuerySet):
+    def between(self, user_a_id, user_b_id):
+        """Both directions of a conversation, served by a single index range."""
+        return self.filter(conversation_key=conversation_key(user_a_id, user_b_id))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for message in objs:
+            message.set_conversation_key()
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            Conversation.objects.using(self.db).record(created)
+        return created
+
+
 class Message(models.Model):
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sent_messages"
@@ -9,8 +34,127 @@ class Message(models.Model):
     receiver = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="received_messages"
     )
+    conversation_key = models.CharField(max_length=41, editable=False)
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["sender", "receiver", "timestamp"], name="message_conversation_idx"),
+            # History pages: WHERE conversation_key = ? AND id < ? ORDER BY id DESC
+            models.Index(fields=["conversation_key", "id"], name="message_history_idx"),
+        ]
+
+    def set_conversation_key(self):
+        self.conversation_key = conversation_key(self.sender_id, self.receiver_id)
+
+    def save(self, *args, **kwargs):
+        self.set_conversation_key()
+        adding = self._state.adding
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            if adding:
+                Conversation.objects.using(self._state.db).record([self])
+
     def __str__(self):
         return f"{self.sender} → {self.receiver}: {self.text[:20]}"
+
+
+class ConversationQuerySet(models.QuerySet):
+    def for_user(self, user_id):
+        return self.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id))
+
+    def record(self, messages):
+        """
+        Fold newly inserted messages into their conversations: bump the
+        receiver's unread count and move last_message forward. Counters are
+        updated with F() so concurrent writers never lose an increment, and
+        last_message only ever moves to a higher id.
+        """
+        by_key = {}
+        for message in messages:
+            if message.pk is None:
+                # Backends that cannot return ids from bulk_create
+                continue
+            by_key.setdefault(message.conversation_key, []).append(message)
+
+        for key, batch in by_key.items():
+            last = max(batch, key=lambda m: m.id)
+            low_id, high_id = map(int, key.split("-"))
+            unread = Counter(m.receiver_id for m in batch if m.sender_id != m.receiver_id)
+            newer = Q(last_message__isnull=True) | Q(last_message_id__lt=last.id)
+            changes = dict(
+                unread_low=F("unread_low") + unread[low_id],
+                unread_high=F("unread_high") + unread[high_id],
+                last_message_id=Case(When(newer, then=last.id), default=F("last_message_id"),
+                                     output_field=models.BigIntegerField()),
+                last_timestamp=Case(When(newer, then=last.timestamp), default=F("last_timestamp"),
+                                    output_field=models.DateTimeField()),
+            )
+            if not self.filter(key=key).update(**changes):
+                # First message between these users
+                conversation, _ = self.get_or_create(key=key, defaults={
+                    "user_low_id": low_id,
+                    "user_high_id": high_id,
+                    "last_timestamp": last.timestamp,
+                })
+                self.filter(pk=conversation.pk).update(**changes)
+
+    def mark_read(self, user_id, other_id):
+        """Reset the unread count of ``user_id`` in its conversation with ``other_id``."""
+        field = "unread_low" if int(user_id) <= int(other_id) else "unread_high"
+        return self.filter(key=conversation_key(user_id, other_id)).update(**{field: 0})
+
+    def unread_total(self, user_id):
+        """
+        Unread messages across every conversation of ``user_id`` (the navbar badge).
+
+        Scoped by ``for_user()`` first, so both inbox indexes serve the sum
+        instead of a scan of every conversation.
+        """
+        totals = self.for_user(user_id).aggregate(
+            low=Sum("unread_low", filter=Q(user_low_id=user_id)),
+            high=Sum("unread_high", filter=Q(user_high_id=user_id)),
+        )
+        return (totals["low"] or 0) + (totals["high"] or 0)
+
+
+class Conversation(models.Model):
+    """
+    Denormalized summary of the messages between two users, maintained by
+    Message.save() and MessageQuerySet.bulk_create(). user_low is always the
+    smaller user id, so a pair of users maps to exactly one row.
+    """
+    key = models.CharField(max_length=41, unique=True)
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    last_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    last_timestamp = models.DateTimeField()
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Inbox pages: WHERE user_x = ? ORDER BY last_timestamp DESC, id DESC
+            models.Index(fields=["user_low", "-last_timestamp", "-id"], name="conversation_low_inbox_idx"),
+            models.Index(fields=["user_high", "-last_timestamp", "-id"], name="conversation_high_inbox_idx"),
+        ]
+
+    def other_user_id(self, user_id):
+        return self.user_high_id if self.user_low_id == user_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.unread_low if self.user_low_id == user_id else self.unread_high
+
+    def __str__(self):
+        return f"Conversation {self.key}"
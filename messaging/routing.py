@@ -0,0 +1,8 @@
+# messaging/routing.py
+from django.urls import path
+
+from .consumers import ChatConsumer
+
+websocket_urlpatterns = [
+    path("ws/chat/<int:user_id>/", ChatConsumer.as_asgi()),
+]
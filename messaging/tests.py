@@ -1,3 +1,294 @@
-from django.test import TestCase
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from users.models import User
+from .buffer import BufferFull, MessageBuffer
+from . import views
+from .models import Conversation, Message
+from .routing import websocket_urlpatterns
+
+
+class WebsocketClient(ApplicationCommunicator):
+    """Minimal WebSocket test client (channels.testing needs daphne, which is not a dependency)."""
+
+    def __init__(self, path, user, urlpatterns=websocket_urlpatterns):
+        scope = {"type": "websocket", "path": path, "headers": [], "subprotocols": [], "user": user}
+        super().__init__(URLRouter(urlpatterns), scope)
+
+    async def connect(self):
+        await self.send_input({"type": "websocket.connect"})
+        response = await self.receive_output(1)
+        return response["type"] == "websocket.accept"
+
+    async def send_json_to(self, data):
+        await self.send_input({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json_from(self):
+        response = await self.receive_output(1)
+        return json.loads(response["text"])
+
+    async def disconnect(self):
+        await self.send_input({"type": "websocket.disconnect", "code": 1000})
+        await self.wait(1)
+
+
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+
+    def communicator(self, user, user_id=None):
+        return WebsocketClient(f"/ws/chat/{user_id or user.id}/", user)
+
+    async def test_message_is_saved_and_delivered(self):
+        alice = self.communicator(self.alice)
+        bob = self.communicator(self.bob)
+        self.assertTrue(await alice.connect())
+        self.assertTrue(await bob.connect())
+
+        await alice.send_json_to({"type": "message", "receiver_id": self.bob.id,
+                                  "sender_id": self.bob.id, "text": "Bonjour"})
+        received = await bob.receive_json_from()
+        echoed = await alice.receive_json_from()
+
+        self.assertEqual(received["type"], "message")
+        self.assertEqual(received["text"], "Bonjour")
+        self.assertEqual(received["sender_id"], self.alice.id)
+        self.assertEqual(echoed["message_id"], received["message_id"])
+        message = await Message.objects.aget(id=received["message_id"])
+        self.assertEqual((message.sender_id, message.receiver_id), (self.alice.id, self.bob.id))
+
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_cannot_connect_as_another_user(self):
+        communicator = self.communicator(self.alice, user_id=self.bob.id)
+        self.assertFalse(await communicator.connect())
+
+
+class MessageBufferTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+
+    def test_flush_writes_batches_with_bulk_create(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="premier")
+        buffer = MessageBuffer(max_batch=50, autostart=False)
+        for i in range(120):
+            buffer.add(self.alice.id, self.bob.id, f"message {i}")
+        # 3 batches, each: one user lookup + one INSERT + one conversation UPDATE,
+        # inside a savepoint (2 more queries under TestCase)
+        with self.assertNumQueries(15):
+            self.assertEqual(buffer.flush(), 120)
+        self.assertEqual(Message.objects.count(), 121)
+
+    def test_unknown_users_are_dropped(self):
+        buffer = MessageBuffer(autostart=False)
+        buffer.add(self.alice.id, 999999, "perdu")
+        buffer.add(self.alice.id, self.bob.id, "reçu")
+        with self.assertLogs("messaging.buffer", "WARNING"):
+            self.assertEqual(buffer.flush(), 1)
+
+    def test_failed_batch_is_retried_then_dropped(self):
+        buffer = MessageBuffer(max_attempts=2, autostart=False)
+        buffer.add(self.alice.id, self.bob.id, "retenté")
+        flaky = mock.patch("messaging.buffer.get_user_model", side_effect=[OperationalError("database is locked"), User])
+        with flaky, self.assertLogs("messaging.buffer", "ERROR"):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Message.objects.get().text, "retenté")
+
+        buffer.add(self.alice.id, self.bob.id, "perdu")
+        failing = mock.patch("messaging.buffer.get_user_model", side_effect=OperationalError("database is locked"))
+        with failing, self.assertLogs("messaging.buffer", "ERROR") as logs:
+            self.assertEqual(buffer.flush(), 0)
+        self.assertIn("Dropped 1 chat message(s) after 2 failed attempts", "\n".join(logs.output))
+        self.assertFalse(buffer._retries)
+
+    def test_back_pressure(self):
+        buffer = MessageBuffer(max_size=2, put_timeout_ms=1, autostart=False)
+        buffer.add(self.alice.id, self.bob.id, "1")
+        buffer.add(self.alice.id, self.bob.id, "2")
+        with self.assertRaises(BufferFull):
+            buffer.add(self.alice.id, self.bob.id, "3")
+
+
+class MessageBufferThreadTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+
+    def test_flusher_survives_a_database_error(self):
+        buffer = MessageBuffer(flush_interval_ms=10)
+        written = []
+        bulk_create = Message.objects.bulk_create
+
+        def record(objs, *args, **kwargs):
+            created = bulk_create(objs, *args, **kwargs)
+            written.extend(message.text for message in created)
+            return created
+
+        def wait_for(count, timeout=5):
+            # Polls the flusher's writes, not the table: SQLite would lock it under the thread
+            deadline = time.monotonic() + timeout
+            while len(written) < count and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return list(written)
+
+        lookups = mock.Mock(side_effect=[OperationalError("database is locked"), User, User])
+        with mock.patch("messaging.buffer.get_user_model", lookups), \
+                mock.patch.object(Message.objects, "bulk_create", record), \
+                self.assertLogs("messaging.buffer", "ERROR"):
+            buffer.add(self.alice.id, self.bob.id, "premier")
+            self.assertEqual(wait_for(1), ["premier"])
+            self.assertTrue(buffer._thread.is_alive())
+            buffer.add(self.alice.id, self.bob.id, "second")
+            self.assertEqual(wait_for(2), ["premier", "second"])
+            buffer.stop()
+        self.assertEqual(Message.objects.count(), 2)
+
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        self.carol = User.objects.create(username="carol")
+        self.ids = []
+        for i in range(7):
+            sender, receiver = (self.alice, self.bob) if i % 2 else (self.bob, self.alice)
+            self.ids.append(Message.objects.create(sender=sender, receiver=receiver, text=f"m{i}").id)
+        Message.objects.create(sender=self.alice, receiver=self.carol, text="ailleurs")
+        self.client.force_login(self.alice)
+
+    def history(self, **params):
+        response = self.client.get(reverse("message_history"), {"receiver_id": self.bob.id, **params})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [m["message_id"] for m in data["messages"]], data["has_more"]
+
+    def test_latest_page_covers_both_directions(self):
+        with self.assertNumQueries(3):  # session, user, one history query
+            ids, has_more = self.history(limit=3)
+        self.assertEqual(ids, self.ids[-3:])
+        self.assertTrue(has_more)
+
+    def test_before_walks_back_to_the_start(self):
+        ids, has_more = self.history(before=self.ids[3], limit=2)
+        self.assertEqual((ids, has_more), (self.ids[1:3], True))
+        ids, has_more = self.history(before=self.ids[1], limit=2)
+        self.assertEqual((ids, has_more), (self.ids[:1], False))
+
+    def test_after_returns_new_messages_oldest_first(self):
+        ids, has_more = self.history(after=self.ids[2], limit=2)
+        self.assertEqual((ids, has_more), (self.ids[3:5], True))
+        ids, has_more = self.history(after=self.ids[-1])
+        self.assertEqual((ids, has_more), ([], False))
+
+    def test_invalid_parameters(self):
+        url = reverse("message_history")
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {"receiver_id": self.bob.id, "before": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"receiver_id": self.bob.id, "before": 1, "after": 1}).status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        response = self.client.get(reverse("message_history"), {"receiver_id": self.bob.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_chat_room_renders_latest_page_only(self):
+        Message.objects.bulk_create([Message(sender=self.alice, receiver=self.bob, text=f"vieux {i}")
+                                     for i in range(60)])
+        response = self.client.get(reverse("chat_room", args=[self.alice.id, self.bob.id]))
+        self.assertEqual(len(response.context["chat_messages"]), 50)
+        self.assertTrue(response.context["has_more"])
+
+    def test_chat_room_is_private(self):
+        unread = Conversation.objects.unread_total(self.alice.id)
+        self.assertGreater(unread, 0)
+        self.client.force_login(self.carol)
+        response = self.client.get(reverse("chat_room", args=[self.alice.id, self.bob.id]))
+        self.assertEqual(response.status_code, 404)
+        # The unread count of alice is untouched
+        self.assertEqual(Conversation.objects.unread_total(self.alice.id), unread)
+
+        self.client.logout()
+        response = self.client.get(reverse("chat_room", args=[self.alice.id, self.bob.id]))
+        self.assertEqual(response.status_code, 302)
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create(username="alice")
+        self.bob = User.objects.create(username="bob")
+        self.carol = User.objects.create(username="carol")
+
+    def test_save_maintains_last_message_and_unread(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="1")
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="2")
+        last = Message.objects.create(sender=self.bob, receiver=self.alice, text="3")
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.key, f"{self.alice.id}-{self.bob.id}")
+        self.assertEqual(conversation.last_message_id, last.id)
+        self.assertEqual(conversation.last_timestamp, last.timestamp)
+        self.assertEqual(conversation.unread_for(self.bob.id), 2)
+        self.assertEqual(conversation.unread_for(self.alice.id), 1)
+
+        Conversation.objects.mark_read(self.bob.id, self.alice.id)
+        self.assertEqual(Conversation.objects.unread_total(self.bob.id), 0)
+        self.assertEqual(Conversation.objects.unread_total(self.alice.id), 1)
+
+    def test_bulk_create_records_each_conversation(self):
+        Message.objects.bulk_create([
+            Message(sender=self.alice, receiver=self.bob, text="a"),
+            Message(sender=self.carol, receiver=self.bob, text="b"),
+            Message(sender=self.carol, receiver=self.bob, text="c"),
+        ])
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertEqual(Conversation.objects.unread_total(self.bob.id), 3)
+
+    def test_unread_total_is_one_indexed_query(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="a")
+        Message.objects.create(sender=self.bob, receiver=self.carol, text="b")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Conversation.objects.unread_total(self.bob.id), 1)
+        self.assertEqual(len(queries), 1)
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + queries[0]["sql"])
+                plan = " ".join(str(row) for row in cursor.fetchall())
+            self.assertIn("conversation_low_inbox_idx", plan)
+            self.assertIn("conversation_high_inbox_idx", plan)
+
+    def test_inbox_pages_by_last_activity(self):
+        for other in (self.alice, self.carol):
+            Message.objects.create(sender=other, receiver=self.bob, text="hello")
+        for i in range(3):
+            Message.objects.create(sender=self.bob, receiver=User.objects.create(username=f"u{i}"), text="hi")
+        Message.objects.create(sender=self.alice, receiver=self.bob, text="again")
+        self.client.force_login(self.bob)
+
+        url = reverse("conversation_list")
+        first = self.client.get(url).json()
+        self.assertEqual([c["username"] for c in first["conversations"]], ["alice", "u2", "u1", "u0", "carol"])
+        self.assertEqual(first["conversations"][0]["unread"], 2)
+        self.assertEqual(first["conversations"][0]["last_message"]["text"], "again")
+
+        views.INBOX_PAGE_SIZE, page_size = 2, views.INBOX_PAGE_SIZE
+        try:
+            names, cursor = [], ""
+            while cursor is not None:
+                with self.assertNumQueries(4):  # session, user, one query per inbox index
+                    data = self.client.get(url, {"cursor": cursor} if cursor else {}).json()
+                names += [c["username"] for c in data["conversations"]]
+                cursor = data["next_cursor"]
+        finally:
+            views.INBOX_PAGE_SIZE = page_size
+        self.assertEqual(names, ["alice", "u2", "u1", "u0", "carol"])
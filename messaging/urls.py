@@ -1,8 +1,11 @@
 # messaging/urls.py
 from django.urls import path
-from .views import save_message, chat_room
+from .views import save_message, message_history, conversation_list, unread_count, chat_room
 
 urlpatterns = [
     path("save/", save_message, name="save_message"),
+    path("history/", message_history, name="message_history"),
+    path("conversations/", conversation_list, name="conversation_list"),
+    path("unread/", unread_count, name="message_unread_count"),
     path("chat/<int:user_id>/<int:receiver_id>/", chat_room, name="chat_room"),
 ]
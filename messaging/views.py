@@ -1,14 +1,93 @@
 # messaging/views.py
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import Message
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from donations.pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from .models import Conversation, Message
+from .buffer import message_buffer, BufferFull
 from django.shortcuts import render, get_object_or_404
 
 User = get_user_model()
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+INBOX_PAGE_SIZE = 20
+
+
+def history_page(user_a_id, user_b_id, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One page of a conversation in chronological order, plus whether more rows exist.
+
+    Without cursors this is the latest ``limit`` messages. ``before=<id>``
+    walks back through older history; ``after=<id>`` returns what arrived
+    since the client's newest message. Both are ``id`` range scans on
+    ``message_history_idx``, so a page costs the same however long the
+    conversation is.
+    """
+    messages = Message.objects.between(user_a_id, user_b_id)
+    if after is not None:
+        rows = list(messages.filter(id__gt=after).order_by("id")[:limit + 1])
+        return rows[:limit], len(rows) > limit
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    rows = list(messages.order_by("-id")[:limit + 1])
+    return rows[:limit][::-1], len(rows) > limit
+
+
+def serialize_message(message):
+    return {
+        "message_id": message.id,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "text": message.text,
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
+def inbox_page(user_id, cursor=None, per_page=INBOX_PAGE_SIZE):
+    """
+    Conversations of ``user_id``, most recently active first.
+
+    The user is either side of the pair, so each side is paged on its own
+    inbox index and the two pages are merged: two O(page) queries rather
+    than an OR that has to sort every conversation of the user.
+    """
+    conversations = Conversation.objects.select_related("user_low", "user_high", "last_message")
+    rows = {}
+    more = False
+    for field in ("user_low", "user_high"):
+        paginator = KeysetPaginator(conversations.filter(**{field: user_id}),
+                                    date_field="last_timestamp", per_page=per_page)
+        page = paginator.page(cursor)
+        rows.update((c.id, c) for c in page)
+        more = more or page.has_next
+    rows = sorted(rows.values(), key=lambda c: (c.last_timestamp, c.id), reverse=True)
+    next_cursor = None
+    if more or len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = paginator.encode(rows[-1])
+    return KeysetPage(rows, next_cursor)
+
+
+def serialize_conversation(conversation, user_id):
+    other = conversation.user_high if conversation.user_low_id == user_id else conversation.user_low
+    last = conversation.last_message
+    return {
+        "key": conversation.key,
+        "user_id": other.id,
+        "username": other.username,
+        "last_message": serialize_message(last) if last else None,
+        "last_timestamp": conversation.last_timestamp.isoformat(),
+        "unread": conversation.unread_for(user_id),
+    }
+
+
 @api_view(['POST'])
 def save_message(request):
+    """Queue a message for batched persistence (see messaging/buffer.py)."""
     sender_id = request.data.get("sender_id")
     receiver_id = request.data.get("receiver_id")
     text = request.data.get("text")
@@ -17,26 +96,80 @@ def save_message(request):
         return Response({"status": "error", "detail": "sender_id, receiver_id and text are required"}, status=400)
 
     try:
-        sender = User.objects.get(id=sender_id)
-        receiver = User.objects.get(id=receiver_id)
-    except User.DoesNotExist:
-        return Response({"status": "error", "detail": "User not found"}, status=404)
+        sender_id, receiver_id = int(sender_id), int(receiver_id)
+    except (TypeError, ValueError):
+        return Response({"status": "error", "detail": "sender_id and receiver_id must be integers"}, status=400)
+
+    try:
+        message_buffer.add(sender_id, receiver_id, text)
+    except BufferFull:
+        return Response({"status": "error", "detail": "Message queue is full, retry later"},
+                        status=503, headers={"Retry-After": "1"})
+    return Response({"status": "queued"}, status=202)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def message_history(request):
+    """Cursor-paginated history between the current user and ``receiver_id``."""
+    try:
+        receiver_id = int(request.query_params["receiver_id"])
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        before = int(before) if before else None
+        after = int(after) if after else None
+        limit = int(request.query_params.get("limit", HISTORY_PAGE_SIZE))
+    except (KeyError, TypeError, ValueError):
+        return Response({"status": "error",
+                         "detail": "receiver_id is required; before, after and limit must be integers"},
+                        status=400)
+    if before is not None and after is not None:
+        return Response({"status": "error", "detail": "before and after are mutually exclusive"}, status=400)
+
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    messages, has_more = history_page(request.user.id, receiver_id, before=before, after=after, limit=limit)
+    return Response({
+        "messages": [serialize_message(m) for m in messages],
+        "has_more": has_more,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversation_list(request):
+    """The current user's inbox, keyset-paginated on last activity."""
+    try:
+        page = inbox_page(request.user.id, request.query_params.get("cursor"))
+    except InvalidCursor:
+        return Response({"status": "error", "detail": "Invalid cursor"}, status=400)
+    return Response({
+        "conversations": [serialize_conversation(c, request.user.id) for c in page],
+        "next_cursor": page.next_cursor,
+    })
 
-    message = Message.objects.create(sender=sender, receiver=receiver, text=text)
-    return Response({"status": "ok", "message_id": message.id})
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_count(request):
+    return Response({"unread": Conversation.objects.unread_total(request.user.id)})
 
 
+@login_required
 def chat_room(request, user_id, receiver_id):
-    user = get_object_or_404(User, id=user_id)
+    # A room is only ever opened by its own user: the URL id must be the session's
+    if request.user.id != user_id:
+        raise Http404
+    user = request.user
     receiver = get_object_or_404(User, id=receiver_id)
 
-    # Optionally load previous messages
-    messages = user.sent_messages.filter(receiver=receiver) | user.received_messages.filter(sender=receiver)
-    messages = messages.order_by("timestamp")
+    # Only the latest page; older messages are fetched from message_history on scroll
+    chat_messages, has_more = history_page(user.id, receiver.id)
+    Conversation.objects.mark_read(user.id, receiver.id)
 
     return render(request, "messaging/chat_room.html", {
         "user": user,
         "receiver": receiver,
-        "messages": messages
+        # Not "messages": base.html renders that variable as flash messages
+        "chat_messages": chat_messages,
+        "has_more": has_more,
     })
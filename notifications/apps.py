@@ -3,3 +3,17 @@ from django.apps import AppConfig
 
 class NotificationsConfig(AppConfig):
     name = 'notifications'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_init, post_save
+
+        from . import push, service, unread
+        from .models import Notification
+
+        uid = "notifications-unread"
+        post_init.connect(unread.remember_lu, sender=Notification, dispatch_uid=uid)
+        post_save.connect(unread.update_on_save, sender=Notification, dispatch_uid=uid)
+        post_delete.connect(unread.update_on_delete, sender=Notification, dispatch_uid=uid)
+        post_save.connect(push.push_on_commit, sender=Notification, dispatch_uid="notifications-push")
+        # Rows created by bulk_create send no post_save
+        service.register_channel('websocket', push.push)
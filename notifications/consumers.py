@@ -0,0 +1,71 @@
+# notifications/consumers.py
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from . import push, unread
+from .models import Notification
+
+# Notifications replayed on resume; a client further behind reloads the page
+MAX_RESUME = 100
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    WebSocket endpoint used by templates/notifications/live.html.
+
+    Each connected user joins their own group and receives the notifications
+    created for them once the transaction that created them commits. On
+    (re)connection the client sends ``{"type": "resume", "last_id": N}`` and
+    gets the notifications with an id above N it missed while disconnected.
+    Without ``last_id`` nothing is replayed; the reply only carries the id
+    to resume from next time.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get("user")
+        if not self.user or not self.user.is_authenticated:
+            await self.close(code=4403)
+            return
+        self.group_name = push.user_group(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get("type") != "resume":
+            await self.send_json({"type": "error", "detail": "Type de message inconnu"})
+            return
+        last_id = content.get("last_id")
+        if last_id is not None and (not isinstance(last_id, int) or isinstance(last_id, bool)):
+            await self.send_json({"type": "error", "detail": "last_id invalide"})
+            return
+        missed, last_id, unread_count = await self.missed_since(last_id)
+        await self.send_json({
+            "type": "resumed",
+            "notifications": missed,
+            "complete": len(missed) < MAX_RESUME,
+            "last_id": last_id,
+            "unread": unread_count,
+        })
+
+    # ============ GROUP EVENTS -> CLIENT ============
+    async def notification_created(self, event):
+        await self.send_json({"type": "notification", "notification": event["notification"],
+                              "unread": await self.unread_count()})
+
+    # ============ DATABASE ============
+    @database_sync_to_async
+    def missed_since(self, last_id):
+        mine = Notification.objects.filter(receiver_id=self.user.id)
+        if last_id is None:
+            latest = mine.order_by("-id").values_list("id", flat=True).first()
+            return [], latest or 0, unread.count(self.user)
+        missed = [push.as_event(notif) for notif in mine.filter(id__gt=last_id).order_by("id")[:MAX_RESUME]]
+        return missed, missed[-1]["id"] if missed else last_id, unread.count(self.user)
+
+    @database_sync_to_async
+    def unread_count(self):
+        return unread.count(self.user)
@@ -0,0 +1,11 @@
+# notifications/context_processors.py
+from functools import partial
+
+from django.utils.functional import SimpleLazyObject
+
+from . import unread
+
+
+def unread_notifications(request):
+    """Expose the unread badge lazily: pages that do not render it issue no query."""
+    return {'unread_notifications_count': SimpleLazyObject(partial(unread.count, request.user))}
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from notifications import retention
+
+
+class Command(BaseCommand):
+    help = ("Move the read notifications older than the retention period to the archive table, "
+            "in short batches that leave the active table available.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Retention in days (default: settings.NOTIFICATION_RETENTION_DAYS, else 30).")
+        parser.add_argument('--batch-size', type=int, default=retention.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to wait between batches.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count the notifications to archive without moving them.")
+
+    def handle(self, *args, **options):
+        run = retention.archive(days=options['days'], batch_size=options['batch_size'],
+                                pause=options['pause'], dry_run=options['dry_run'])
+        cutoff = run.cutoff.strftime('%Y-%m-%d %H:%M')
+        if options['dry_run']:
+            self.stdout.write(f"{run.rows} notification(s) lue(s) antérieure(s) au {cutoff} à archiver.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.rows} notification(s) archivée(s) (antérieures au {cutoff}) en {run.batches} lot(s), "
+            f"{round(run.seconds, 2)} s, {run.rows_per_second} lignes/s."))
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-17 16:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0006_compteur'),
+        ('notifications', '0002_notification_proposition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='demande',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='donations.demandedon'),
+        ),
+    ]
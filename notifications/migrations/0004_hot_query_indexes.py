@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 17:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0008_hot_query_indexes'),
+        ('notifications', '0003_notification_demande'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['receiver', 'lu', '-date_creation'], name='notif_receiver_lu_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('lu', False)), fields=['receiver', '-date_creation'], name='notif_receiver_unread_idx'),
+        ),
+    ]
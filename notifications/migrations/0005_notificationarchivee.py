@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 17:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0009_categorieclosure'),
+        ('notifications', '0004_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('lu', True)), fields=['date_creation'], name='notif_read_date_idx'),
+        ),
+        migrations.CreateModel(
+            name='NotificationArchivee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('titre', models.CharField(max_length=200)),
+                ('message', models.TextField()),
+                ('date_creation', models.DateTimeField()),
+                ('date_archivage', models.DateTimeField(default=django.utils.timezone.now)),
+                ('demande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='donations.demandedon')),
+                ('proposition', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='donations.propositiondon')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications_archivees', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['receiver', '-date_creation'], name='notif_archive_receiver_idx')],
+            },
+        ),
+    ]
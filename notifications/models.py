@@ -12,5 +12,34 @@ class Notification(models.Model):
     date_creation = models.DateTimeField(default=timezone.now)
     lu = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', 'lu', '-date_creation'], name='notif_receiver_lu_idx'),
+            # Unread badge: only unread rows are indexed, on backends supporting partial indexes
+            models.Index(fields=['receiver', '-date_creation'], condition=models.Q(lu=False),
+                         name='notif_receiver_unread_idx'),
+            # Retention job: read rows by age
+            models.Index(fields=['date_creation'], condition=models.Q(lu=True), name='notif_read_date_idx'),
+        ]
+
     def __str__(self):
         return f"Notification pour {self.receiver} - {self.titre}"
+
+
+class NotificationArchivee(models.Model):
+    """Read notification moved out of the active table by notifications.retention."""
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications_archivees")
+    proposition = models.ForeignKey(PropositionDon, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    demande = models.ForeignKey(DemandeDon, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    titre = models.CharField(max_length=200)
+    message = models.TextField()
+    date_creation = models.DateTimeField()
+    date_archivage = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', '-date_creation'], name='notif_archive_receiver_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification archivée pour {self.receiver} - {self.titre}"
@@ -0,0 +1,55 @@
+"""
+notifications/push.py - Push new notifications to their receivers' WebSocket group
+
+Rows created one at a time are pushed from the ``Notification`` post_save
+signal. Rows created in bulk by ``service.send()`` are pushed by its
+``websocket`` channel. In both cases the push runs after the transaction
+commits, so a client never hears of a row it cannot load yet. A
+notification missed while a client was disconnected is not lost: the
+consumer replays it on the next ``resume`` frame.
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    """Channel layer group receiving every notification addressed to a user."""
+    return f"notifications_user_{user_id}"
+
+
+def as_event(notif):
+    return {
+        "id": notif.id,
+        "titre": notif.titre,
+        "message": notif.message,
+        "lu": notif.lu,
+        "date_creation": notif.date_creation.isoformat(),
+        "proposition_id": notif.proposition_id,
+        "demande_id": notif.demande_id,
+    }
+
+
+def push(notifications):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        for notif in notifications:
+            async_to_sync(channel_layer.group_send)(user_group(notif.receiver_id), {
+                "type": "notification.created",
+                "notification": as_event(notif),
+            })
+    except Exception:
+        # The rows are saved; clients pick them up on their next resume
+        logger.exception("Could not push %d notification(s)", len(notifications))
+
+
+def push_on_commit(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: push([instance]))
@@ -0,0 +1,89 @@
+"""
+notifications/retention.py - Move old read notifications to the archive table
+
+``archive()`` moves the notifications read and older than the retention
+period from ``Notification`` to ``NotificationArchivee``. Unread
+notifications are never moved, so the unread counters stay correct. The
+rows go in chunks of ``batch_size``. Each chunk is its own short
+transaction: a ``bulk_create`` into the archive, then a ``DELETE`` by
+primary key. No lock is held across chunks, and ``pause`` seconds
+between chunks leave room for the live traffic. The chunks are selected
+through the partial ``notif_read_date_idx`` index.
+
+The retention period is ``settings.NOTIFICATION_RETENTION_DAYS`` (default
+30 days). ``archive_notifications`` runs it from cron.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchivee
+
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_BATCH_SIZE = 1000
+
+ARCHIVED_FIELDS = ('id', 'receiver_id', 'proposition_id', 'demande_id', 'titre', 'message', 'date_creation')
+
+
+class Run:
+    """Rows processed by one archive() call, with throughput metrics."""
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.rows = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds) if self.seconds else 0
+
+
+def retention_days():
+    return getattr(settings, 'NOTIFICATION_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def expired(cutoff):
+    return Notification.objects.filter(lu=True, date_creation__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one chunk of expired notifications; returns how many were moved."""
+    with transaction.atomic():
+        # Lock the chunk so it cannot be marked unread between the copy and the delete
+        rows = list(expired(cutoff).select_for_update().order_by('date_creation', 'id')
+                    .values(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        now = timezone.now()
+        NotificationArchivee.objects.bulk_create([
+            NotificationArchivee(date_archivage=now, **{k: v for k, v in row.items() if k != 'id'})
+            for row in rows
+        ])
+        Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def archive(days=None, batch_size=DEFAULT_BATCH_SIZE, pause=0, dry_run=False, max_batches=None):
+    cutoff = timezone.now() - timedelta(days=retention_days() if days is None else days)
+    run = Run(cutoff)
+    if dry_run:
+        run.rows = expired(cutoff).count()
+        return run
+    start = time.perf_counter()
+    while max_batches is None or run.batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        run.rows += moved
+        run.batches += 1
+        if moved < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    run.seconds = time.perf_counter() - start
+    return run
@@ -0,0 +1,118 @@
+"""
+notifications/service.py - Fan out notifications to many receivers in one INSERT
+
+Views and batch jobs call ``notify(receivers, event, payload)`` instead of
+creating ``Notification`` rows one at a time:
+- ``receivers`` may be users, user ids or a queryset of users. A queryset
+  is read with a single ``values_list`` query.
+- ``event`` names an entry of ``EVENTS``, the registry of title and message
+  templates. ``payload`` fills them in. Its ``proposition`` and ``demande``
+  entries also set the matching foreign keys of the rows.
+- every row is written with one ``bulk_create``.
+
+``build()`` and ``send()`` split those steps for callers that build rows
+for several events, such as the transporteur dispatcher.
+
+``bulk_create`` sends no signal. The rows are handed to the delivery
+channels registered with ``register_channel()`` once the transaction
+commits, so a rolled back request delivers nothing. The built-in ``web``
+channel updates the cached unread counters.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from . import unread
+from .models import Notification
+
+BATCH_SIZE = 500
+
+
+class Event:
+    """Title and message templates, formatted with ``str.format(**payload)``."""
+
+    def __init__(self, titre, message):
+        self.titre = titre
+        self.message = message
+
+    def render(self, payload):
+        return self.titre.format(**payload), self.message.format(**payload)
+
+
+EVENTS = {
+    'mission_proposition': Event(
+        "Nouvelle mission: Proposition #{proposition.id}",
+        "Vous avez été assigné pour ramasser ce don. Veuillez accepter ou refuser la mission.",
+    ),
+    'mission_demande': Event(
+        "Nouvelle mission: demande #{demande.id}",
+        "Vous avez été assigné pour transporter ce don. Veuillez accepter ou refuser la mission.",
+    ),
+    'remise_confirmee': Event(
+        "Remise confirmée: Proposition #{proposition.id}",
+        "Le donateur a confirmé la remise au transporteur. Vous pouvez ajouter ce don au stock.",
+    ),
+    'nouvelle_proposition': Event(
+        "Nouvelle proposition: #{proposition.id}",
+        "{proposition.participant_donateur} propose « {proposition.type_materiel} » à {proposition.ville}. "
+        "Elle attend une validation.",
+    ),
+}
+
+
+# ============ CHANNELS ============
+_channels = {}
+
+
+def register_channel(name, deliver):
+    """``deliver(notifications)`` is called after commit with the rows just created."""
+    _channels[name] = deliver
+
+
+def deliver_web(notifications):
+    for receiver_id, n in Counter(notif.receiver_id for notif in notifications if not notif.lu).items():
+        unread.adjust(receiver_id, n)
+
+
+register_channel('web', deliver_web)
+
+
+# ============ FAN-OUT ============
+def receiver_ids(receivers):
+    if isinstance(receivers, QuerySet):
+        return list(receivers.values_list('pk', flat=True))
+    return [getattr(receiver, 'pk', receiver) for receiver in receivers]
+
+
+def build(receiver_id, event, payload=None):
+    """An unsaved Notification of ``event`` for one receiver."""
+    payload = payload or {}
+    titre, message = EVENTS[event].render(payload)
+    return Notification(receiver_id=receiver_id, titre=titre, message=message,
+                        proposition=payload.get('proposition'), demande=payload.get('demande'))
+
+
+def send(notifications):
+    """Insert ``notifications`` and hand them to the channels after commit."""
+    if not notifications:
+        return notifications
+    created = Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+    transaction.on_commit(lambda: dispatch_to_channels(created))
+    return created
+
+
+def dispatch_to_channels(notifications):
+    for deliver in list(_channels.values()):
+        deliver(notifications)
+
+
+def notify(receivers, event, payload=None):
+    """Notify every receiver of ``event``; returns the created notifications."""
+    payload = payload or {}
+    titre, message = EVENTS[event].render(payload)
+    proposition, demande = payload.get('proposition'), payload.get('demande')
+    return send([Notification(receiver_id=receiver_id, titre=titre, message=message,
+                              proposition=proposition, demande=demande)
+                 for receiver_id in receiver_ids(receivers)])
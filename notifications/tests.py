@@ -1,3 +1,240 @@
-from django.test import TestCase
+from channels.db import database_sync_to_async
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from donations.tests import make_demande, make_proposition
+from messaging.tests import WebsocketClient
+from users.models import Membre, Participant, Transporteur
+from . import retention, service, unread
+from .context_processors import unread_notifications
+from .models import Notification, NotificationArchivee
+from .routing import websocket_urlpatterns
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Transporteur.objects.create(username="bob", vehicule="Camion", user_type="transporteur")
+
+    def notify(self, **kwargs):
+        return Notification.objects.create(receiver=self.user, titre="Mission", message="...", **kwargs)
+
+    def test_counter_follows_creation_reading_and_deletion(self):
+        self.notify()
+        self.assertEqual(unread.count(self.user), 1)
+        first = self.notify()
+        self.notify(lu=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread.count(self.user), 2)
+
+        first = Notification.objects.get(id=first.id)
+        first.lu = True
+        first.save()
+        first.save()
+        self.assertEqual(unread.count(self.user), 1)
+        Notification.objects.filter(lu=False).get().delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(unread.count(self.user), 0)
+        self.assertEqual(unread.count(self.user), Notification.objects.filter(lu=False).count())
+
+    def test_mark_all_read_is_one_update(self):
+        for _ in range(3):
+            self.notify()
+        self.client.force_login(self.user)
+        with self.assertNumQueries(1):
+            updated = unread.mark_all_read(self.user)
+        self.assertEqual(updated, 3)
+        self.assertFalse(Notification.objects.filter(lu=False).exists())
+        self.assertEqual(unread.count(self.user), 0)
+
+    def test_endpoint(self):
+        self.notify()
+        url = reverse('marquer_tout_lu')
+        self.assertEqual(self.client.post(url).status_code, 302)  # login required
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        response = self.client.post(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.json(), {'updated': 1, 'unread': 0})
+
+    def test_badge_is_lazy(self):
+        self.notify()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            context = unread_notifications(request)
+        with self.assertNumQueries(1):
+            rendered = Template("{% if unread_notifications_count %}{{ unread_notifications_count }}{% endif %}"
+                                ).render(Context(context))
+        self.assertEqual(rendered, "1")
+
+    def test_navbar_badge(self):
+        self.notify()
+        self.notify()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('transporteur_dashboard'))
+        self.assertContains(response, '<span class="badge bg-danger" data-unread-badge>2</span>', html=True)
+
+    def test_dashboards_have_live_panels(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('transporteur_dashboard'))
+        for panel in ('tournees', 'collectes', 'livraisons', 'terminees', 'vide'):
+            self.assertContains(response, f'data-live-panel="{panel}"', count=1)
+        self.assertContains(response, "addEventListener('notification'")
+        # The panel a refresh fetches shows the mission assigned since the page was loaded
+        participant = Participant.objects.create(username="alice")
+        demande = make_demande(participant, statut='validee', transporteur_livraison=self.user)
+        self.assertContains(self.client.get(reverse('transporteur_dashboard')), f"Livraison #{demande.id}")
+
+        self.client.force_login(participant)
+        response = self.client.get(reverse('participant_dashboard'))
+        self.assertContains(response, 'data-live-panel="propositions" data-live-kinds="proposition"')
+        self.assertContains(response, "addEventListener('notification'")
+
+    def test_anonymous_and_participant_dashboard(self):
+        request = RequestFactory().get('/')
+        request.user = type('Anonymous', (), {'is_authenticated': False})()
+        self.assertEqual(unread.count(request.user), 0)
+        participant = Participant.objects.create(username="alice")
+        Notification.objects.create(receiver=participant, titre="Info", message="...")
+        self.client.force_login(participant)
+        self.assertEqual(self.client.get(reverse('participant_dashboard')).context['notifications_count'], 1)
+
+
+class FanOutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.participant = Participant.objects.create(username="alice")
+        self.proposition = make_proposition(self.participant)
+
+    def test_members_are_notified_in_one_insert(self):
+        for i in range(30):
+            Membre.objects.create(username=f"membre{i}", user_type="membre")
+        with self.assertNumQueries(2):  # the receiver ids, then one INSERT
+            created = service.notify(Membre.objects.all(), 'nouvelle_proposition', {'proposition': self.proposition})
+        self.assertEqual(len(created), 30)
+        notif = Notification.objects.filter(proposition=self.proposition).first()
+        self.assertEqual(notif.titre, f"Nouvelle proposition: #{self.proposition.id}")
+        self.assertIn("Chaise", notif.message)
+
+    def test_channels_run_after_commit(self):
+        membre = Membre.objects.create(username="membre", user_type="membre")
+        self.assertEqual(unread.count(membre), 0)
+        delivered = []
+        service.register_channel('test', delivered.extend)
+        self.addCleanup(service._channels.pop, 'test')
+        with self.captureOnCommitCallbacks() as callbacks:
+            service.notify([membre], 'remise_confirmee', {'proposition': self.proposition})
+        self.assertEqual(delivered, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(delivered), 1)
+        # The web channel kept the cached counter in step
+        with self.assertNumQueries(0):
+            self.assertEqual(unread.count(membre), 1)
+
+    def test_assign_view_notifies_through_the_registry(self):
+        transporteur = Transporteur.objects.create(username="bob", vehicule="Camion")
+        demande = make_demande(self.participant, statut='validee')
+        self.client.force_login(Membre.objects.create(username="membre", user_type="membre"))
+        self.client.post(reverse('assign_transporteur_demande', args=[demande.id]),
+                         {'transporteur_id': transporteur.id})
+        notif = Notification.objects.get(receiver=transporteur)
+        self.assertEqual((notif.demande_id, notif.titre), (demande.id, f"Nouvelle mission: demande #{demande.id}"))
+
+
+
+class LivePushTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Transporteur.objects.create(username="bob", vehicule="Camion", user_type="transporteur")
+
+    def client_for(self, user):
+        return WebsocketClient("/ws/notifications/", user, websocket_urlpatterns)
+
+    def notify(self, titre="Mission"):
+        return Notification.objects.create(receiver=self.user, titre=titre, message="...")
+
+    async def test_push_after_commit_and_resume(self):
+        before = await database_sync_to_async(self.notify)("Avant")
+        client = self.client_for(self.user)
+        self.assertTrue(await client.connect())
+        await client.send_json_to({"type": "resume"})
+        resumed = await client.receive_json_from()
+        self.assertEqual((resumed["notifications"], resumed["last_id"], resumed["unread"]), ([], before.id, 1))
+
+        def create_in_transaction():
+            with transaction.atomic():
+                notif = self.notify("Pendant")
+                pending = client._output_queue.qsize() if client._output_queue else 0
+            return notif, pending
+
+        notif, pending = await database_sync_to_async(create_in_transaction)()
+        self.assertEqual(pending, 0)  # nothing was sent before the commit
+        pushed = await client.receive_json_from()
+        self.assertEqual((pushed["type"], pushed["notification"]["id"], pushed["unread"]),
+                         ("notification", notif.id, 2))
+        await client.disconnect()
+
+        # Missed while disconnected: only what comes after last_id is replayed
+        def notify_in_bulk():
+            alice = Participant.objects.create(username="alice")
+            return service.notify([self.user, alice], 'mission_demande', {'demande': make_demande(alice)})
+
+        missed = await database_sync_to_async(notify_in_bulk)()
+        client = self.client_for(self.user)
+        self.assertTrue(await client.connect())
+        await client.send_json_to({"type": "resume", "last_id": notif.id})
+        resumed = await client.receive_json_from()
+        self.assertEqual([n["id"] for n in resumed["notifications"]], [missed[0].id])
+        self.assertEqual(resumed["last_id"], missed[0].id)
+        self.assertTrue(resumed["complete"])
+        await client.disconnect()
+
+    async def test_anonymous_is_refused(self):
+        client = self.client_for(type('Anonymous', (), {'is_authenticated': False})())
+        self.assertFalse(await client.connect())
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Transporteur.objects.create(username="bob", vehicule="Camion")
+        old = timezone.now() - timedelta(days=45)
+        Notification.objects.bulk_create(
+            [Notification(receiver=self.user, titre=f"Ancienne {i}", message="...", lu=True, date_creation=old)
+             for i in range(25)]
+            + [Notification(receiver=self.user, titre="Non lue", message="...", date_creation=old),
+               Notification(receiver=self.user, titre="Récente", message="...", lu=True)])
+
+    def test_archives_old_read_notifications_in_batches(self):
+        run = retention.archive(batch_size=10)
+        self.assertEqual((run.rows, run.batches), (25, 3))
+        self.assertEqual(set(Notification.objects.values_list('titre', flat=True)), {"Non lue", "Récente"})
+        archived = NotificationArchivee.objects.filter(receiver=self.user)
+        self.assertEqual(archived.count(), 25)
+        self.assertTrue(archived.filter(titre="Ancienne 0").exists())
+        self.assertEqual(retention.archive().rows, 0)
+
+    def test_batch_is_bounded(self):
+        # Savepoint, SELECT, INSERT, delete() (SELECT and DELETE by id), release: whatever the batch size
+        with self.assertNumQueries(6):
+            self.assertEqual(retention.archive_batch(timezone.now() - timedelta(days=30), 10), 10)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_notifications', '--dry-run', stdout=out)
+        self.assertIn("25 notification(s)", out.getvalue())
+        self.assertEqual(NotificationArchivee.objects.count(), 0)
+        call_command('archive_notifications', '--days', '60', stdout=out)
+        self.assertEqual(NotificationArchivee.objects.count(), 0)
+        call_command('archive_notifications', '--batch-size', '7', stdout=out)
+        self.assertIn("25 notification(s) archivée(s)", out.getvalue())
+        self.assertIn("4 lot(s)", out.getvalue())
@@ -0,0 +1,79 @@
+"""
+notifications/unread.py - Per-user unread notification counter, kept in cache
+
+The count of a user's unread notifications is cached under one key per
+user. The first read after a miss computes it with a ``COUNT(*)`` on the
+partial ``notif_receiver_unread_idx`` index. After that, the signal
+receivers adjust it in place:
+- a notification created unread adds one
+- a notification saved with ``lu`` switched from False to True removes one,
+  and the reverse adds one
+- deleting an unread notification removes one
+
+Writes that send no signal (``bulk_create``, ``QuerySet.update()``) call
+``forget()`` for the receivers they touched, and the next read recounts.
+The counter also expires after ``TTL`` seconds. This bounds any drift
+from a rolled back transaction.
+"""
+
+from django.core.cache import cache
+
+from .models import Notification
+
+TTL = 600
+
+
+def key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def count(user):
+    """Unread notifications of ``user``; 0 without a query for anonymous users."""
+    if not getattr(user, 'is_authenticated', False):
+        return 0
+    n = cache.get(key(user.pk))
+    if n is None:
+        n = Notification.objects.filter(receiver_id=user.pk, lu=False).count()
+        cache.set(key(user.pk), n, TTL)
+    return n
+
+
+def adjust(user_id, delta):
+    """Add ``delta`` to a cached counter; a missing counter is left to the next read."""
+    try:
+        if cache.incr(key(user_id), delta) < 0:
+            forget([user_id])
+    except ValueError:
+        pass
+
+
+def forget(user_ids):
+    cache.delete_many([key(user_id) for user_id in set(user_ids)])
+
+
+def mark_all_read(user):
+    """Mark every notification of ``user`` as read in one UPDATE; returns how many changed."""
+    updated = Notification.objects.filter(receiver_id=user.pk, lu=False).update(lu=True)
+    cache.set(key(user.pk), 0, TTL)
+    return updated
+
+
+# ============ SIGNALS ============
+def remember_lu(sender, instance, **kwargs):
+    instance._lu_loaded = instance.__dict__.get('lu')
+
+
+def update_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = None if created else getattr(instance, '_lu_loaded', None)
+    if created and not instance.lu:
+        adjust(instance.receiver_id, 1)
+    elif before is not None and before != instance.lu:
+        adjust(instance.receiver_id, -1 if instance.lu else 1)
+    instance._lu_loaded = instance.lu
+
+
+def update_on_delete(sender, instance, **kwargs):
+    if not instance.__dict__.get('lu', True):
+        adjust(instance.receiver_id, -1)
@@ -1,5 +1,7 @@
 from django.urls import path
 
+from .views import marquer_tout_lu
+
 urlpatterns=[
-    
-]
\ No newline at end of file
+    path('tout-lu/', marquer_tout_lu, name='marquer_tout_lu'),
+]
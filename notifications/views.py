@@ -1,3 +1,20 @@
-from django.shortcuts import render
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
 
-# Create your views here.
+from . import unread
+
+
+@login_required
+@require_POST
+def marquer_tout_lu(request):
+    """Mark all the user's notifications as read (one UPDATE)."""
+    updated = unread.mark_all_read(request.user)
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'json' in request.headers.get('accept', ''):
+        return JsonResponse({'updated': updated, 'unread': 0})
+    next_url = request.POST.get('next') or request.META.get('HTTP_REFERER')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('home')
@@ -57,6 +57,7 @@ TEMPLATES = [
         'OPTIONS': {
             'context_processors': [
                 'donations.context_processors.home_stats',  # 
+                'notifications.context_processors.unread_notifications',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
@@ -73,6 +74,40 @@ STATICFILES_DIRS = [
 
 
 WSGI_APPLICATION = 'project.wsgi.application'
+ASGI_APPLICATION = 'project.asgi.application'
+
+
+# Channels
+# Redis in production (set REDIS_URL), in-memory layer for development and tests.
+# The in-memory layer only works within a single process.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Write-behind buffer for messages posted to /api/messages/save/ (messaging/buffer.py)
+CHAT_MESSAGE_BUFFER = {
+    'MAX_BATCH': 100,
+    'FLUSH_INTERVAL_MS': 50,
+    'MAX_SIZE': 10000,
+    'PUT_TIMEOUT_MS': 500,
+    'MAX_ATTEMPTS': 3,
+}
+
+# Read notifications older than this are moved to the archive (notifications/retention.py)
+NOTIFICATION_RETENTION_DAYS = 30
 
 
 # Database
@@ -123,4 +158,15 @@ USE_TZ = True
 
 
 
-STATIC_ROOT = BASE_DIR / 'staticfiles'
\ No newline at end of file
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Uploaded photos and their renditions (donations/images.py)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Photos are stored once per content, under MEDIA_ROOT/blobs/ (donations/storage.py)
+    'photos': {'BACKEND': 'donations.storage.ContentAddressedStorage'},
+}
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path , include
 
@@ -9,3 +11,6 @@ urlpatterns = [
     path("api/messages/", include("messaging.urls")),
 
 ]
+
+# Uploaded photos; in production the web server serves MEDIA_ROOT
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
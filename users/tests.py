@@ -1,3 +1,136 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from donations.models import DemandeDon, PropositionDon
+from donations.tests import make_demande, make_proposition
+from messaging.models import Message
+from notifications.models import Notification
+from .models import Membre, Participant, Transporteur
+
+
+class MembreDashboardTests(TestCase):
+    def setUp(self):
+        self.membre = Membre.objects.create(username="membre", user_type="membre")
+        self.client.force_login(self.membre)
+        self.participant = Participant.objects.create(username="alice")
+
+    def section(self, name, **params):
+        response = self.client.get(reverse('membre_dashboard_section', args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_keyset_pages_cover_every_row_once(self):
+        ids = {make_proposition(self.participant).id for _ in range(30)}
+        seen, cursor = [], None
+        while True:
+            data = self.section('propositions', **({'cursor': cursor} if cursor else {}))
+            seen += [int(pk) for pk in dict.fromkeys(re.findall(r'Proposition #(\d+)', data['html']))]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(set(seen), ids)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_statut_filter(self):
+        make_demande(self.participant)
+        make_demande(self.participant, statut='validee')
+        data = self.section('demandes', statut='validee')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['statut'], 'validee')
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('membre_dashboard_section', args=['dons']), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_dashboard_page_is_bounded(self):
+        for _ in range(40):
+            make_proposition(self.participant)
+            make_demande(self.participant)
+        response = self.client.get(reverse('membre_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['propositions']['page']), 12)
+        self.assertTrue(response.context['propositions']['page'].has_next)
+
+
+class RoleDashboardQueryCountTests(TestCase):
+    """Dashboards must not issue per-row queries for the relations their templates read."""
+
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.transporteur = Transporteur.objects.create(username="bob", vehicule="Camion")
+        self.membre = Membre.objects.create(username="carol", user_type="membre")
+
+    def add_rows(self, n):
+        for i in range(n):
+            make_proposition(self.participant, transporteur_assignee=self.transporteur,
+                             transporteur_statut='acceptee', membre_validateur=self.membre,
+                             statut='terminee' if i % 2 else 'validee')
+            make_demande(self.participant, transporteur_livraison=self.transporteur,
+                         statut='terminee' if i % 2 else 'validee')
+
+    def count_queries(self, url_name, user):
+        self.client.force_login(user)
+        cache.clear()  # measure both runs with a cold unread counter
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertBounded(self, url_name, user):
+        self.add_rows(2)
+        few = self.count_queries(url_name, user)
+        self.add_rows(8)
+        self.assertEqual(self.count_queries(url_name, user), few)
+
+    def test_transporteur_dashboard(self):
+        self.assertBounded('transporteur_dashboard', self.transporteur)
+
+    def test_participant_dashboard(self):
+        self.assertBounded('participant_dashboard', self.participant)
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class DashboardQueryPlanTests(TestCase):
+    """The hot dashboard filters must be served by the Meta.indexes declared for them."""
+
+    def setUp(self):
+        self.participant = Participant.objects.create(username="alice")
+        self.transporteur = Transporteur.objects.create(username="bob", vehicule="Camion")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_transporteur_dashboard_queries(self):
+        self.assertUsesIndex(PropositionDon.objects.terminated_for_transporteur(self.transporteur),
+                             'proposition_transport_idx')
+        self.assertUsesIndex(PropositionDon.objects.active_for_transporteur(self.transporteur),
+                             'proposition_transport_idx')
+        self.assertUsesIndex(DemandeDon.objects.terminated_for_transporteur(self.transporteur),
+                             'demande_transport_idx')
+
+    def test_participant_dashboard_queries(self):
+        self.assertUsesIndex(DemandeDon.objects.for_participant(self.participant)[:5],
+                             'demande_requerant_idx')
+        self.assertUsesIndex(PropositionDon.objects.for_participant(self.participant)[:5],
+                             'proposition_donateur_idx')
+        self.assertUsesIndex(
+            Notification.objects.filter(receiver=self.participant, lu=False).order_by('-date_creation'),
+            'notif_receiver_unread_idx')
+
+    def test_membre_dashboard_statut_filter(self):
+        self.assertUsesIndex(
+            PropositionDon.objects.filter(statut='en_attente').order_by('-date_proposition', '-id')[:12],
+            'proposition_statut_date_idx')
 
-# Create your tests here.
+    def test_chat_history_query(self):
+        self.assertUsesIndex(
+            Message.objects.filter(sender=self.participant, receiver=self.transporteur).order_by('timestamp'),
+            'message_conversation_idx')
@@ -2,11 +2,11 @@ from django.urls import path
 from .views import (
     register_view, login_view, home, logout_view,
     create_admin, create_membre, create_transporteur,
-    membre_dashboard, assign_transporteur_view,
+    membre_dashboard, membre_dashboard_section, assign_transporteur_view,
     transporteur_notifications, notification_detail,
     transporteur_reponse, transporteur_dashboard,
     terminer_proposition, 
-    get_user,
+    get_user, tournees_transporteur,
       marquer_demande_terminee_transporteur ,
     demandes_de_recuperateur, # ✅ make sure this is imported
     transporteur_confirme_proposition,
@@ -30,6 +30,7 @@ urlpatterns = [
 
     # Membre dashboard
     path('dashboard/membre/', membre_dashboard, name='membre_dashboard'),
+    path('dashboard/membre/sections/<str:section>/', membre_dashboard_section, name='membre_dashboard_section'),
     path('dashboard/membre/proposition/<int:proposition_id>/assign/', assign_transporteur_view, name='assign_transporteur'),
 
     # Transporteur notifications
@@ -53,6 +54,7 @@ path("dashboard/transporteur/demande/<int:demande_id>/terminer/",
     # Transporteur marks a proposition as terminée
     path("dashboard/transporteur/proposition/<int:proposition_id>/terminer/", terminer_proposition, name="terminer_proposition"),
     path("api/user/<int:user_id>/", get_user),
+    path("api/transporteur/tournees/", tournees_transporteur, name="tournees_transporteur"),
     
 
    path('demandes_recuperateur/<int:user_id>/',demandes_de_recuperateur,name="demandes_de_recuperateur"),
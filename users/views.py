@@ -6,11 +6,13 @@ Organized by functionality with consistent structure
 # ============ IMPORTS ============
 # Django core
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import login, logout, get_user_model
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.http import JsonResponse
 
 # Decorators
@@ -19,7 +21,11 @@ from functools import wraps
 # Local models and forms
 from .forms import RegisterForm, TransporteurCreateForm, MembreCreateForm, AdminCreateForm
 from .models import User, Participant, Admin, Membre, Transporteur
+from donations import routes, transitions
+from donations.dispatch import Dispatcher
 from donations.models import DemandeDon, PropositionDon, Don
+from donations.pagination import KeysetPaginator, InvalidCursor
+from notifications import service as notifications, unread
 from notifications.models import Notification
 
 
@@ -39,9 +45,21 @@ def admin_required(view_func):
 
 
 # ============ HELPER FUNCTIONS ============
-def getAvailableTransporteurs():
-    """Get all available transporters."""
-    return Transporteur.objects.filter(disponibilite=True)
+def getAvailableTransporteurs(mission=None):
+    """Get all available transporters, best first for ``mission`` (a proposition or demande) when given."""
+    if mission is None:
+        return Transporteur.objects.filter(disponibilite=True)
+    return Dispatcher().rank_for(mission)
+
+
+def requested_day(request):
+    """The ?date=YYYY-MM-DD of the request, today when absent, None when invalid."""
+    if not request.GET.get("date"):
+        return timezone.localdate()
+    try:
+        return parse_date(request.GET["date"])
+    except ValueError:
+        return None
 
 
 # ============ AUTHENTICATION VIEWS ============
@@ -101,23 +119,19 @@ def transporteur_confirme_proposition(request, proposition_id):
         action = request.POST.get('action')
         
         if action == 'accepter':
-            proposition.transporteur_statut = 'acceptee'
-            proposition.save()
-            messages.success(request, f"✅ Mission #{proposition.id} acceptée!")
+            if transitions.transition_or_warn(request, proposition, 'accepter_mission'):
+                messages.success(request, f"✅ Mission #{proposition.id} acceptée!")
             return redirect('transporteur_dashboard')
             
         elif action == 'refuser':
-            raison_refus = request.POST.get('raison_refus', '')
-            proposition.transporteur_statut = 'refusee'
-            proposition.raison_refus_transporteur = raison_refus
-            proposition.save()
-            messages.warning(request, f"❌ Mission #{proposition.id} refusée.")
+            if transitions.transition_or_warn(request, proposition, 'refuser_mission',
+                                              raison_refus_transporteur=request.POST.get('raison_refus', '')):
+                messages.warning(request, f"❌ Mission #{proposition.id} refusée.")
             return redirect('transporteur_dashboard')
             
         elif action == 'marquer comme terminer':
-            proposition.statut = 'terminee'
-            proposition.save()
-            messages.success(request, f"✅ Mission #{proposition.id} terminée!")
+            if transitions.transition_or_warn(request, proposition, 'terminer'):
+                messages.success(request, f"✅ Mission #{proposition.id} terminée!")
             return redirect('transporteur_dashboard')
     
     # GET request
@@ -159,19 +173,11 @@ def participant_dashboard(request):
         return redirect('home')
     
     # Get user's propositions and demandes
-    propositions = PropositionDon.objects.filter(
-        participant_donateur=request.user.participant
-    ).order_by('-date_proposition')[:5]
-    
-    demandes = DemandeDon.objects.filter(
-        participant_requerant=request.user.participant
-    ).order_by('-date_demande')[:5]
+    propositions = PropositionDon.objects.for_participant(request.user.participant)[:5]
+    demandes = DemandeDon.objects.for_participant(request.user.participant)[:5]
     
-    # Get unread notifications
-    notifications_count = Notification.objects.filter(
-        receiver=request.user,
-        lu=False
-    ).count()
+    # Unread notifications, from the cached counter
+    notifications_count = unread.count(request.user)
     
     context = {
         'propositions': propositions,
@@ -229,19 +235,89 @@ def create_transporteur(request):
 
 
 # ============ DASHBOARD VIEWS ============
+# Each membre dashboard panel is keyset-paginated and can be reloaded on its
+# own through membre_dashboard_section.
+MEMBRE_SECTIONS = {
+    "demandes": {
+        "queryset": lambda: DemandeDon.objects.select_related("participant_requerant"),
+        "date_field": "date_demande",
+        "statuts": DemandeDon.STATUT_CHOICES,
+        "template": "dashboards/membre/demandes.html",
+    },
+    "propositions": {
+        "queryset": lambda: PropositionDon.objects.select_related("participant_donateur"),
+        "date_field": "date_proposition",
+        "statuts": PropositionDon.STATUT_CHOICES,
+        "template": "dashboards/membre/propositions.html",
+    },
+    "transporteurs": {
+        "queryset": lambda: Transporteur.objects.all(),
+        "date_field": None,
+        "statuts": (),
+        "template": "dashboards/membre/transporteurs.html",
+    },
+    "dons": {
+        "queryset": lambda: Don.objects.select_related("categorie"),
+        "date_field": "date_entree_stock",
+        "statuts": Don.STATUT_CHOICES,
+        "template": "dashboards/membre/dons.html",
+    },
+}
+
+
+def getMembreSection(request, name, prefix=""):
+    """Load one page of a membre dashboard panel, honouring its statut filter and cursor."""
+    section = MEMBRE_SECTIONS[name]
+    queryset = section["queryset"]()
+    statut = request.GET.get(f"{prefix}statut", "")
+    if statut in dict(section["statuts"]):
+        queryset = queryset.filter(statut=statut)
+    else:
+        statut = ""
+    paginator = KeysetPaginator(queryset, date_field=section["date_field"])
+    return {
+        "name": name,
+        "statut": statut,
+        "statuts": section["statuts"],
+        "count": queryset.count(),
+        "page": paginator.page(request.GET.get(f"{prefix}cursor")),
+    }
+
+
 @login_required
 def membre_dashboard(request):
     """Member dashboard showing donations, requests, and transporters."""
-    demandes = DemandeDon.objects.all()
-    propositions = PropositionDon.objects.all()
-    transporteurs = Transporteur.objects.all()
-    dons = Don.objects.all()
+    try:
+        sections = {name: getMembreSection(request, name, prefix=f"{name}_")
+                    for name in ("demandes", "propositions", "transporteurs")}
+    except InvalidCursor:
+        messages.error(request, "Pagination invalide.")
+        return redirect("membre_dashboard")
 
     return render(request, "dashboards/membre.html", {
-        "demandes": demandes,
-        "propositions": propositions,
-        "transporteurs": transporteurs,
-        "dons": dons,
+        "demandes": sections["demandes"],
+        "propositions": sections["propositions"],
+        "transporteurs": sections["transporteurs"],
+    })
+
+
+@login_required
+def membre_dashboard_section(request, section):
+    """JSON fragment for one dashboard panel: rendered cards plus the next cursor."""
+    if section not in MEMBRE_SECTIONS:
+        return JsonResponse({"error": "Section inconnue"}, status=404)
+    try:
+        data = getMembreSection(request, section)
+    except InvalidCursor:
+        return JsonResponse({"error": "Curseur invalide"}, status=400)
+
+    html = render_to_string(MEMBRE_SECTIONS[section]["template"],
+                            {"items": data["page"]}, request=request)
+    return JsonResponse({
+        "html": html,
+        "count": data["count"],
+        "statut": data["statut"],
+        "next_cursor": data["page"].next_cursor,
     })
 
 
@@ -264,11 +340,9 @@ def transporteur_dashboard(request):
                 # Check if this transporter owns the proposition
                 if proposition.transporteur_assignee == request.user.transporteur:
                     # Mark proposition as completed
-                    proposition.statut = 'terminee'
-                    proposition.date_validation = timezone.now()
-                    proposition.save()
-                    
-                    messages.success(request, f"Collecte #{proposition.id} marquée comme terminée !")
+                    if transitions.transition_or_warn(request, proposition, 'terminer',
+                                                      date_validation=timezone.now()):
+                        messages.success(request, f"Collecte #{proposition.id} marquée comme terminée !")
                     return redirect('transporteur_dashboard')
                 else:
                     messages.error(request, "Vous n'êtes pas autorisé à terminer cette collecte.")
@@ -281,11 +355,8 @@ def transporteur_dashboard(request):
                 # Check if this transporter owns the demande
                 if demande.transporteur_livraison == request.user.transporteur:
                     # Mark demande as completed
-                    demande.statut = 'terminee'
-                    demande.date_validation = timezone.now()
-                    demande.save()
-                    
-                    messages.success(request, f"Livraison #{demande.id} marquée comme terminée !")
+                    if transitions.transition_or_warn(request, demande, 'livrer', date_validation=timezone.now()):
+                        messages.success(request, f"Livraison #{demande.id} marquée comme terminée !")
                     return redirect('transporteur_dashboard')
                 else:
                     messages.error(request, "Vous n'êtes pas autorisé à terminer cette livraison.")
@@ -298,44 +369,28 @@ def transporteur_dashboard(request):
                 # Check if this transporter owns the demande
                 if demande.transporteur_livraison == request.user.transporteur:
                     # Accept the demande
-                    demande.transporteur_confirme = True
-                    demande.statut = 'validee'  # Keep as validee, transporter can now complete it
-                    demande.save()
-                    
-                    messages.success(request, f"Mission #{demande.id} acceptée !")
+                    if transitions.transition_or_warn(request, demande, 'accepter_mission'):
+                        messages.success(request, f"Mission #{demande.id} acceptée !")
                     return redirect('transporteur_dashboard')
                 else:
                     messages.error(request, "Vous n'êtes pas autorisé à accepter cette mission.")
     
-    # Get ACTIVE propositions where transporteur is assigned and accepted (not terminated)
-    propositions = PropositionDon.objects.filter(
-        transporteur_assignee=request.user.transporteur,
-        transporteur_statut='acceptee'
-    ).exclude(statut='terminee').order_by('-date_proposition')
-
-    # Get TERMINATED propositions
-    terminated_propositions = PropositionDon.objects.filter(
-        transporteur_assignee=request.user.transporteur,
-        transporteur_statut='acceptee',
-        statut='terminee'
-    ).order_by('-date_validation')
-
-    # Get ACTIVE demandes where transporteur is assigned (not terminated)
-    demandes = DemandeDon.objects.filter(
-        transporteur_livraison=request.user.transporteur
-    ).exclude(statut__in=['annulee', 'terminee']).order_by('-date_demande')
-
-    # Get TERMINATED demandes
-    terminated_demandes = DemandeDon.objects.filter(
-        transporteur_livraison=request.user.transporteur,
-        statut='terminee'
-    ).order_by('-date_validation')
+    transporteur = request.user.transporteur
+    propositions = PropositionDon.objects.active_for_transporteur(transporteur)
+    terminated_propositions = PropositionDon.objects.terminated_for_transporteur(transporteur)
+    demandes = DemandeDon.objects.active_for_transporteur(transporteur)
+    terminated_demandes = DemandeDon.objects.terminated_for_transporteur(transporteur)
+
+    # Tours are planned from the missions listed below, without loading them twice
+    day = requested_day(request) or timezone.localdate()
+    tournees = routes.plan_day(transporteur, day, propositions, demandes)
 
     return render(request, "dashboards/transporteur.html", {
         "propositions": propositions,
         "demandes": demandes,
         "terminated_propositions": terminated_propositions,
         "terminated_demandes": terminated_demandes,
+        "tournees": tournees,
     })
 
 @login_required
@@ -358,11 +413,9 @@ def mes_missions_acceptees(request):
                 # Check if this transporter owns the proposition
                 if proposition.transporteur_assignee == request.user.transporteur:
                     # Mark proposition as completed
-                    proposition.statut = 'terminee'
-                    proposition.date_validation = timezone.now()
-                    proposition.save()
-                    
-                    messages.success(request, f"Collecte #{proposition.id} marquée comme terminée !")
+                    if transitions.transition_or_warn(request, proposition, 'terminer',
+                                                      date_validation=timezone.now()):
+                        messages.success(request, f"Collecte #{proposition.id} marquée comme terminée !")
                     return redirect('mes_missions_acceptees')
                 else:
                     messages.error(request, "Vous n'êtes pas autorisé à terminer cette collecte.")
@@ -375,11 +428,8 @@ def mes_missions_acceptees(request):
                 # Check if this transporter owns the demande
                 if demande.transporteur_livraison == request.user.transporteur:
                     # Mark demande as completed
-                    demande.statut = 'terminee'
-                    demande.date_validation = timezone.now()
-                    demande.save()
-                    
-                    messages.success(request, f"Livraison #{demande.id} marquée comme terminée !")
+                    if transitions.transition_or_warn(request, demande, 'livrer', date_validation=timezone.now()):
+                        messages.success(request, f"Livraison #{demande.id} marquée comme terminée !")
                     return redirect('mes_missions_acceptees')
                 else:
                     messages.error(request, "Vous n'êtes pas autorisé à terminer cette livraison.")
@@ -392,38 +442,17 @@ def mes_missions_acceptees(request):
                 # Check if this transporter owns the demande
                 if demande.transporteur_livraison == request.user.transporteur:
                     # Accept the demande
-                    demande.transporteur_confirme = True
-                    demande.statut = 'validee'
-                    demande.save()
-                    
-                    messages.success(request, f"Mission #{demande.id} acceptée !")
+                    if transitions.transition_or_warn(request, demande, 'accepter_mission'):
+                        messages.success(request, f"Mission #{demande.id} acceptée !")
                     return redirect('mes_missions_acceptees')
                 else:
                     messages.error(request, "Vous n'êtes pas autorisé à accepter cette mission.")
     
-    # Get ACTIVE propositions (not terminated)
-    propositions = PropositionDon.objects.filter(
-        transporteur_assignee=request.user.transporteur,
-        transporteur_statut='acceptee'
-    ).exclude(statut='terminee').order_by('-date_proposition')
-    
-    # Get TERMINATED propositions
-    terminated_propositions = PropositionDon.objects.filter(
-        transporteur_assignee=request.user.transporteur,
-        transporteur_statut='acceptee',
-        statut='terminee'
-    ).order_by('-date_validation')
-    
-    # Get ACTIVE demands (not terminated)
-    demandes = DemandeDon.objects.filter(
-        transporteur_livraison=request.user.transporteur
-    ).exclude(statut='terminee').order_by('-date_demande')
-    
-    # Get TERMINATED demands
-    terminated_demandes = DemandeDon.objects.filter(
-        transporteur_livraison=request.user.transporteur,
-        statut='terminee'
-    ).order_by('-date_validation')
+    transporteur = request.user.transporteur
+    propositions = PropositionDon.objects.active_for_transporteur(transporteur)
+    terminated_propositions = PropositionDon.objects.terminated_for_transporteur(transporteur)
+    demandes = DemandeDon.objects.active_for_transporteur(transporteur)
+    terminated_demandes = DemandeDon.objects.terminated_for_transporteur(transporteur)
     
     context = {
         'propositions': propositions,
@@ -434,6 +463,9 @@ def mes_missions_acceptees(request):
     
     return render(request, 'donations/propositions/mes_missions_acceptees.html', context)
 # ============ NOTIFICATION VIEWS ============
+NOTIFICATIONS_LIMIT = 100
+
+
 @login_required
 def transporteur_notifications(request):
     """Display notifications for the current transporter."""
@@ -441,9 +473,11 @@ def transporteur_notifications(request):
         messages.error(request, "Accès réservé aux transporteurs.")
         return redirect('home')
 
-    notifications = request.user.transporteur.notifications.order_by('-date_creation')
+    # Latest first, bounded: older read ones end up in the archive anyway
+    notifications = list(request.user.transporteur.notifications
+                         .order_by('-date_creation')[:NOTIFICATIONS_LIMIT])
     return render(request, 'notifications/transporteur/notifications.html', 
-                 {'notifications': notifications})
+                 {'notifications': notifications, 'unread_count': unread.count(request.user)})
 
 
 @login_required
@@ -463,23 +497,16 @@ def notification_detail(request, notif_id):
         if request.method == "POST":
             action = request.POST.get("action")
             if action == "marquer comme terminer":
-                demande.statut = "terminee"
-                demande.transporteur_confirme = True
-                demande.save()
-                messages.success(request, f"Demande #{demande.id} marquée comme terminée.")
+                if transitions.transition_or_warn(request, demande, 'livrer', transporteur_confirme=True):
+                    messages.success(request, f"Demande #{demande.id} marquée comme terminée.")
                 return redirect('transporteur_dashboard')
             elif action == "accepter":
-                demande.transporteur_confirme = True
-                demande.statut = "en_livraison"
-                demande.save()
-                messages.success(request, f"Vous avez accepté la mission pour demande #{demande.id}.")
+                if transitions.transition_or_warn(request, demande, 'accepter_mission'):
+                    messages.success(request, f"Vous avez accepté la mission pour demande #{demande.id}.")
                 return redirect('transporteur_dashboard')
             elif action == "refuser":
-                demande.transporteur_confirme = False
-                demande.transporteur_livraison = None
-                demande.statut = "validee"
-                demande.save()
-                messages.warning(request, f"Vous avez refusé la mission pour demande #{demande.id}.")
+                if transitions.transition_or_warn(request, demande, 'refuser_mission'):
+                    messages.warning(request, f"Vous avez refusé la mission pour demande #{demande.id}.")
                 return redirect('transporteur_dashboard')
 
         notif.lu = True
@@ -496,13 +523,11 @@ def notification_detail(request, notif_id):
             action = request.POST.get("action")
             action2 = request.POST.get('marquer comme terminer')
             if action == "accepter":
-                proposition.transporteur_statut = 'acceptee'
-                proposition.save()
-                messages.success(request, f"Proposition #{proposition.id} marquée comme acceptee.")
+                if transitions.transition_or_warn(request, proposition, 'accepter_mission'):
+                    messages.success(request, f"Proposition #{proposition.id} marquée comme acceptee.")
                 return redirect('transporteur_dashboard')
             if action2 == "marquer comme terminer":
-                proposition.statut = 'terminee'
-                proposition.save()
+                transitions.transition_or_warn(request, proposition, 'terminer')
                 return redirect('transporteur_dashboard')
         notif.lu = True
         notif.save()
@@ -528,26 +553,17 @@ def assign_transporteur_view(request, proposition_id):
         transporteur_id = request.POST.get("transporteur_id")
         if transporteur_id:
             transporteur = get_object_or_404(Transporteur, id=transporteur_id)
-            proposition.transporteur_assignee = transporteur
-            proposition.statut = "validee"
-            proposition.date_validation = timezone.now()
-            proposition.membre_validateur = request.user.membre
-            proposition.save()
-
-            # Create notification for transporteur
-            Notification.objects.create(
-                receiver=transporteur,
-                proposition=proposition,
-                titre=f"Nouvelle mission: Proposition #{proposition.id}",
-                message="Vous avez été assigné pour ramasser ce don.",
-                demande=None,
-            )
+            if not transitions.transition_or_warn(request, proposition, 'assigner', transporteur_assignee=transporteur,
+                                                  membre_validateur=request.user.membre):
+                return redirect('membre_dashboard')
+
+            notifications.notify([transporteur], 'mission_proposition', {'proposition': proposition})
 
             messages.success(request, f"Transporteur {transporteur} assigné à la proposition #{proposition.id}.")
             return redirect('membre_dashboard')
 
     # If GET request, show a form to choose transporteur
-    available_transporteurs = getAvailableTransporteurs()
+    available_transporteurs = getAvailableTransporteurs(proposition)
     return render(request, "donations/propositions/assign_transporteur.html", {
         "proposition": proposition,
         "transporteurs": available_transporteurs
@@ -567,13 +583,11 @@ def transporteur_reponse(request, proposition_id):
     if request.method == "POST":
         action = request.POST.get('action')
         if action == "accepter":
-            proposition.transporteur_statut = "acceptee"
-            proposition.save()
-            messages.success(request, f"Vous avez accepté la mission pour Proposition #{proposition.id}.")
+            if transitions.transition_or_warn(request, proposition, 'accepter_mission'):
+                messages.success(request, f"Vous avez accepté la mission pour Proposition #{proposition.id}.")
         elif action == "refuser":
-            proposition.transporteur_statut = "refusee"
-            proposition.save()
-            messages.warning(request, f"Vous avez refusé la mission pour Proposition #{proposition.id}.")
+            if transitions.transition_or_warn(request, proposition, 'refuser_mission'):
+                messages.warning(request, f"Vous avez refusé la mission pour Proposition #{proposition.id}.")
         else:
             messages.error(request, "Action non reconnue.")
 
@@ -591,10 +605,8 @@ def terminer_proposition(request, proposition_id):
         messages.error(request, "Vous n'êtes pas autorisé à terminer cette mission.")
         return redirect('transporteur_dashboard')
 
-    proposition.statut = "terminee"
-    proposition.save()
-
-    messages.success(request, f"Proposition #{proposition.id} marquée comme terminée.")
+    if transitions.transition_or_warn(request, proposition, 'terminer'):
+        messages.success(request, f"Proposition #{proposition.id} marquée comme terminée.")
     return redirect('transporteur_dashboard')
 
 
@@ -607,9 +619,7 @@ def marquer_demande_terminee_transporteur(request, demande_id):
         messages.error(request, "Vous n'êtes pas autorisé à terminer cette mission.")
         return redirect('transporteur_dashboard')
 
-    if demande.statut != 'terminee':
-        demande.statut = 'terminee'
-        demande.save()
+    if demande.statut != 'terminee' and transitions.transition_or_warn(request, demande, 'livrer'):
         messages.success(request, f"Demande #{demande.id} marquée comme terminée.")
 
     return redirect('transporteur_dashboard')
@@ -619,7 +629,7 @@ def marquer_demande_terminee_transporteur(request, demande_id):
 def demandes_de_recuperateur(request, user_id):
     """Show all donation requests for a specific participant."""
     participant_recurant = Participant.objects.get(id=user_id)
-    demandes = participant_recurant.demandes_dons.all()
+    demandes = DemandeDon.objects.for_participant(participant_recurant)
     return render(
         request,
         "donations/demandes/demandes_requperateur.html",
@@ -633,6 +643,17 @@ def demandeur_confirme_reception(request):
 
 
 # ============ API VIEWS ============
+@login_required
+def tournees_transporteur(request):
+    """API endpoint: the transporteur's tours for ?date=YYYY-MM-DD (default today)."""
+    if not hasattr(request.user, 'transporteur'):
+        return JsonResponse({"error": "Accès réservé aux transporteurs"}, status=403)
+    day = requested_day(request)
+    if day is None:
+        return JsonResponse({"error": "Date invalide (AAAA-MM-JJ)"}, status=400)
+    return JsonResponse(routes.plan_day(request.user.transporteur, day).as_dict())
+
+
 def get_user(request, user_id):
     """API endpoint to get user information."""
     try: